@@ -19,34 +19,134 @@ import { createContext, useContext, useEffect, useState } from "react";
 
 const AuthContext = createContext(null);
 
+const API = import.meta.env.VITE_API_URL || "http://127.0.0.1:8000";
+// Access tokens live 15 minutes on the server; swap them a bit before that
+const REFRESH_EVERY_MS = 10 * 60 * 1000;
+// A pair another tab rotated this recently is adopted instead of refreshed again
+const FRESH_PAIR_MS = 60 * 1000;
+
+// Refresh tokens are single-use, so only one refresh may be in flight: one
+// promise per tab (React StrictMode runs the mount effect twice), and a Web
+// Lock across tabs that share localStorage.
+let inflight = null;
+
+function withRefreshLock(fn) {
+  if (navigator.locks?.request) return navigator.locks.request("gg-auth-refresh", fn);
+  return fn();
+}
+
 // used ChatGPT to help generate the idea behind this logic
 // used last source above to help implement 
 export function AuthProvider({ children }) {
   const [token, setToken] = useState(null);
   const [userEmail, setUserEmail] = useState(null);
+  const [refreshToken, setRefreshToken] = useState(null);
 
   // Load from localStorage once on mount
   useEffect(() => {
     const t = localStorage.getItem("token");
     const e = localStorage.getItem("userEmail");
+    const r = localStorage.getItem("refreshToken");
     if (t) setToken(t);
     if (e) setUserEmail(e);
+    if (r) {
+      setRefreshToken(r);
+      refresh(); // the stored access token may have expired while the tab was closed
+    }
   }, []);
 
-  // Helper to set both state + localStorage
-  function setAuth({ token: t, userEmail: e }) {
+  // Another tab rotated the pair or logged out: follow it
+  useEffect(() => {
+    function onStorage(ev) {
+      if (ev.key !== null && !["token", "refreshToken", "userEmail"].includes(ev.key)) return;
+      const t = localStorage.getItem("token");
+      const r = localStorage.getItem("refreshToken");
+      if (!t && !r) {
+        setToken(null);
+        setUserEmail(null);
+        setRefreshToken(null);
+        return;
+      }
+      setToken(t);
+      setRefreshToken(r);
+      setUserEmail(localStorage.getItem("userEmail"));
+    }
+    window.addEventListener("storage", onStorage);
+    return () => window.removeEventListener("storage", onStorage);
+  }, []);
+
+  // Helper to set state + localStorage
+  function setAuth({ token: t, userEmail: e, refreshToken: r }) {
     setToken(t);
-    setUserEmail(e);
+    if (e) setUserEmail(e);
     if (t) localStorage.setItem("token", t);
     if (e) localStorage.setItem("userEmail", e);
+    if (r) {
+      setRefreshToken(r);
+      localStorage.setItem("refreshToken", r);
+    }
   }
 
-  // Helper to clear both
-  function logout() {
+  // Helper to clear everything
+  function clearAuth() {
     setToken(null);
     setUserEmail(null);
+    setRefreshToken(null);
     localStorage.removeItem("token");
     localStorage.removeItem("userEmail");
+    localStorage.removeItem("refreshToken");
+    localStorage.removeItem("tokenRefreshedAt");
+  }
+
+  // Trade the stored refresh token for a new pair (each refresh token works once)
+  function refresh() {
+    if (!inflight) {
+      inflight = withRefreshLock(async () => {
+        // Re-read inside the lock: another tab may have rotated it already
+        const current = localStorage.getItem("refreshToken");
+        if (!current) return;
+        const refreshedAt = Number(localStorage.getItem("tokenRefreshedAt") || 0);
+        if (Date.now() - refreshedAt < FRESH_PAIR_MS) {
+          setToken(localStorage.getItem("token"));
+          setRefreshToken(current);
+          return;
+        }
+        const res = await fetch(`${API}/api/auth/refresh`, {
+          method: "POST",
+          headers: { Authorization: `Bearer ${current}` },
+        }).catch(() => null);
+        if (!res) return; // offline: try again next tick
+        if (!res.ok) {
+          // Revoked or expired: log in again, unless someone already replaced it
+          if (localStorage.getItem("refreshToken") === current) clearAuth();
+          return;
+        }
+        const data = await res.json();
+        localStorage.setItem("tokenRefreshedAt", String(Date.now()));
+        setAuth({ token: data.access_token, refreshToken: data.refresh_token });
+      }).finally(() => {
+        inflight = null;
+      });
+    }
+    return inflight;
+  }
+
+  useEffect(() => {
+    if (!refreshToken) return;
+    const id = setInterval(refresh, REFRESH_EVERY_MS);
+    return () => clearInterval(id);
+  }, [refreshToken]);
+
+  // Revoke both tokens on the server, then forget them
+  function logout() {
+    if (token) {
+      fetch(`${API}/api/auth/logout`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", Authorization: `Bearer ${token}` },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      }).catch(() => {});
+    }
+    clearAuth();
   }
 
   return (
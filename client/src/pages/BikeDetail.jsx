@@ -87,7 +87,10 @@ export default function BikeDetail() {
   // --- Ownership & visibility logic for the action buttons/banner ---
   const isOwner = !!userEmail && bike.owner_email === userEmail;
   const expiresAt = bike.expires_at ? new Date(bike.expires_at) : null;
-  const isExpired = !!expiresAt && expiresAt < new Date();
+  // Paid listings always have expires_at; the expiry sweeper turns them
+  // inactive once it passes, so "inactive" alone doesn't mean draft.
+  const isDraft = !expiresAt;
+  const isExpired = !!expiresAt && (!bike.is_active || expiresAt < new Date());
 
   // Owner-only destructive action: Delete listing
   async function onDelete() {
@@ -137,7 +140,7 @@ export default function BikeDetail() {
         <div>
           <div style={{ fontWeight: 800, fontSize: 18 }}>{bike.title}</div>
           <div style={{ fontSize: 13, color: "var(--ui-subtle)" }}>
-            {bike.is_active ? (
+            {!isDraft ? (
               isExpired ? (
                 <>Status: <strong>Expired</strong> — renew to make it visible again.</>
               ) : (
@@ -160,8 +163,8 @@ export default function BikeDetail() {
               <button className="ui-btn ui-btn--md" data-variant="outline">Edit</button>
             </Link>
 
-            {/* Draft → Pay; Active → Renew */}
-            {!bike.is_active ? (
+            {/* Draft → Pay; Active/Expired → Renew */}
+            {isDraft ? (
               <Link to={`/pay/${bike.id}`}>
                 <button className="ui-btn ui-btn--md" data-variant="brand">Pay $10 to Post</button>
               </Link>
@@ -193,7 +196,7 @@ export default function BikeDetail() {
           <div className="img-frame img-frame--detail" style={{ position: "relative" }}>
             <img
               key={idx}
-              src={fullUrl(photos[idx])}
+              src={`${fullUrl(photos[idx])}?w=1600`}
               alt={`${bike.title} photo ${idx + 1} of ${photos.length}`}
               className="img-fit" // NOTE: see index.css for object-fit + max sizing
             />
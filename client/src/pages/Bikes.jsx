@@ -9,28 +9,58 @@ function fullUrl(u) {
   return /^https?:\/\//i.test(u) ? u : `${API}${u}`;
 }
 
+// Facets the server can filter/count on (see list_bikes in server/app/routes.py)
+const FACETS = [
+  ["bike_type", "Type"],
+  ["wheel_size", "Wheels"],
+  ["size", "Size"],
+  ["frame_material", "Frame"],
+  ["condition", "Condition"],
+];
+
 export default function Bikes() {
   const { userEmail } = useAuth();
   const [bikes, setBikes] = useState([]);
   const [loading, setLoading] = useState(true);
   const [err, setErr] = useState("");
   const [stateFilter, setStateFilter] = useState("");
+  const [search, setSearch] = useState("");             // full-text ?q= (title, brand, parts, description)
+  const [nextCursor, setNextCursor] = useState(null);   // opaque cursor for the next page (null = no more)
+  const [picked, setPicked] = useState({});             // { bike_type: "MTB", ... } selected facet values
+  const [ranges, setRanges] = useState({ min_price: "", max_price: "", height: "" });
+  const [near, setNear] = useState({ near: "", radius: "25" });   // ?near=<zip>&radius=<miles>
+  const [facets, setFacets] = useState(null);           // server-side counts for the sidebar
+  const [loadingMore, setLoadingMore] = useState(false);
 
-  async function loadBikes(stateArg = "") {
+  // Fetch a page of bikes. Without a cursor this replaces the list; with one it appends.
+  async function loadBikes(stateArg = "", cursor = null, pickedArg = picked) {
     try {
       setErr("");
-      setLoading(true);
+      cursor ? setLoadingMore(true) : setLoading(true);
       const url = new URL(`${API}/api/bikes`);
       const s = (stateArg || stateFilter || "").trim().toUpperCase().slice(0, 2);
       if (s) url.searchParams.set("state", s);
+      if (search.trim()) url.searchParams.set("q", search.trim());
+      for (const [key, value] of Object.entries(pickedArg)) if (value) url.searchParams.set(key, value);
+      for (const [key, value] of Object.entries(ranges)) if (String(value).trim()) url.searchParams.set(key, value);
+      if (near.near.trim()) {
+        url.searchParams.set("near", near.near.trim());
+        url.searchParams.set("radius", near.radius || "25");
+      }
+      if (cursor) url.searchParams.set("cursor", cursor);
+      else url.searchParams.set("facets", "1");   // counts only needed for the first page
       const res = await fetch(url.toString());
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Failed to load bikes");
-      setBikes(data);
+      const page = data.results || [];
+      setBikes((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(data.next_cursor || null);
+      if (data.facets) setFacets(data.facets);
     } catch (e) {
       setErr(e.message);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   }
 
@@ -51,6 +81,16 @@ export default function Bikes() {
         className="card"
         style={{ marginBottom: 12, display: "flex", gap: 10, alignItems: "center", flexWrap: "wrap" }}
       >
+        <label style={{ display: "flex", gap: 6, alignItems: "center", margin: 0 }}>
+          <span style={{ fontSize: 13, color: "var(--muted)" }}>Search</span>
+          <input
+            name="search"
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+            placeholder="e.g., Shimano XT"
+            style={{ width: 200 }}
+          />
+        </label>
         <label style={{ display: "flex", gap: 6, alignItems: "center", margin: 0 }}>
           <span style={{ fontSize: 13, color: "var(--muted)" }}>Filter by state</span>
           <input
@@ -62,6 +102,53 @@ export default function Bikes() {
             style={{ width: 90 }}
           />
         </label>
+        {FACETS.map(([key, label]) => (
+          <label key={key} style={{ display: "flex", gap: 6, alignItems: "center", margin: 0 }}>
+            <span style={{ fontSize: 13, color: "var(--muted)" }}>{label}</span>
+            <select
+              value={picked[key] || ""}
+              onChange={(e) => {
+                const next = { ...picked, [key]: e.target.value };
+                setPicked(next);
+                loadBikes("", null, next);
+              }}
+            >
+              <option value="">Any</option>
+              {(facets?.[key] || []).map((f) => (
+                <option key={f.value} value={f.value}>{f.value} ({f.count})</option>
+              ))}
+            </select>
+          </label>
+        ))}
+        {[["min_price", "Min $"], ["max_price", "Max $"], ["height", "Your height (in)"]].map(([key, label]) => (
+          <label key={key} style={{ display: "flex", gap: 6, alignItems: "center", margin: 0 }}>
+            <span style={{ fontSize: 13, color: "var(--muted)" }}>{label}</span>
+            <input
+              type="number"
+              value={ranges[key]}
+              onChange={(e) => setRanges({ ...ranges, [key]: e.target.value })}
+              style={{ width: 80 }}
+            />
+          </label>
+        ))}
+        <label style={{ display: "flex", gap: 6, alignItems: "center", margin: 0 }}>
+          <span style={{ fontSize: 13, color: "var(--muted)" }}>Within</span>
+          <input
+            type="number"
+            value={near.radius}
+            onChange={(e) => setNear({ ...near, radius: e.target.value })}
+            style={{ width: 60 }}
+          />
+          <span style={{ fontSize: 13, color: "var(--muted)" }}>mi of ZIP</span>
+          <input
+            name="near"
+            value={near.near}
+            onChange={(e) => setNear({ ...near, near: e.target.value })}
+            maxLength={5}
+            placeholder="e.g., 07030"
+            style={{ width: 80 }}
+          />
+        </label>
         <button type="submit">Apply</button>
         {stateFilter && (
           <button
@@ -99,13 +186,15 @@ export default function Bikes() {
               {/* thumbnail */}
               {Array.isArray(b.photos) && b.photos[0] && (
                 <div className="img-frame" style={{ margin: "8px 0" }}>
+                  {/* server returns downscaled WebP variants for ?w= (320/768/1600) */}
                   <img
-                    src={fullUrl(b.photos[0])}
+                    src={`${fullUrl(b.photos[0])}?w=768`}
                     alt={b.title}
                     className="img-fit"
                     loading="lazy"
                     srcSet={`
-                      ${fullUrl(b.photos[0])} 600w
+                      ${fullUrl(b.photos[0])}?w=320 320w,
+                      ${fullUrl(b.photos[0])}?w=768 768w
                     `}
                     sizes="(max-width: 600px) 100vw, 33vw"
                   />
@@ -119,6 +208,7 @@ export default function Bikes() {
                 {b.size && <li><strong>Size:</strong> {b.size}</li>}
                 {b.state && <li><strong>State:</strong> {b.state}</li>}
                 {b.zip && <li><strong>ZIP:</strong> {b.zip}</li>}
+                {typeof b.distance_mi === "number" && <li><strong>Distance:</strong> {b.distance_mi} mi</li>}
               </ul>
 
               {b.owner_email && (
@@ -130,6 +220,14 @@ export default function Bikes() {
           ))}
         </div>
       )}
+
+      {!loading && nextCursor && (
+        <div style={{ display: "flex", justifyContent: "center", marginTop: 12 }}>
+          <button type="button" disabled={loadingMore} onClick={() => loadBikes("", nextCursor)}>
+            {loadingMore ? "Loading…" : "Load more"}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
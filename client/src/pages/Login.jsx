@@ -44,7 +44,7 @@ export default function Login() {
 
       // On success, stash token + email in AuthContext.
       // This also saves to localStorage (inside AuthContext) so refresh persists.
-      setAuth({ token: data.access_token, userEmail: data.user.email });
+      setAuth({ token: data.access_token, refreshToken: data.refresh_token, userEmail: data.user.email });
 
       // Navigate home; Navbar reacts immediately because context changed.
       nav("/");
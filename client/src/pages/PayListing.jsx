@@ -67,9 +67,10 @@ export default function PayListing() {
   if (!bike) return <div className="card">Loading…</div>;
 
   const isOwner = bike.owner_email && userEmail && bike.owner_email === userEmail;
-  const isDraft = !bike.is_active;
   const expiresAt = bike.expires_at ? new Date(bike.expires_at) : null;
-  const isExpired = expiresAt ? expiresAt < new Date() : false;
+  // Never paid = draft; a paid listing past expires_at (or swept inactive) is expired
+  const isDraft = !expiresAt;
+  const isExpired = !!expiresAt && (!bike.is_active || expiresAt < new Date());
 
   return (
     <div className="card" style={{ display: "grid", gap: 12 }}>
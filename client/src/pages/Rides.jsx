@@ -3,7 +3,8 @@
 // and (for ride owners) peek at the attendee list.
 //
 // Key ideas:
-// - Fetch rides from /api/rides (optionally filtered by ?state=XX)
+// - Fetch upcoming rides from /api/rides (optionally filtered by ?state=XX),
+//   one page at a time ("Load more" follows next_cursor)
 // - Show "RSVP / Un-RSVP" which hits POST /api/rides/:id/rsvp (toggle)
 // - If you're the ride owner, you can expand an attendee list panel
 // - Uses UiKit components for consistent styling
@@ -23,27 +24,34 @@ export default function Rides() {
   const [loading, setLoading] = useState(true);    // spinner flag
   const [err, setErr] = useState("");              // human-friendly error
   const [stateFilter, setStateFilter] = useState("");// 2-letter state filter
+  const [nextCursor, setNextCursor] = useState(null); // opaque cursor for the next page (null = no more)
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Fetch rides from the server, optionally applying a state filter.
-  async function loadRides(stateArg = "") {
+  // Without a cursor this replaces the list; with one it appends.
+  async function loadRides(stateArg = "", cursor = null) {
     try {
       setErr("");
-      setLoading(true);
+      cursor ? setLoadingMore(true) : setLoading(true);
 
       const url = new URL(`${API}/api/rides`);
       // Prefer incoming arg, otherwise the controlled input; normalize to 2-letter uppercase
       const s = (stateArg || stateFilter || "").trim().toUpperCase().slice(0, 2);
       if (s) url.searchParams.set("state", s);
+      if (cursor) url.searchParams.set("cursor", cursor);
 
       const res = await fetch(url.toString());
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Failed to load rides");
 
-      setRides(data);
+      const page = data.results || [];
+      setRides((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(data.next_cursor || null);
     } catch (e) {
       setErr(e.message);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   }
 
@@ -64,6 +72,7 @@ export default function Rides() {
 
       // Re-fetch rides so attendee counts update without a manual refresh.
       await loadRides();
+      if (data.status === "waitlisted") setErr("This ride is full — you're on the waitlist and will get the next open seat.");
     } catch (e) {
       setErr(e.message);
     }
@@ -129,7 +138,12 @@ export default function Rides() {
                 <CardHeader
                   overline={r.state || "Ride"}
                   title={r.title}
-                  aside={<Badge tone="brand">{r.attendee_count ?? 0} attending</Badge>}
+                  aside={
+                    <Badge tone="brand">
+                      {r.attendee_count ?? 0}{r.capacity ? ` / ${r.capacity}` : ""} attending
+                      {r.waitlist_count ? ` · ${r.waitlist_count} waitlisted` : ""}
+                    </Badge>
+                  }
                 />
                 <CardContent>
                   {/* Simple metadata list */}
@@ -151,6 +165,14 @@ export default function Rides() {
             ))}
           </div>
         )}
+
+        {!loading && nextCursor && (
+          <div style={{ display: "flex", justifyContent: "center", marginTop: 16 }}>
+            <Button type="button" disabled={loadingMore} onClick={() => loadRides("", nextCursor)}>
+              {loadingMore ? "Loading…" : "Load more"}
+            </Button>
+          </div>
+        )}
       </Section>
     </>
   );
@@ -164,6 +186,7 @@ function OwnerAttendeesBadge({ rideId, token }) {
   const [open, setOpen] = useState2(false);     // whether the sub-card is shown
   const [loading, setLoading] = useState2(false);
   const [list, setList] = useState2([]);        // attendee emails
+  const [waitlist, setWaitlist] = useState2([]); // waitlisted emails, first in line first
 
   async function load() {
     try {
@@ -175,6 +198,7 @@ function OwnerAttendeesBadge({ rideId, token }) {
       // Backend only returns `attendees` array if you're the owner; handle both cases.
       if (res.ok && Array.isArray(data.attendees)) setList(data.attendees);
       else setList([]);
+      setWaitlist(res.ok && Array.isArray(data.waitlist) ? data.waitlist : []);
     } finally {
       setLoading(false);
     }
@@ -199,6 +223,14 @@ function OwnerAttendeesBadge({ rideId, token }) {
                 </ul>
               )
             )}
+            {!loading && waitlist.length > 0 && (
+              <>
+                <div style={{ marginTop: 8, fontSize: 13, color: "var(--muted)" }}>Waitlist</div>
+                <ol style={{ margin: 0, paddingLeft: 18 }}>
+                  {waitlist.map(a => (<li key={a.id}>{a.email}</li>))}
+                </ol>
+              </>
+            )}
           </CardContent>
         </Card>
       )}
@@ -16,7 +16,7 @@ export default function RidesNew() {
   const [form, setForm] = useState({
     title: "", date: "", time: "",
     difficulty: "", terrain: "",
-    state: "", zip_prefix: "", description: "",
+    state: "", zip_prefix: "", capacity: "", description: "",
   });
 
   function onChange(e) {
@@ -39,6 +39,7 @@ export default function RidesNew() {
           ...form,
           state: form.state?.toUpperCase().slice(0, 2) || undefined,
           zip_prefix: form.zip_prefix?.slice(0, 3) || undefined,
+          capacity: form.capacity ? Number(form.capacity) : undefined,
         }),
       });
       const data = await res.json().catch(() => ({}));
@@ -70,6 +71,7 @@ export default function RidesNew() {
             <Field label="State (2 letters)"><Input name="state" value={form.state} onChange={onChange} maxLength={2} placeholder="e.g., CO" /></Field>
 
             <Field label="ZIP prefix (3 digits)"><Input name="zip_prefix" value={form.zip_prefix} onChange={onChange} maxLength={3} placeholder="e.g., 803" /></Field>
+            <Field label="Max riders (optional)"><Input type="number" min={1} name="capacity" value={form.capacity} onChange={onChange} placeholder="No limit" /></Field>
 
             <Field label="Description">
               <Textarea name="description" value={form.description} onChange={onChange} rows={3} placeholder="Pace, distance, meetup details…" />
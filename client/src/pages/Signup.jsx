@@ -28,7 +28,7 @@ export default function Signup() {
       // store token + email
       localStorage.setItem("token", data.access_token);
       localStorage.setItem("userEmail", data.user.email);
-      setAuth({ token: data.access_token, userEmail: data.user.email });
+      setAuth({ token: data.access_token, refreshToken: data.refresh_token, userEmail: data.user.email });
       nav("/"); // go home
     } catch (e) {
       setErr(e.message);
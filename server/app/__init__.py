@@ -1,4 +1,5 @@
 # server/app/__init__.py
+from datetime import timedelta
 from pathlib import Path
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -37,6 +38,16 @@ def create_app():
 
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # SQLite file: WAL + pragmas on every connection and a sized pool
+    # (see sqlite_profile.py; SQLITE_TUNING=0 = stock settings).
+    from .sqlite_profile import DEFAULTS as SQLITE_DEFAULTS, engine_options, is_file_sqlite
+    for key, default in SQLITE_DEFAULTS.items():
+        app.config[key] = int(os.getenv(key, str(default)))
+    app.config["SQLITE_TUNING"] = os.getenv("SQLITE_TUNING", "1") != "0"
+    sqlite_tuned = app.config["SQLITE_TUNING"] and is_file_sqlite(app.config["SQLALCHEMY_DATABASE_URI"])
+    if sqlite_tuned:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+
     # -------------------------------------------------------------------------
     # UPLOADS CONFIG (PERSISTENT DISK FRIENDLY)
     # -------------------------------------------------------------------------
@@ -53,6 +64,16 @@ def create_app():
     UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
     app.config["UPLOAD_DIR"] = str(UPLOAD_DIR)
 
+    # Processes used to build resized WebP variants (0 = build inline)
+    app.config["IMAGE_WORKERS"] = int(os.getenv("IMAGE_WORKERS", "2"))
+
+    # Reject oversized bodies from the Content-Length header, before Werkzeug
+    # reads them (5MB file cap + a little room for multipart framing), and
+    # stream upload file parts to disk as they arrive.
+    from .uploads import MAX_BYTES, UploadRequest
+    app.config["MAX_CONTENT_LENGTH"] = MAX_BYTES + 64 * 1024
+    app.request_class = UploadRequest
+
     # -------------------------------------------------------------------------
     # CORS (LOCAL + PROD)
     # -------------------------------------------------------------------------
@@ -83,7 +104,90 @@ def create_app():
     # JWT
     # -------------------------------------------------------------------------
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "dev-insecure-change-me")
-    JWTManager(app)
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_MINUTES", "15")))
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=int(os.getenv("REFRESH_TOKEN_DAYS", "30")))
+    jwt = JWTManager(app)
+
+    # Revoked tokens (logout, used refresh tokens) are mirrored in memory and
+    # re-synced from the DB at most every REVOCATION_SYNC_INTERVAL seconds.
+    app.config["REVOCATION_SYNC_INTERVAL"] = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+    from .revocation import init_revocation
+    init_revocation(app, jwt)
+
+    # Per-process cache of the caller's user/profile rows (seconds; 0 = per request only)
+    app.config["IDENTITY_CACHE_TTL"] = int(os.getenv("IDENTITY_CACHE_TTL", "30"))
+    app.config["IDENTITY_CACHE_MAX_ENTRIES"] = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "4096"))
+    from .identity import init_identity
+    init_identity(app)
+
+    # -------------------------------------------------------------------------
+    # PASSWORD HASHING + AUTH ADMISSION CONTROL (see passwords.py)
+    # -------------------------------------------------------------------------
+    # Any werkzeug method string; stored hashes are upgraded on the next login.
+    app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # 0 = inline
+    app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+    # "<attempts>/<seconds>" per client IP / per email on login + signup; "0" = off
+    app.config["AUTH_RATE_PER_IP"] = os.getenv("AUTH_RATE_PER_IP", "30/60")
+    app.config["AUTH_RATE_PER_EMAIL"] = os.getenv("AUTH_RATE_PER_EMAIL", "10/300")
+    from .passwords import init_passwords
+    init_passwords(app)
+
+    # Behind a load balancer (e.g. Render), trust this many X-Forwarded-For
+    # hops so request.remote_addr is the client, not the proxy.
+    proxy_hops = int(os.getenv("PROXY_FIX_X_FOR", "0"))
+    if proxy_hops:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+
+    # -------------------------------------------------------------------------
+    # RESPONSE CACHE (public listing endpoints)
+    # -------------------------------------------------------------------------
+    # RESPONSE_CACHE_TTL=0 disables caching entirely.
+    app.config["RESPONSE_CACHE_TTL"] = int(os.getenv("RESPONSE_CACHE_TTL", "30"))
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"] = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    from .cache import init_response_cache
+    init_response_cache(app)
+
+    # -------------------------------------------------------------------------
+    # STRIPE (one pooled, keep-alive HTTP client per process)
+    # -------------------------------------------------------------------------
+    app.config["STRIPE_SECRET_KEY"] = os.getenv("STRIPE_SECRET_KEY")
+    app.config["STRIPE_HTTP_POOL_SIZE"] = int(os.getenv("STRIPE_HTTP_POOL_SIZE", "10"))
+    app.config["STRIPE_HTTP_TIMEOUT"] = float(os.getenv("STRIPE_HTTP_TIMEOUT", "30"))
+    app.config["STRIPE_MAX_RETRIES"] = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+    # Lifetime of a Checkout Session (Stripe allows 1800-86400 s); until then
+    # repeated "Pay" clicks for the same bike reuse it.
+    app.config["CHECKOUT_SESSION_TTL"] = int(os.getenv("CHECKOUT_SESSION_TTL", "1800"))
+    from .stripe_client import init_stripe
+    init_stripe(app)
+
+    # -------------------------------------------------------------------------
+    # ADMIN + MAIL (renewal reminders)
+    # -------------------------------------------------------------------------
+    # ADMIN_TOKEN unlocks /api/admin/* (sent as X-Admin-Token); unset = disabled.
+    # MAIL_TRANSPORT: "console" (print) or "file" (JSON lines in MAIL_OUTBOX_PATH).
+    app.config["ADMIN_TOKEN"] = os.getenv("ADMIN_TOKEN")
+    app.config["MAIL_TRANSPORT"] = os.getenv("MAIL_TRANSPORT", "console")
+    app.config["MAIL_OUTBOX_PATH"] = os.getenv("MAIL_OUTBOX_PATH", str(BASE_DIR / "outbox.jsonl"))
+    app.config["MAIL_WORKERS"] = int(os.getenv("MAIL_WORKERS", "4"))
+    app.config["MAIL_MAX_IN_FLIGHT"] = int(os.getenv("MAIL_MAX_IN_FLIGHT", "16"))
+
+    # In-process sweeper that deactivates expired listings (seconds; 0 = off,
+    # e.g. when a cron runs `python -m server.app.expiry` instead). Started by
+    # start_background_workers() from the serving entry points only.
+    app.config["EXPIRY_SWEEP_INTERVAL"] = int(os.getenv("EXPIRY_SWEEP_INTERVAL", "300"))
+
+    # Stripe webhooks are queued in the DB and applied by worker threads
+    # (0 = apply inline, inside the webhook request). See webhook_queue.py;
+    # the threads are started by start_background_workers().
+    app.config["WEBHOOK_WORKERS"] = int(os.getenv("WEBHOOK_WORKERS", "2"))
+    app.config["WEBHOOK_BATCH_SIZE"] = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+    app.config["WEBHOOK_POLL_INTERVAL"] = float(os.getenv("WEBHOOK_POLL_INTERVAL", "1"))
+    app.config["WEBHOOK_MAX_ATTEMPTS"] = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+    app.config["WEBHOOK_VISIBILITY_TIMEOUT"] = int(os.getenv("WEBHOOK_VISIBILITY_TIMEOUT", "60"))
+    # Seconds before a failed job is retried, doubled on each further failure
+    app.config["WEBHOOK_RETRY_BACKOFF"] = float(os.getenv("WEBHOOK_RETRY_BACKOFF", "10"))
 
     # -------------------------------------------------------------------------
     # DB + BLUEPRINTS
@@ -91,9 +195,22 @@ def create_app():
     db.init_app(app)
 
     with app.app_context():
+        if sqlite_tuned:
+            from .sqlite_profile import install_pragmas
+            install_pragmas(db.engine, app.config)
+
         from . import models
+        from . import search  # registers the full-text index DDL on the bike table
         db.create_all()
 
+        # create_all() skips tables that already exist, so add newer columns/indexes
+        from .schema import upgrade_schema
+        upgrade_schema()
+        search.ensure_search_index()
+
+        models.Ride.sync_attendee_counts()
+        models.Ride.sync_start_times()
+
         from .routes import api_bp
         app.register_blueprint(api_bp, url_prefix="/api")
 
@@ -106,4 +223,25 @@ def create_app():
         from .auth import auth_bp
         app.register_blueprint(auth_bp, url_prefix="/api/auth")
 
+        from .notifications import notifications_bp
+        app.register_blueprint(notifications_bp, url_prefix="/api")
+
+        from .expiry import expiry_bp
+        app.register_blueprint(expiry_bp, url_prefix="/api")
+
+        from .webhook_queue import webhook_queue_bp
+        app.register_blueprint(webhook_queue_bp, url_prefix="/api")
+
     return app
+
+
+def start_background_workers(app):
+    """
+    Start the in-process background threads (expiry sweeper, webhook
+    workers). Only the serving entry points (wsgi.py, run.py) call this, so
+    CLI jobs, scripts and tests that build an app don't spawn threads.
+    """
+    from .expiry import start_expiry_sweeper
+    from .webhook_queue import start_webhook_workers
+    start_expiry_sweeper(app)
+    start_webhook_workers(app)
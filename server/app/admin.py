@@ -0,0 +1,20 @@
+# server/app/admin.py
+# Guard for operator-only endpoints (cron hooks, maintenance jobs).
+# Callers send the shared secret from ADMIN_TOKEN in an X-Admin-Token header.
+# If ADMIN_TOKEN is not configured, admin endpoints are disabled entirely.
+import hmac
+from functools import wraps
+from flask import current_app, request, jsonify
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config.get("ADMIN_TOKEN")
+        if not expected:
+            return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN not set)"}), 403
+        supplied = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(supplied.encode(), expected.encode()):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
@@ -1,12 +1,41 @@
+import math
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
-    create_access_token, jwt_required, get_jwt_identity
+    create_access_token, create_refresh_token, decode_token, get_jwt, jwt_required
 )
+from sqlalchemy import update
 from .models import User
+from .passwords import HashingBusy, admit, hasher
+from .identity import current_user, current_user_id, token_claims
+from .revocation import revoke_token
 from . import db
 
 auth_bp = Blueprint("auth", __name__)
 
+
+def _retry_later(error: str, status: int, seconds: float):
+    resp = jsonify({"error": error})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(max(1, math.ceil(seconds)))
+    return resp
+
+
+def _token_pair(user_id: int, claims: dict) -> dict:
+    """A short-lived access token plus a single-use refresh token."""
+    return {
+        "access_token": create_access_token(identity=str(user_id), additional_claims=claims),
+        "refresh_token": create_refresh_token(identity=str(user_id), additional_claims=claims),
+    }
+
+
+def _throttled(email: str):
+    """429 response if this IP or email is out of attempts, else None (see passwords.py)."""
+    wait = admit(request.remote_addr, email)
+    if wait:
+        return _retry_later("too many attempts, try again later", 429, wait)
+    return None
+
+
 @auth_bp.post("/signup")
 def signup():
     # Parse JSON body (or use empty dict if none sent)
@@ -20,23 +49,30 @@ def signup():
     if not email or not password:
         return jsonify({"error": "email and password are required"}), 400
 
+    throttled = _throttled(email)
+    if throttled:
+        return throttled
+
     # Uniqueness check: prevent duplicate registrations by email
     if User.query.filter_by(email=email).first():
         return jsonify({"error": "email already registered"}), 400
 
-    # Create the user record and hash the password
+    # Create the user record; the salted hash is computed on the hashing pool
     u = User(email=email)
-    u.set_password(password)  # typically uses a salted hash (e.g., werkzeug.security)
+    try:
+        u.password_hash = hasher().hash(password)
+    except HashingBusy:
+        return _retry_later("server busy, try again", 503, 1)
 
     # Persist the new user to the database
     db.session.add(u)
     db.session.commit()
 
-    # Create a JWT access token; identity is the user's id (as string)
-    token = create_access_token(identity=str(u.id))
+    # Create the JWTs; identity is the user's id (as string)
+    tokens = _token_pair(u.id, token_claims(u))
 
-    # Return the token and a safe user representation
-    return jsonify({"access_token": token, "user": u.to_dict()}), 201
+    # Return the tokens and a safe user representation
+    return jsonify({**tokens, "user": u.to_dict()}), 201
 
 
 @auth_bp.post("/login")
@@ -44,16 +80,73 @@ def login():
     data = request.get_json() or {}
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
+    throttled = _throttled(email)
+    if throttled:
+        return throttled
+
     u = User.query.filter_by(email=email).first()
-    if not u or not u.check_password(password):
-        return jsonify({"error": "invalid credentials"}), 401
+    try:
+        if not u or not hasher().verify(u.password_hash, password):
+            return jsonify({"error": "invalid credentials"}), 401
+    except HashingBusy:
+        return _retry_later("server busy, try again", 503, 1)
+
+    # Upgrade to the configured method/cost while we have the plaintext.
+    # Compare-and-set, so a concurrent password change wins.
+    try:
+        upgraded = hasher().hash(password) if hasher().needs_rehash(u.password_hash) else None
+    except HashingBusy:
+        upgraded = None  # next login will try again
+    if upgraded:
+        db.session.execute(
+            update(User)
+            .where(User.id == u.id, User.password_hash == u.password_hash)
+            .values(password_hash=upgraded),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+
+    return jsonify({**_token_pair(u.id, token_claims(u)), "user": u.to_dict()})
+
 
-    token = create_access_token(identity=str(u.id))
-    return jsonify({"access_token": token, "user": u.to_dict()})
+@auth_bp.post("/refresh")
+@jwt_required(refresh=True)
+def refresh():
+    """
+    Trade a refresh token for a new access + refresh pair. The presented
+    refresh token is revoked first, so it can't be used again (rotation).
+    """
+    user = current_user()
+    if user is None:
+        return jsonify({"error": "user not found"}), 401
+    if not revoke_token(get_jwt()):
+        # A concurrent refresh already spent this token
+        return jsonify({"error": "refresh token already used"}), 401
+    return jsonify(_token_pair(user["id"], {"email": user["email"]}))
+
+
+@auth_bp.post("/logout")
+@jwt_required()
+def logout():
+    """
+    Revoke the access token in the Authorization header and, if given, the
+    refresh token in the body ({"refresh_token": ...}).
+    """
+    revoke_token(get_jwt())
+    refresh_token = (request.get_json(silent=True) or {}).get("refresh_token")
+    if refresh_token:
+        try:
+            payload = decode_token(refresh_token)
+        except Exception:
+            payload = None  # expired, malformed or already revoked: nothing to do
+        if payload and payload.get("type") == "refresh" and payload.get("sub") == str(current_user_id()):
+            revoke_token(payload)
+    return jsonify({"ok": True})
 
 @auth_bp.get("/me")
 @jwt_required()
 def me():
-    user_id = get_jwt_identity()
-    u = db.session.get(User, int(user_id))
-    return jsonify({"user": u.to_dict()})
+    user = current_user()  # request/process cached, see identity.py
+    if user is None:
+        return jsonify({"error": "user not found"}), 404
+    return jsonify({"user": user})
@@ -0,0 +1,184 @@
+# server/app/cache.py
+# In-process response cache for the anonymous, read-heavy listing endpoints.
+#
+# - Entries are keyed by namespace + path + sorted query args, so
+#   /api/bikes?state=NJ and /api/bikes?state=CO are cached separately.
+# - Invalidation is per namespace ("bikes", "rides"): each namespace has a
+#   generation counter that is part of every key. Bumping it orphans all old
+#   entries at once (they age out via TTL/LRU) without scanning the store.
+# - The store sits behind CacheBackend so a shared cache (Redis, memcached)
+#   can be dropped in later. With the default in-memory backend every gunicorn
+#   worker keeps its own copy, so the TTL bounds cross-worker staleness.
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request, Response
+from werkzeug.http import parse_date
+from .conditional import client_is_current
+
+DEFAULT_TTL_SECONDS = 30
+DEFAULT_MAX_ENTRIES = 1024
+
+# Validator headers (set by @conditional) stored with the body and replayed on a hit
+REPLAYED_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+class CacheBackend(ABC):
+    """Interface a response-cache store must implement."""
+
+    @abstractmethod
+    def get(self, key):
+        """Return the stored value, or None when missing/expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl):
+        """Store value for ttl seconds."""
+
+    @abstractmethod
+    def incr(self, key):
+        """Atomically increment an integer counter (no TTL) and return it."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drop a stored value (no-op when missing)."""
+
+
+class MemoryTTLCache(CacheBackend):
+    """Thread-safe LRU dict with per-entry expiry. Counters live outside the LRU."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # key -> (expires_at_monotonic, value)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)  # mark as recently used
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)  # evict least recently used
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """Caches (body, status, mimetype) for GET views and tracks hit/miss counts."""
+
+    def __init__(self, backend: CacheBackend, ttl=DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, namespace):
+        gen = self.backend.get(f"gen:{namespace}") or 0
+        args = urlencode(sorted(request.args.items(multi=True)))
+        return f"resp:{namespace}:{gen}:{request.path}?{args}"
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, *namespaces):
+        for ns in namespaces:
+            self.backend.incr(f"gen:{ns}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def init_response_cache(app):
+    """Attach a ResponseCache to the app (config: RESPONSE_CACHE_TTL / _MAX_ENTRIES)."""
+    backend = MemoryTTLCache(max_entries=app.config["RESPONSE_CACHE_MAX_ENTRIES"])
+    app.extensions["response_cache"] = ResponseCache(backend, ttl=app.config["RESPONSE_CACHE_TTL"])
+
+
+def _get_cache():
+    cache = current_app.extensions.get("response_cache")
+    return cache if cache and cache.ttl > 0 else None
+
+
+def _replay(body, status, mimetype, headers):
+    """A stored response, or a 304 when the client already holds its ETag / Last-Modified."""
+    etag = headers.get("ETag")
+    if etag and client_is_current(etag, parse_date(headers.get("Last-Modified"))):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, status=status, mimetype=mimetype)
+    resp.headers.update(headers)
+    return resp
+
+
+def cached(namespace):
+    """
+    Decorator for public GET views. Serves a stored copy of a 200 response
+    (with its validator headers) when available; otherwise runs the view and
+    stores its body.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = _get_cache()
+            if cache is None:
+                return view(*args, **kwargs)
+
+            key = cache._key(namespace)
+            hit = cache.backend.get(key)
+            if hit is not None:
+                cache._count(True)
+                return _replay(*hit)
+
+            cache._count(False)
+            resp = current_app.make_response(view(*args, **kwargs))
+            if resp.status_code == 200:
+                headers = {h: resp.headers[h] for h in REPLAYED_HEADERS if h in resp.headers}
+                cache.backend.set(key, (resp.get_data(), resp.status_code, resp.mimetype, headers), cache.ttl)
+            return resp
+        return wrapper
+    return decorator
+
+
+def invalidate(*namespaces):
+    """Drop every cached response in the given namespaces (call after commit)."""
+    cache = current_app.extensions.get("response_cache")
+    if cache:
+        cache.invalidate(*namespaces)
@@ -0,0 +1,73 @@
+# server/app/conditional.py
+# Conditional GET (ETag / If-None-Match, Last-Modified / If-Modified-Since).
+#
+# Each decorated view gets a *validator*: a cheap function that answers
+# "what version of this resource is current?" with one aggregate or PK query
+# (e.g. max(updated_at) + count for a list filter) instead of loading and
+# serializing rows. If the client already holds that version we reply
+# 304 Not Modified with no body; otherwise the view runs as usual and the
+# response is stamped with the validator so the next poll can revalidate.
+# Under @cached (cache.py), a cache hit replays the stored validator headers
+# and revalidates against them, so the validator query only runs on a miss.
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, Response
+
+
+def _etag_for(parts):
+    """Weak ETag derived from the request URL and the validator parts."""
+    raw = "|".join([request.full_path] + [str(p) for p in parts])
+    return 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def _as_utc(dt):
+    """DB timestamps are naive UTC; HTTP dates are aware. Normalize for comparing."""
+    if dt is None:
+        return None
+    dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return dt.replace(microsecond=0)
+
+
+def client_is_current(etag, last_modified):
+    """True if the request's If-None-Match / If-Modified-Since already covers this version."""
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag.removeprefix("W/").strip('"'))
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validator):
+    """
+    Decorator for GET views. validator(*view_args) returns either None (let the
+    view handle it, e.g. a 404) or (parts, last_modified) where parts is a tuple
+    of values that change whenever the response body would change.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            v = validator(*args, **kwargs)
+            if v is None:
+                return view(*args, **kwargs)
+
+            parts, last_modified = v
+            etag = _etag_for(parts)
+            last_modified = _as_utc(last_modified)
+
+            if client_is_current(etag, last_modified):
+                resp = Response(status=304)
+            else:
+                resp = current_app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+
+            resp.headers["ETag"] = etag
+            if last_modified:
+                resp.last_modified = last_modified
+            # Allow caching but always revalidate (cheap thanks to the validator)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,108 @@
+# server/app/expiry.py
+# Background sweeper that retires expired listings.
+#
+# Listings used to stay is_active=True forever after expiry, so every public
+# query had to re-check expires_at against "now" and the partial
+# ix_bike_active_* indexes kept growing with dead rows. The sweeper flips
+# expired rows to inactive in bulk UPDATE batches, which keeps the active set
+# (and its indexes) small. The public query keeps its expires_at predicate as
+# a backstop for the few seconds between sweeps. expires_at is left in place:
+# it is what tells an expired listing (renew for $3) from a never-paid draft.
+#
+# Runs three ways:
+#   - in the serving process, every EXPIRY_SWEEP_INTERVAL seconds (0 disables;
+#     started by start_background_workers() in wsgi.py / run.py)
+#   - POST /api/admin/sweep_expired (X-Admin-Token)
+#   - python -m server.app.expiry (from cron)
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import select, update
+from .models import db, Bike
+from .admin import admin_required
+from .cache import invalidate
+
+expiry_bp = Blueprint("expiry", __name__)
+
+SWEEP_BATCH_SIZE = 500
+
+
+def sweep_expired_listings(now: datetime | None = None, batch_size: int = SWEEP_BATCH_SIZE):
+    """
+    Deactivate every active bike whose expires_at has passed.
+    Each batch selects up to batch_size ids via ix_bike_active_expires and
+    flips them in one UPDATE + commit, so write locks are held only briefly.
+    Returns {"deactivated", "batches", "duration_ms"}.
+    """
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    total, batches = 0, 0
+
+    while True:
+        ids = db.session.execute(
+            select(Bike.id)
+            .where(Bike.is_active == True, Bike.expires_at != None, Bike.expires_at < now)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(
+            update(Bike).where(Bike.id.in_(ids)).values(is_active=False),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+        total += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+
+    if total:
+        invalidate("bikes")
+
+    stats = {
+        "deactivated": total,
+        "batches": batches,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    current_app.logger.info("expiry sweep: %s", stats)
+    return stats
+
+
+def start_expiry_sweeper(app):
+    """Start a daemon thread that sweeps every EXPIRY_SWEEP_INTERVAL seconds."""
+    interval = app.config.get("EXPIRY_SWEEP_INTERVAL", 0)
+    if interval <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    sweep_expired_listings()
+                except Exception:
+                    app.logger.exception("expiry sweep failed")
+                finally:
+                    db.session.remove()
+
+    t = threading.Thread(target=_loop, name="expiry-sweeper", daemon=True)
+    t.start()
+    app.extensions["expiry_sweeper"] = stop  # stop.set() ends the loop
+    return t
+
+
+@expiry_bp.post("/admin/sweep_expired")
+@admin_required
+def sweep_expired():
+    """Run one sweep now and report how many listings were retired."""
+    return jsonify({"ok": True, **sweep_expired_listings()})
+
+
+if __name__ == "__main__":
+    # run with: python -m server.app.expiry (from repo root, venv active)
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        print(sweep_expired_listings())
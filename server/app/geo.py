@@ -0,0 +1,165 @@
+# server/app/geo.py
+# "Within N miles of ZIP" search for bikes, rides and riders.
+#
+# Coordinates come from a bundled, offline ZIP-centroid table
+# (data/zip_centroids.csv.gz, ~42k US ZIPs; see data/NOTICE.txt). It is loaded
+# once per process into three parallel arrays — sorted ZIPs as uint32, lat/lon
+# as float32 — about 500 KB in total, and looked up with bisect. ZIP prefixes
+# (rides store 3 digits, profiles 3–5) resolve to the mean of the ZIPs they
+# cover, which is one bisect range.
+#
+# Rows store their resolved lat/lon in indexed columns, filled on write;
+# rows saved before that are filled by `python -m server.app.geo`. A radius
+# query runs entirely in SQL:
+#   1. bounding box: lat/lon BETWEEN ... on the (lat, lon) index, so only rows
+#      in a small square around the center are read;
+#   2. distance: squared miles on a flat projection around the center
+#      (dlat * 69, dlon * 69 * cos(center lat)), plain arithmetic that SQLite
+#      and Postgres both evaluate. It drops the box corners outside the circle
+#      and is the ORDER BY / keyset key, so a page reads LIMIT rows rather
+#      than every candidate. Within a few hundred miles it differs from the
+#      great-circle distance by well under the 0.1 mi the API reports at 25 mi,
+#      and by a few percent at the 500 mi cap.
+import bisect
+import csv
+import gzip
+import math
+import os
+import threading
+from array import array
+from sqlalchemy import bindparam, literal, update
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "zip_centroids.csv.gz")
+
+MILES_PER_DEG_LAT = 69.0
+DEFAULT_RADIUS_MI = 25
+MAX_RADIUS_MI = 500
+
+_table = None
+_table_lock = threading.Lock()
+
+
+class ZipTable:
+    """ZIP -> (lat, lon) over parallel arrays sorted by ZIP."""
+
+    def __init__(self, zips: array, lats: array, lons: array):
+        self.zips, self.lats, self.lons = zips, lats, lons
+
+    @classmethod
+    def load(cls, path=DATA_PATH):
+        zips, lats, lons = array("I"), array("f"), array("f")
+        with gzip.open(path, "rt", encoding="ascii", newline="") as f:
+            reader = csv.reader(f)
+            next(reader)  # header
+            for z, lat, lon in reader:
+                zips.append(int(z))
+                lats.append(float(lat))
+                lons.append(float(lon))
+        return cls(zips, lats, lons)
+
+    def __len__(self):
+        return len(self.zips)
+
+    def lookup(self, code):
+        """
+        Centroid of a 5-digit ZIP, or of every ZIP starting with a 3–4 digit
+        prefix. Unknown 5-digit ZIPs fall back to their 3-digit prefix.
+        Returns (lat, lon) or None.
+        """
+        code = (code or "").strip()[:5]
+        if not code.isdigit() or len(code) < 3:
+            return None
+        if len(code) == 5:
+            i = bisect.bisect_left(self.zips, int(code))
+            if i < len(self.zips) and self.zips[i] == int(code):
+                return float(self.lats[i]), float(self.lons[i])
+            code = code[:3]
+        scale = 10 ** (5 - len(code))
+        lo = bisect.bisect_left(self.zips, int(code) * scale)
+        hi = bisect.bisect_left(self.zips, (int(code) + 1) * scale)
+        if lo == hi:
+            return None
+        n = hi - lo
+        return sum(self.lats[lo:hi]) / n, sum(self.lons[lo:hi]) / n
+
+
+def zip_table() -> ZipTable:
+    """The process-wide table, loaded on first use."""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = ZipTable.load()
+    return _table
+
+
+def locate(code):
+    """(lat, lon) for a ZIP or ZIP prefix, or (None, None) when unknown."""
+    return zip_table().lookup(code) or (None, None)
+
+
+def bounding_box(lat, lon, miles):
+    """(lat_min, lat_max, lon_min, lon_max) enclosing a circle of `miles`."""
+    dlat = miles / MILES_PER_DEG_LAT
+    # Longitude degrees shrink towards the poles; clamp so the box stays finite
+    dlon = miles / (MILES_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def within_box(q, model, box):
+    """Add the bounding-box prefilter on model.lat / model.lon to query q."""
+    lat_min, lat_max, lon_min, lon_max = box
+    return q.filter(model.lat.between(lat_min, lat_max), model.lon.between(lon_min, lon_max))
+
+
+def distance_sq(model, lat, lon):
+    """SQL expression: squared miles from (lat, lon) to model.lat / model.lon (flat projection)."""
+    dy = (model.lat - literal(lat)) * MILES_PER_DEG_LAT
+    dx = (model.lon - literal(lon)) * (MILES_PER_DEG_LAT * math.cos(math.radians(lat)))
+    return dy * dy + dx * dx
+
+
+def within_radius(q, model, lat, lon, miles):
+    """Bounding box (index range) plus the exact circle, both in SQL."""
+    q = within_box(q, model, bounding_box(lat, lon, miles))
+    return q.filter(distance_sq(model, lat, lon) <= miles * miles)
+
+
+def backfill_coordinates(session, batch_size=500):
+    """
+    Resolve lat/lon for rows that have a ZIP but no coordinates yet (rows
+    created before this feature). Rows whose ZIP is unknown stay NULL.
+    A one-off job (see __main__ below), not a startup step: each run rescans
+    the rows whose ZIP can't be placed.
+    Returns the number of rows updated.
+    """
+    from .models import Bike, Ride, UserProfile
+    total = 0
+    for model, zip_col in ((Bike, Bike.zip), (Ride, Ride.zip_prefix), (UserProfile, UserProfile.zip_prefix)):
+        rows = session.query(model.id, zip_col).filter(zip_col != None, model.lat == None).all()
+        values = []
+        for row_id, code in rows:
+            lat, lon = locate(code)
+            if lat is not None:
+                values.append({"row_id": row_id, "new_lat": lat, "new_lon": lon})
+        table = model.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            # updated_at is pinned: coordinates alone don't change any response
+            .values(lat=bindparam("new_lat"), lon=bindparam("new_lon"), updated_at=table.c.updated_at)
+        )
+        for i in range(0, len(values), batch_size):
+            session.execute(stmt, values[i:i + batch_size])
+        total += len(values)
+    session.commit()
+    return total
+
+
+if __name__ == "__main__":
+    # run with: python -m server.app.geo (from repo root, venv active), once
+    # after upgrading a database that has rows from before ?near= existed
+    from . import create_app, db
+    app = create_app()
+    with app.app_context():
+        print({"backfilled": backfill_coordinates(db.session)})
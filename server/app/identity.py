@@ -0,0 +1,102 @@
+# server/app/identity.py
+# Who is calling, without a primary-key lookup per use.
+#
+# Protected routes used to turn the JWT subject into an int and then load the
+# User / UserProfile row again, once per helper that needed it. Now:
+#   - tokens carry the user's email as a claim (emails never change), so code
+#     that only needs id + email reads the token;
+#   - current_user() / current_profile() memoize on flask.g for the request,
+#     as plain dicts (never ORM instances, which belong to a session);
+#   - current_user() is also kept in a small per-process TTL cache
+#     (IDENTITY_CACHE_TTL seconds) across requests. Its fields never change,
+#     so a stale entry in another worker is harmless. The profile is not
+#     process-cached: the caller edits it, and an invalidation only reaches
+#     the worker that handled the edit, so other workers would serve the old
+#     profile after a save;
+#   - invalidate_identity(user_id) drops the cached entries after a write.
+from flask import current_app, g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from .cache import MemoryTTLCache
+from .models import db, User, UserProfile
+
+DEFAULT_TTL_SECONDS = 30
+_MISSING = object()
+
+
+def init_identity(app):
+    """Attach the process-level cache (config: IDENTITY_CACHE_TTL, 0 = request scope only)."""
+    app.extensions["identity_cache"] = MemoryTTLCache(max_entries=app.config["IDENTITY_CACHE_MAX_ENTRIES"])
+
+
+def token_claims(user: User) -> dict:
+    """Extra, immutable claims to put in a user's tokens."""
+    return {"email": user.email}
+
+
+def current_user_id():
+    """The caller's user id from the verified JWT, or None when anonymous."""
+    identity = get_jwt_identity()
+    return int(identity) if identity is not None else None
+
+
+def current_email():
+    """The caller's email: from the token claim, or the cached user for older tokens."""
+    email = get_jwt().get("email")
+    if email:
+        return email
+    user = current_user()
+    return user["email"] if user else None
+
+
+def _cached(kind: str, user_id: int, load, shared: bool = True):
+    """load(user_id), memoized for the request and, if shared, in the process cache."""
+    memo = g.setdefault("identity", {})
+    key = f"{kind}:{user_id}"
+    value = memo.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    ttl = current_app.config.get("IDENTITY_CACHE_TTL", DEFAULT_TTL_SECONDS)
+    store = current_app.extensions.get("identity_cache") if shared and ttl > 0 else None
+    value = store.get(key) if store is not None else None
+    if value is None:
+        value = load(user_id)
+        if value is not None and store is not None:
+            store.set(key, value, ttl)
+    memo[key] = value
+    return value
+
+
+def _load_user(user_id):
+    user = db.session.get(User, user_id)
+    return user.to_dict() if user else None
+
+
+def _load_profile(user_id):
+    prof = UserProfile.query.filter_by(user_id=user_id).first()
+    return prof.to_dict() if prof else None
+
+
+def current_user():
+    """User.to_dict() for the caller, or None (anonymous or deleted)."""
+    user_id = current_user_id()
+    return _cached("user", user_id, _load_user) if user_id is not None else None
+
+
+def current_profile():
+    """UserProfile.to_dict() for the caller, or None if they have no profile yet (request scope only)."""
+    user_id = current_user_id()
+    return _cached("profile", user_id, _load_profile, shared=False) if user_id is not None else None
+
+
+def invalidate_identity(user_id: int, *kinds: str):
+    """
+    Forget cached data for user_id (call after committing a change): the
+    given kinds ("user", "profile"), or both by default.
+    """
+    memo = g.get("identity", {})
+    store = current_app.extensions.get("identity_cache")
+    for kind in kinds or ("user", "profile"):
+        memo.pop(f"{kind}:{user_id}", None)
+        if store is not None:
+            store.delete(f"{kind}:{user_id}")
@@ -0,0 +1,130 @@
+# server/app/images.py
+# Responsive image variants for uploaded photos.
+#
+# Every upload gets downscaled WebP copies (VARIANT_WIDTHS) so the bike grid
+# can fetch a ~20 KB card image instead of a multi-megabyte original.
+# Layout is content-addressed, keyed by the original's digest:
+#
+#   UPLOAD_DIR/<digest>.<ext>                 original
+#   UPLOAD_DIR/variants/<digest>/<width>.webp downscaled copies
+#
+# Resizing is CPU-heavy, so it runs in a process pool; the upload request
+# returns as soon as the original is on disk. Until a variant exists,
+# serve_upload falls back to the original.
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+VARIANT_WIDTHS = (320, 768, 1600)
+VARIANT_DIRNAME = "variants"
+WEBP_QUALITY = 80
+
+_pool_lock = threading.Lock()  # two first uploads must not each start a pool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow missing: uploads still work, just without variants
+    Image = None
+
+
+def variants_dir(upload_dir: str, digest: str) -> str:
+    return os.path.join(upload_dir, VARIANT_DIRNAME, digest)
+
+
+def variant_path(upload_dir: str, digest: str, width: int) -> str:
+    return os.path.join(variants_dir(upload_dir, digest), f"{width}.webp")
+
+
+def pick_width(requested: int | None):
+    """Smallest variant at least as wide as requested (largest if none is)."""
+    if not requested or requested <= 0:
+        return None
+    for w in VARIANT_WIDTHS:
+        if w >= requested:
+            return w
+    return VARIANT_WIDTHS[-1]
+
+
+def verify_image(path: str) -> bool:
+    """
+    True if Pillow can parse the file as an image (header and structure, no
+    full decode). Without Pillow every file passes; the magic-byte sniff in
+    uploads is then the only check.
+    """
+    if Image is None:
+        return True
+    try:
+        with Image.open(path) as im:
+            im.verify()
+    except Exception:  # Pillow raises a mix of OSError/SyntaxError/ValueError here
+        return False
+    return True
+
+
+def build_variants(src_path: str, out_dir: str, widths=VARIANT_WIDTHS):
+    """
+    Write <width>.webp for each width into out_dir. Never upscales: widths
+    larger than the source get a same-size WebP. Runs inside a pool worker,
+    so it only touches the filesystem (no app/DB state).
+    Returns the widths written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    with Image.open(src_path) as im:
+        im = ImageOps.exif_transpose(im)  # honour camera rotation before resizing
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        for w in widths:
+            dest = os.path.join(out_dir, f"{w}.webp")
+            if os.path.exists(dest):
+                continue  # same content was processed before
+            if im.width > w:
+                h = max(1, round(im.height * w / im.width))
+                out = im.resize((w, h), Image.LANCZOS)
+            else:
+                out = im
+            tmp = dest + ".tmp"
+            out.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(tmp, dest)  # readers never see a half-written file
+            written.append(w)
+    return written
+
+
+def _get_pool(app):
+    with _pool_lock:
+        pool = app.extensions.get("image_pool")
+        if pool is None:
+            # spawn (not fork): the parent is a threaded web worker
+            pool = ProcessPoolExecutor(
+                max_workers=app.config["IMAGE_WORKERS"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            app.extensions["image_pool"] = pool
+        return pool
+
+
+def schedule_variants(app, src_path: str, digest: str):
+    """
+    Queue variant generation for an uploaded original. With IMAGE_WORKERS=0
+    the work runs inline (handy for tests and single-process dev servers).
+    """
+    if Image is None:
+        return None
+    out_dir = variants_dir(app.config["UPLOAD_DIR"], digest)
+    if app.config.get("IMAGE_WORKERS", 0) <= 0:
+        try:
+            return build_variants(src_path, out_dir)
+        except Exception as e:  # the original is stored either way; serve_upload falls back to it
+            app.logger.warning("variant generation for %s failed: %s", digest, e)
+            return None
+
+    future = _get_pool(app).submit(build_variants, src_path, out_dir)
+    log = app.logger
+
+    def _report(f):
+        if f.exception():
+            log.warning("variant generation for %s failed: %s", digest, f.exception())
+
+    future.add_done_callback(_report)
+    return future
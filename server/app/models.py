@@ -1,6 +1,8 @@
 from . import db
-from sqlalchemy import UniqueConstraint
-from datetime import datetime, timedelta
+from sqlalchemy import UniqueConstraint, Index, func, select, update
+from sqlalchemy.orm import joinedload, load_only
+import re
+from datetime import datetime, timedelta, time as dt_time
 # defines  database schema and a few helper methods for auth, serialization, and the listing lifecycle
 
 # Werkzeug for password hashing—so we never store raw passwords.
@@ -15,7 +17,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # directory sort
 
     def set_password(self, raw: str):
         self.password_hash = generate_password_hash(raw)
@@ -36,6 +38,8 @@ class UserProfile(db.Model):
     age = db.Column(db.Integer)
     state = db.Column(db.String(2))          # e.g., "NJ"
     zip_prefix = db.Column(db.String(5))     # allow 3–5 for safety
+    lat = db.Column(db.Float)                # zip_prefix centroid (geo.py)
+    lon = db.Column(db.Float)
     experience_level = db.Column(db.String(50))  # Beginner/Intermediate/Advanced
     bike = db.Column(db.String(120))         # what you ride
     phone = db.Column(db.String(30))
@@ -44,6 +48,14 @@ class UserProfile(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Rider directory filters: ?state= (optionally with ?level=) and ?level= alone
+    __table_args__ = (
+        Index("ix_user_profile_state_level", "state", "experience_level"),
+        Index("ix_user_profile_level", "experience_level"),
+        # ?near=<zip> bounding box
+        Index("ix_user_profile_geo", "lat", "lon"),
+    )
+
     def to_dict(self):
         return dict(
             id=self.id,
@@ -79,6 +91,8 @@ class Bike(db.Model):
     wheel_size = db.Column(db.String(20))
     condition = db.Column(db.String(20))
     zip = db.Column(db.String(5))            # full 5-digit ZIP
+    lat = db.Column(db.Float)                # ZIP centroid (geo.py), for ?near=
+    lon = db.Column(db.Float)
     description = db.Column(db.Text)
 
     # OPTIONAL extras
@@ -98,6 +112,7 @@ class Bike(db.Model):
 
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     owner = db.relationship("User", lazy="joined")
 
@@ -106,6 +121,64 @@ class Bike(db.Model):
     expires_at = db.Column(db.DateTime, nullable=True)
     stripe_listing_session = db.Column(db.String(120), nullable=True)
     stripe_last_renew_session = db.Column(db.String(120), nullable=True)
+    renewal_reminder_sent_for = db.Column(db.DateTime, nullable=True)  # expires_at the reminder covered
+
+    # Index set matched to the query shapes in routes.py / notifications.py.
+    # The public index only ever reads active rows, so those indexes are partial
+    # (WHERE is_active) and stay small no matter how many drafts pile up.
+    __table_args__ = (
+        # GET /bikes             -> WHERE is_active ... ORDER BY created_at DESC, id DESC
+        Index("ix_bike_active_created", "created_at", "id",
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+        # GET /bikes?state=XX    -> WHERE is_active AND state = ? ORDER BY created_at DESC, id DESC
+        Index("ix_bike_active_state_created", "state", "created_at", "id",
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+        # GET /bikes/mine        -> WHERE owner_id = ? ORDER BY created_at DESC
+        Index("ix_bike_owner_created", "owner_id", "created_at"),
+        # Renewal reminders      -> WHERE is_active AND expires_at BETWEEN ...
+        Index("ix_bike_active_expires", "expires_at",
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+        # GET /bikes?near=<zip>  -> WHERE is_active AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+        Index("ix_bike_active_geo", "lat", "lon",
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
+    # Columns the bike grid actually renders (plus the keyset sort key), and
+    # the owner's email for the "listed by" footer.
+    # Everything else — description, spec sheet, lifecycle — is detail-only.
+    CARD_COLUMNS = (
+        "id", "title", "brand", "model", "year", "size", "price_usd", "state", "zip",
+        "photo1_url", "photo2_url", "photo3_url", "owner_id", "created_at",
+    )
+
+    @classmethod
+    def card_options(cls):
+        """
+        Loader options for list queries: load only CARD_COLUMNS, and join the
+        owner for just users.email (plus its key) instead of the whole row.
+        """
+        return (
+            load_only(*(getattr(cls, c) for c in cls.CARD_COLUMNS)),
+            joinedload(cls.owner).load_only(User.email),
+        )
+
+    def to_card_dict(self):
+        """Compact serializer for grid cards; pair with Bike.card_options()."""
+        return dict(
+            id=self.id,
+            title=self.title,
+            brand=self.brand,
+            model=self.model,
+            year=self.year,
+            size=self.size,
+            price_usd=self.price_usd,
+            state=self.state,
+            zip=self.zip,
+            owner_id=self.owner_id,
+            owner_email=self.owner.email if self.owner else None,
+            photos=[p for p in [self.photo1_url, self.photo2_url, self.photo3_url] if p],
+            created_at=self.created_at.isoformat() if self.created_at else None,
+        )
 
     def to_dict(self):
         photos = [p for p in [self.photo1_url, self.photo2_url, self.photo3_url] if p]
@@ -142,20 +215,51 @@ class Bike(db.Model):
             photos=photos,
 
             created_at=self.created_at.isoformat() if self.created_at else None,
+            updated_at=self.updated_at.isoformat() if self.updated_at else None,
             is_active=self.is_active,
             expires_at=self.expires_at.isoformat() if self.expires_at else None,
 
         )
 
 
+_CLOCK_RE = re.compile(r"^(\d{1,2})(?::(\d{2}))?(?::(\d{2}))?\s*([ap])?\.?m?\.?$")
+
+def parse_ride_time(text):
+    """
+    Parse a free-text ride time ("08:30", "8:30 pm", "7am", "18:00:00") into a
+    datetime.time. Returns None when it isn't recognisable.
+    """
+    m = _CLOCK_RE.match((text or "").strip().lower())
+    if not m:
+        return None
+    hour, minute, second = int(m.group(1)), int(m.group(2) or 0), int(m.group(3) or 0)
+    if m.group(4):
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if m.group(4) == "p" else 0)
+    elif m.group(2) is None:
+        return None  # a bare number isn't a time
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    return dt_time(hour, minute, second)
+
+
 class RideAttendee(db.Model):
     __tablename__ = "ride_attendee"
-    id = db.Column(db.Integer, primary_key=True)
+    GOING = "going"
+    WAITLISTED = "waitlisted"
+
+    id = db.Column(db.Integer, primary_key=True)   # increasing, so it doubles as waitlist order
     ride_id = db.Column(db.Integer, db.ForeignKey("ride.id", ondelete="CASCADE"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # "going" holds a seat, "waitlisted" queues for one (NULL = going, pre-capacity rows)
+    status = db.Column(db.String(12), default=GOING)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         UniqueConstraint("ride_id", "user_id", name="uq_ride_user"),
+        # next on the waitlist -> WHERE ride_id = ? AND status = 'waitlisted' ORDER BY id LIMIT 1
+        Index("ix_ride_attendee_status", "ride_id", "status", "id"),
     )
 
 # In your Ride model, add relationships (if not already present):
@@ -165,24 +269,84 @@ class Ride(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     date = db.Column(db.Date, nullable=False)
-    time = db.Column(db.String(10))
+    time = db.Column(db.String(10))          # as entered ("08:30"), shown to users
+    # Sortable form of `time` (midnight when missing/unparseable). Nullable only
+    # so upgrade_schema can add it; sync_start_times() fills old rows.
+    start_time = db.Column(db.Time, default=dt_time(0, 0))
     difficulty = db.Column(db.String(50))
     terrain = db.Column(db.String(100))
     zip_prefix = db.Column(db.String(3))
     state = db.Column(db.String(2))          # <-- NEW
+    lat = db.Column(db.Float)                # zip_prefix centroid (geo.py)
+    lon = db.Column(db.Float)
     description = db.Column(db.Text)
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # also bumped on RSVP
+    # Optional size cap; NULL = unlimited. RSVPs past it join the waitlist.
+    capacity = db.Column(db.Integer)
+    # Denormalized counts of going / waitlisted ride_attendee rows, kept in step
+    # by rsvp.toggle_rsvp so list views never touch the attendee table and seat
+    # checks are one conditional UPDATE. Nullable only so upgrade_schema can add
+    # them to old databases; sync_attendee_counts() fills those rows.
+    attendee_count = db.Column(db.Integer, default=0)
+    waitlist_count = db.Column(db.Integer, default=0)
+
+    # GET /rides (optionally ?state=XX) -> WHERE date >= ? ORDER BY date, start_time, id
+    __table_args__ = (
+        Index("ix_ride_date_start", "date", "start_time", "id"),
+        Index("ix_ride_state_date_start", "state", "date", "start_time", "id"),
+        # ?near=<zip> bounding box
+        Index("ix_ride_geo", "lat", "lon"),
+    )
 
     owner = db.relationship("User", backref="rides_owned")
+    # Everyone with an RSVP row, going or waitlisted. Loaded on access only;
+    # lists use the counters and the owner view queries by status.
     attendees = db.relationship(
         "User",
         secondary="ride_attendee",
         backref="rides_joined",
-        lazy="selectin",
+        lazy="select",
     )
 
+    @classmethod
+    def sync_attendee_counts(cls, only_missing=True):
+        """
+        Recompute attendee_count / waitlist_count from ride_attendee in one
+        correlated UPDATE. By default only rides missing a count (older rows).
+        """
+        def _counted(waitlisted):
+            cond = (RideAttendee.status == RideAttendee.WAITLISTED) if waitlisted else (
+                (RideAttendee.status == None) | (RideAttendee.status != RideAttendee.WAITLISTED)
+            )
+            return (
+                select(func.count(RideAttendee.id))
+                .where(RideAttendee.ride_id == cls.id, cond)
+                .scalar_subquery()
+            )
+        stmt = update(cls).values(
+            attendee_count=_counted(False), waitlist_count=_counted(True), updated_at=cls.updated_at
+        )
+        if only_missing:
+            stmt = stmt.where((cls.attendee_count == None) | (cls.waitlist_count == None))
+        result = db.session.execute(stmt, execution_options={"synchronize_session": False})
+        db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def sync_start_times(cls):
+        """Fill start_time for rides that predate it, by parsing their `time` text."""
+        rows = db.session.query(cls.id, cls.time).filter(cls.start_time == None).all()
+        for ride_id, text in rows:
+            db.session.execute(
+                update(cls)
+                .where(cls.id == ride_id)
+                .values(start_time=parse_ride_time(text) or dt_time(0, 0), updated_at=cls.updated_at)
+            )
+        db.session.commit()
+        return len(rows)
+
     def to_dict(self, include_attendees=False):
         data = dict(
             id=self.id,
@@ -195,12 +359,22 @@ class Ride(db.Model):
             zip_prefix=self.zip_prefix,
             description=self.description,
             owner_id=self.owner_id,
-            attendee_count=len(self.attendees) if self.attendees is not None else 0,
+            attendee_count=self.attendee_count or 0,
+            capacity=self.capacity,
+            waitlist_count=self.waitlist_count or 0,
+            seats_left=None if self.capacity is None else max(self.capacity - (self.attendee_count or 0), 0),
         )
         if include_attendees:
-            data["attendees"] = [
-                {"id": u.id, "email": u.email} for u in self.attendees
-            ]
+            # Owner view: seated riders and the waitlist, each in RSVP order
+            rows = (
+                db.session.query(User.id, User.email, RideAttendee.status)
+                .join(RideAttendee, RideAttendee.user_id == User.id)
+                .filter(RideAttendee.ride_id == self.id)
+                .order_by(RideAttendee.id)
+                .all()
+            )
+            data["attendees"] = [{"id": i, "email": e} for i, e, st in rows if st != RideAttendee.WAITLISTED]
+            data["waitlist"] = [{"id": i, "email": e} for i, e, st in rows if st == RideAttendee.WAITLISTED]
         return data
     
 class Payment(db.Model):
@@ -213,4 +387,59 @@ class Payment(db.Model):
     amount_cents = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    
\ No newline at end of file
+
+class StripeEvent(db.Model):
+    """
+    Ledger of Stripe webhook events, one row per event id. Written in the same
+    transaction as the changes the event caused, so a retried or replayed
+    event is recognised and skipped.
+    """
+    __tablename__ = "stripe_event"
+    id = db.Column(db.String(255), primary_key=True)       # Stripe event id (evt_...)
+    type = db.Column(db.String(80), nullable=False)        # e.g. checkout.session.completed
+    session_id = db.Column(db.String(120))                 # checkout session it carried, if any
+    outcome = db.Column(db.String(20), nullable=False)     # applied / ignored / duplicate
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class WebhookJob(db.Model):
+    """
+    A verified Stripe event waiting to be applied (see webhook_queue.py).
+    Rows are deleted in the same transaction that applies them; the
+    StripeEvent ledger is the permanent record.
+    """
+    __tablename__ = "webhook_job"
+    id = db.Column(db.Integer, primary_key=True)               # queue order
+    event_id = db.Column(db.String(255), unique=True, nullable=False)  # dedups Stripe retries while queued
+    payload = db.Column(db.Text, nullable=False)               # raw event JSON as Stripe sent it
+    status = db.Column(db.String(10), default="queued", nullable=False)  # queued / running / failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))                     # which worker batch holds it
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)
+    not_before = db.Column(db.DateTime)                        # retry backoff: not claimable until then
+
+    # Workers claim -> WHERE status = 'queued' ORDER BY id LIMIT ?
+    __table_args__ = (
+        Index("ix_webhook_job_status_id", "status", "id"),
+    )
+
+
+class RevokedToken(db.Model):
+    """
+    A JWT (access or refresh) that must no longer be accepted, until it would
+    have expired anyway. Workers mirror this table in memory (revocation.py).
+    """
+    __tablename__ = "revoked_token"
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)      # access / refresh
+    user_id = db.Column(db.Integer)
+    expires_at = db.Column(db.DateTime, nullable=False)        # the token's own exp
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Pruning -> DELETE ... WHERE expires_at < now; sync -> WHERE expires_at >= now
+    __table_args__ = (
+        Index("ix_revoked_token_expires", "expires_at"),
+    )
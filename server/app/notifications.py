@@ -1,46 +1,158 @@
 # server/app/notifications.py
 import os
+import json
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from .models import db, Bike, User
-from flask import Blueprint, jsonify
-from sqlalchemy import and_
+from .admin import admin_required
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import and_, or_, update
 
 notifications_bp = Blueprint("notifications", __name__)
 
-def _send_email_stub(to_email: str, subject: str, body: str):
+# Rows are streamed from the DB in chunks of this size, and sent markers are
+# written back in chunks of the same size.
+BATCH_SIZE = 500
+
+# -----------------------------------------------------------------------------
+# Mail transports
+# -----------------------------------------------------------------------------
+class MailTransport(ABC):
+    """Anything that can deliver a plain-text email. Must be thread-safe."""
+
+    @abstractmethod
+    def send(self, to_email: str, subject: str, body: str):
+        """Deliver one message; raise on failure."""
+
+
+class ConsoleTransport(MailTransport):
     # Replace with real email (SendGrid, SES, Mailgun).
     # For now we just log to server console.
-    print(f"[EMAIL] To={to_email}\nSubj={subject}\n\n{body}\n{'-'*60}")
+    def send(self, to_email, subject, body):
+        print(f"[EMAIL] To={to_email}\nSubj={subject}\n\n{body}\n{'-'*60}")
 
-@notifications_bp.post("/admin/send_renewal_emails")
-def send_renewal_emails():
+
+class FileTransport(MailTransport):
+    """Appends one JSON line per message to an outbox file (tests/staging)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, to_email, subject, body):
+        line = json.dumps({"to": to_email, "subject": subject, "body": body})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _get_transport() -> MailTransport:
+    """Build the transport selected by MAIL_TRANSPORT ("console" or "file")."""
+    kind = current_app.config.get("MAIL_TRANSPORT", "console")
+    if kind == "file":
+        return FileTransport(current_app.config["MAIL_OUTBOX_PATH"])
+    return ConsoleTransport()
+
+# -----------------------------------------------------------------------------
+# Renewal reminder pipeline
+# -----------------------------------------------------------------------------
+def _reminder(title: str, bike_id: int, expires_at: datetime):
+    site = os.getenv("PUBLIC_SITE_URL", "http://localhost:5173")
+    subject = "Your GritGirls listing is expiring soon"
+    body = (
+        f"Hi!\n\nYour listing “{title}” will expire on {expires_at.date()}.\n"
+        f"Renew for 20 more days here: {site}/pay/{bike_id}\n\n"
+        "Happy riding,\nGritGirls"
+    )
+    return subject, body
+
+
+def send_renewal_reminders(now: datetime | None = None):
     """
-    Find active bikes expiring in ~3 days and send a reminder once.
-    You can schedule this endpoint daily with a cron (Render/Heroku/etc.).
+    Email owners of active bikes expiring in ~3 days, once per expiry date.
+
+    - One joined query (bike ⋈ users) streamed with yield_per: no per-bike owner lookup.
+    - Messages go to a bounded thread pool so a slow mail API doesn't serialize the run
+      and at most MAIL_MAX_IN_FLIGHT messages are queued in memory.
+    - Successfully sent bikes get renewal_reminder_sent_for = expires_at, so reruns
+      skip them while a renewal (new expires_at) re-arms the reminder.
+    Returns counters for the run.
     """
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
     in_3_days = now + timedelta(days=3)
     in_4_days = now + timedelta(days=4)  # 24h window
 
-    bikes = Bike.query.filter(
-        and_(
-            Bike.is_active == True,
-            Bike.expires_at != None,
-            Bike.expires_at >= in_3_days,
-            Bike.expires_at <  in_4_days
+    transport = _get_transport()
+    log = current_app.logger  # worker threads have no app context
+    workers = current_app.config.get("MAIL_WORKERS", 4)
+    in_flight = threading.BoundedSemaphore(current_app.config.get("MAIL_MAX_IN_FLIGHT", workers * 4))
+    sent_ids, failed_ids = [], []
+
+    rows = (
+        db.session.query(Bike.id, Bike.title, Bike.expires_at, User.email)
+        .join(User, User.id == Bike.owner_id)
+        .filter(
+            and_(
+                Bike.is_active == True,
+                Bike.expires_at != None,
+                Bike.expires_at >= in_3_days,
+                Bike.expires_at <  in_4_days,
+                or_(Bike.renewal_reminder_sent_for == None,
+                    Bike.renewal_reminder_sent_for != Bike.expires_at),
+            )
         )
-    ).all()
-
-    for b in bikes:
-        owner = User.query.get(b.owner_id)
-        if not owner or not owner.email:
-            continue
-        subject = "Your GritGirls listing is expiring soon"
-        body = (
-            f"Hi!\n\nYour listing “{b.title}” will expire on {b.expires_at.date()}.\n"
-            f"Renew for 20 more days here: {os.getenv('PUBLIC_SITE_URL', 'http://localhost:5173')}/pay/{b.id}\n\n"
-            "Happy riding,\nGritGirls"
+        .order_by(Bike.id)
+        .yield_per(BATCH_SIZE)
+    )
+
+    def _deliver(bike_id, to_email, subject, body):
+        try:
+            transport.send(to_email, subject, body)
+            sent_ids.append(bike_id)       # list.append is atomic under the GIL
+        except Exception as e:
+            log.warning("renewal reminder for bike %s failed: %s", bike_id, e)
+            failed_ids.append(bike_id)
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mail") as pool:
+        for bike_id, title, expires_at, email in rows:
+            if not email:
+                continue
+            subject, body = _reminder(title, bike_id, expires_at)
+            in_flight.acquire()  # backpressure: wait while the pool is saturated
+            pool.submit(_deliver, bike_id, email, subject, body)
+
+    # Record sent markers in bulk. updated_at is pinned so the public ETag
+    # validators don't see a change (the marker isn't part of any response).
+    for i in range(0, len(sent_ids), BATCH_SIZE):
+        chunk = sent_ids[i:i + BATCH_SIZE]
+        db.session.execute(
+            update(Bike)
+            .where(Bike.id.in_(chunk))
+            .values(renewal_reminder_sent_for=Bike.expires_at, updated_at=Bike.updated_at)
         )
-        _send_email_stub(owner.email, subject, body)
+    db.session.commit()
+
+    return {"notified": len(sent_ids), "failed": len(failed_ids)}
+
+
+@notifications_bp.post("/admin/send_renewal_emails")
+@admin_required
+def send_renewal_emails():
+    """
+    Find active bikes expiring in ~3 days and send a reminder once.
+    You can schedule this endpoint daily with a cron (Render/Heroku/etc.),
+    sending the ADMIN_TOKEN in an X-Admin-Token header, or run the module directly.
+    """
+    stats = send_renewal_reminders()
+    return jsonify({"ok": True, **stats})
+
 
-    return jsonify({"ok": True, "notified": len(bikes)})
+if __name__ == "__main__":
+    # run with: python -m server.app.notifications (from repo root, venv active)
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        print(send_renewal_reminders())
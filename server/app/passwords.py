@@ -0,0 +1,159 @@
+# server/app/passwords.py
+# Password hashing off the request thread, plus admission control for the
+# auth endpoints.
+#
+# A PBKDF2/scrypt hash is deliberately ~100 ms of CPU. Run inline, a login
+# burst (or a credential-stuffing run) occupies every worker thread and the
+# listing endpoints stall behind it. Instead:
+#   - hashes run on a small dedicated pool (PASSWORD_HASH_WORKERS threads;
+#     hashlib releases the GIL), so at most that many burn CPU at once;
+#   - at most PASSWORD_HASH_MAX_PENDING may wait for the pool; beyond that
+#     the request is shed with 503 + Retry-After instead of queueing forever;
+#   - before any hashing, each client IP and each email spends a token from
+#     its bucket (AUTH_RATE_PER_IP / AUTH_RATE_PER_EMAIL, "<attempts>/<seconds>");
+#     an empty bucket is a 429 + Retry-After that costs no hash at all.
+#
+# New hashes use PASSWORD_HASH_METHOD (any werkzeug method string, e.g.
+# "scrypt:32768:8:1" or "pbkdf2:sha256:1000000"). A successful login with a
+# hash made under another method or cost is re-hashed, so raising the cost
+# upgrades users as they sign in.
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+MAX_TRACKED_KEYS = 10000
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; the client should retry shortly."""
+
+
+def parse_rate(value: str):
+    """Parse "30/60" into (30, 60.0): 30 attempts per 60 s. "0" or "" disables (None)."""
+    value = (value or "").strip()
+    if not value or value == "0":
+        return None
+    count, _, seconds = value.partition("/")
+    return int(count), float(seconds or 60)
+
+
+def normalize_method(method: str) -> str:
+    """
+    The method as werkzeug writes it at the start of a hash, with its
+    defaults filled in: "scrypt" -> "scrypt:32768:8:1", "pbkdf2" ->
+    "pbkdf2:sha256:<DEFAULT_PBKDF2_ITERATIONS>".
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = args + ["32768", "8", "1"][len(args):]
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        digest, iterations = args + ["sha256", str(DEFAULT_PBKDF2_ITERATIONS)][len(args):]
+        return f"pbkdf2:{digest}:{iterations}"
+    return method
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets (capacity `count`, refilled over `seconds`),
+    thread-safe. The least recently seen keys are dropped beyond max_keys, so
+    a spray of distinct emails can't grow memory without bound.
+    """
+
+    def __init__(self, count: int, seconds: float, max_keys: int = MAX_TRACKED_KEYS):
+        self.capacity = float(count)
+        self.rate = count / seconds          # tokens per second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()        # key -> (tokens, last_refill_monotonic)
+        self._lock = threading.Lock()
+
+    def take(self, key, now: float | None = None) -> float:
+        """Spend one token. Returns 0 if admitted, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                wait, tokens = 0.0, tokens - 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class PasswordHasher:
+    """hash()/verify() on a bounded pool (workers=0 runs them inline)."""
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=16, timeout=10.0):
+        self.method = method
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash") if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(workers + max_pending) if workers > 0 else None
+        self._prefix = normalize_method(method)
+
+    def _run(self, fn, *args):
+        if self._pool is None:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy() from None
+
+    def hash(self, raw: str) -> str:
+        return self._run(generate_password_hash, raw, self.method)
+
+    def verify(self, stored: str, raw: str) -> bool:
+        return self._run(check_password_hash, stored, raw)
+
+    def needs_rehash(self, stored: str) -> bool:
+        """True if `stored` was made with another method or cost than the configured one."""
+        return (stored or "").split("$", 1)[0] != self._prefix
+
+
+def init_passwords(app):
+    """Attach the hasher and the auth limiters (config: PASSWORD_HASH_*, AUTH_RATE_PER_*)."""
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    )
+    limits = {}
+    for scope in ("ip", "email"):
+        rate = parse_rate(app.config[f"AUTH_RATE_PER_{scope.upper()}"])
+        if rate:
+            limits[scope] = TokenBucketLimiter(*rate)
+    app.extensions["auth_limits"] = limits
+
+
+def hasher() -> PasswordHasher:
+    return current_app.extensions["password_hasher"]
+
+
+def admit(ip: str, email: str) -> float:
+    """
+    Spend one attempt for this IP and this email. Returns 0 if the attempt
+    may proceed, else the Retry-After in seconds.
+    """
+    limits = current_app.extensions.get("auth_limits", {})
+    for scope, key in (("ip", ip), ("email", email)):
+        limiter = limits.get(scope)
+        if limiter is not None and key:
+            wait = limiter.take(key)
+            if wait:
+                return wait
+    return 0.0
@@ -2,7 +2,11 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta, timezone
-from .models import db, Bike, User
+from sqlalchemy.exc import IntegrityError
+from .models import db, Bike, User, Payment, StripeEvent
+from .cache import invalidate
+from .webhook_queue import enqueue_stripe_event
+from .stripe_client import checkout_url_for
 import os
 import stripe
 
@@ -37,9 +41,10 @@ def _site_urls():
         "cancel":  f"{public}/bikes"         # where Stripe sends the user if they cancel
     }
 
-def _set_stripe_key():
-    """Load the Stripe secret key from the environment and configure the SDK."""
-    stripe.api_key = _get_env("STRIPE_SECRET_KEY")
+def _require_stripe_key():
+    """Fail fast if the SDK wasn't given a secret key at startup (init_stripe)."""
+    if not stripe.api_key:
+        raise RuntimeError("Missing required env var: STRIPE_SECRET_KEY")
 
 @payments_bp.post("/payments/checkout/listing")
 @jwt_required()
@@ -53,7 +58,7 @@ def start_listing_checkout():
     Result:
       - Returns a 'checkout_url' to redirect the user to Stripe Checkout.
     """
-    _set_stripe_key()
+    _require_stripe_key()
     user_id = int(get_jwt_identity())
 
     # Parse payload
@@ -67,14 +72,19 @@ def start_listing_checkout():
     if not bike or bike.owner_id != user_id:
         return jsonify({"error": "Bike not found or not yours"}), 404
 
-    # Only drafts should go through the listing payment flow
+    # Only drafts should go through the listing payment flow. A paid listing
+    # always has expires_at (the sweeper only clears is_active), so an
+    # expired one is renewed, not charged the posting fee again.
     if bike.is_active:
         return jsonify({"error": "Listing already active"}), 400
+    if bike.expires_at is not None:
+        return jsonify({"error": "Listing expired; renew it instead"}), 400
 
     urls = _site_urls()
     try:
-        # Create a Checkout Session for a one-time payment
-        session = stripe.checkout.Session.create(
+        # Reuse this bike's open Checkout Session, or create one (one-time payment)
+        checkout_url = checkout_url_for(
+            bike, "LISTING", current_app.config["CHECKOUT_SESSION_TTL"],
             mode="payment",
             line_items=[{
                 "quantity": 1,
@@ -94,7 +104,7 @@ def start_listing_checkout():
             }
         )
         # Frontend should redirect the browser to this URL
-        return jsonify({"checkout_url": session.url}), 200
+        return jsonify({"checkout_url": checkout_url}), 200
 
     # Stripe-specific error (network, invalid config, etc.)
     except stripe.error.StripeError as se:
@@ -115,7 +125,7 @@ def start_renew_checkout():
     Note:
       - We allow renewals whether currently expired or not; we'll extend from max(now, current expiry).
     """
-    _set_stripe_key()
+    _require_stripe_key()
     user_id = int(get_jwt_identity())
 
     data = request.get_json() or {}
@@ -129,8 +139,9 @@ def start_renew_checkout():
 
     urls = _site_urls()
     try:
-        # Create a Checkout Session for renewal
-        session = stripe.checkout.Session.create(
+        # Reuse this bike's open renewal Checkout Session, or create one
+        checkout_url = checkout_url_for(
+            bike, "RENEW", current_app.config["CHECKOUT_SESSION_TTL"],
             mode="payment",
             line_items=[{
                 "quantity": 1,
@@ -148,7 +159,7 @@ def start_renew_checkout():
                 "owner_id": str(user_id),
             }
         )
-        return jsonify({"checkout_url": session.url}), 200
+        return jsonify({"checkout_url": checkout_url}), 200
 
     except stripe.error.StripeError as se:
         return jsonify({"error": str(se)}), 500
@@ -156,6 +167,96 @@ def start_renew_checkout():
         return jsonify({"error": str(e)}), 500
 
 
+def _stage_checkout(event):
+    """
+    Stage (not commit) the effect of one event on the session.
+    Returns (outcome, session_id): "applied", "ignored" or "duplicate".
+    """
+    # We only care about successful checkout completions for now
+    if event.get("type") != "checkout.session.completed":
+        return "ignored", None
+    session = event["data"]["object"]
+    session_id = session.get("id")
+
+    # The metadata we set when creating the checkout session
+    meta = session.get("metadata", {}) or {}
+    action = meta.get("action")
+    bike_id = int(meta.get("bike_id") or 0)
+    owner_id = int(meta.get("owner_id") or 0)
+
+    # If the webhook doesn't include what we expect, bail quietly
+    if not bike_id or action not in ("LISTING", "RENEW"):
+        return "ignored", session_id
+
+    bike = Bike.query.get(bike_id)
+    # Only modify if the bike exists and (optionally) still belongs to same owner
+    if not bike or (owner_id and bike.owner_id != owner_id):
+        return "ignored", session_id
+
+    # One checkout session pays for exactly one change, whatever event carries it
+    if session_id and Payment.query.filter_by(stripe_session_id=session_id).first():
+        return "duplicate", session_id
+
+    now = _now_utc().replace(tzinfo=None)  # DB timestamps are naive UTC
+    if action == "LISTING":
+        # First-time publish: mark active and set a fresh expiry
+        bike.is_active = True
+        bike.expires_at = now + timedelta(days=RENEW_DAYS)
+    else:
+        # Renewal: extend from the later of (now, current expiry)
+        base = bike.expires_at if (bike.expires_at and bike.expires_at > now) else now
+        bike.is_active = True
+        bike.expires_at = base + timedelta(days=RENEW_DAYS)
+
+    if session_id and bike.owner_id:
+        db.session.add(Payment(
+            kind="listing" if action == "LISTING" else "renewal",
+            bike_id=bike.id,
+            owner_id=bike.owner_id,
+            stripe_session_id=session_id,
+            amount_cents=session.get("amount_total")
+                or (LISTING_PRICE_CENTS if action == "LISTING" else RENEW_PRICE_CENTS),
+        ))
+    return "applied", session_id
+
+
+def stage_stripe_event(event):
+    """
+    Stage one verified Stripe event without committing: the ledger row
+    (StripeEvent), the Payment row and the bike change join the current
+    transaction, so they commit (or roll back) together. A known event id,
+    or another event for an already paid checkout session, stages nothing.
+    Returns the outcome ("applied", "ignored" or "duplicate").
+    """
+    event_id = event.get("id")
+    if event_id and db.session.get(StripeEvent, event_id) is not None:
+        return "duplicate"
+
+    outcome, session_id = _stage_checkout(event)
+    if event_id:
+        db.session.add(StripeEvent(id=event_id, type=event.get("type") or "", session_id=session_id, outcome=outcome))
+    return outcome
+
+
+def apply_stripe_event(event):
+    """
+    stage_stripe_event() + commit, for a single event. Concurrent deliveries
+    race on the ledger primary key / payment.stripe_session_id; the loser
+    rolls back and reports "duplicate".
+    """
+    outcome = stage_stripe_event(event)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        current_app.logger.info("stripe event %s already recorded (concurrent delivery)", event.get("id"))
+        return "duplicate"
+
+    if outcome == "applied":
+        invalidate("bikes")
+    return outcome
+
+
 @payments_bp.post("/stripe/webhook")
 def stripe_webhook():
     """
@@ -164,6 +265,10 @@ def stripe_webhook():
     Behavior:
       - LISTING: activate the bike and set expires_at = now + 20 days
       - RENEW:   set expires_at = max(now, current expires_at) + 20 days
+      - Each paid session is recorded as a Payment; each event id in the
+        StripeEvent ledger, so retries and replays are no-ops.
+    The request only verifies and enqueues (webhook_queue.py); worker threads
+    apply the event moments later, so slow writes never hit Stripe's timeout.
     Always return 200 to prevent Stripe from retrying (unless the signature is bad).
     """
     payload = request.data  # raw bytes of the request body
@@ -182,37 +287,7 @@ def stripe_webhook():
         # Signature check failed (or payload wasn't valid JSON)
         return jsonify({"error": f"Invalid signature: {e}"}), 400
 
-    # We only care about successful checkout completions for now
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-
-        # The metadata we set when creating the checkout session
-        meta = session.get("metadata", {}) or {}
-        action = meta.get("action")
-        bike_id = int(meta.get("bike_id") or 0)
-        owner_id = int(meta.get("owner_id") or 0)
-
-        # If the webhook doesn't include what we expect, bail quietly
-        if not bike_id or not action:
-            return jsonify({"ok": True})  # ignore
-
-        bike = Bike.query.get(bike_id)
-        # Only modify if the bike exists and (optionally) still belongs to same owner
-        if not bike or (owner_id and bike.owner_id != owner_id):
-            return jsonify({"ok": True})  # ignore mismatched
-
-        now = _now_utc()
-        if action == "LISTING":
-            # First-time publish: mark active and set a fresh expiry
-            bike.is_active = True
-            bike.expires_at = now + timedelta(days=RENEW_DAYS)
-            db.session.commit()
-        elif action == "RENEW":
-            # Renewal: extend from the later of (now, current expiry)
-            base = bike.expires_at if (bike.expires_at and bike.expires_at > now) else now
-            bike.is_active = True
-            bike.expires_at = base + timedelta(days=RENEW_DAYS)
-            db.session.commit()
-
-    # Always 200 so Stripe doesn't retry (we handled or intentionally ignored the event)
-    return jsonify({"ok": True})
+    enqueue_stripe_event(event["id"], payload)
+
+    # Always 200 so Stripe doesn't retry (queued, or already queued/applied)
+    return jsonify({"ok": True, "queued": True})
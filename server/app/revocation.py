@@ -0,0 +1,105 @@
+# server/app/revocation.py
+# JWT revocation (logout, refresh-token rotation) without a DB read per request.
+#
+# Revoked token ids (jti) are written to the revoked_token table and mirrored
+# in each process as a dict jti -> exp, so the blocklist check that
+# flask-jwt-extended runs on every protected request is one dict lookup.
+# Revocations made by this process apply immediately; each process picks up
+# the others' by re-reading every unexpired row, at most every
+# REVOCATION_SYNC_INTERVAL seconds (that read runs inside whichever request
+# notices the interval has passed). The table only holds revoked tokens that
+# haven't expired yet, so it stays small; a full re-read also can't miss rows
+# the way an id cursor would (ids reused after pruning on SQLite, sequence ids
+# committed out of order on Postgres). Entries are dropped, in memory and in
+# the table, once the token they block has expired on its own.
+#
+# Refresh tokens rotate: /api/auth/refresh revokes the presented refresh token
+# before issuing a new pair, so each refresh token works exactly once. The
+# revoke is an INSERT that only one of two concurrent refreshes can win.
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from .models import db, RevokedToken
+
+DEFAULT_SYNC_INTERVAL = 5
+
+
+class RevocationList:
+    """Process-local mirror of revoked_token: jti -> exp (epoch seconds)."""
+
+    def __init__(self, sync_interval: float = DEFAULT_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._jtis = {}
+        self._next_sync = 0.0            # monotonic deadline; 0 = never synced
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jtis)
+
+    def add(self, jti: str, exp: int):
+        with self._lock:  # sync() iterates _jtis under the same lock
+            self._jtis[jti] = exp
+
+    def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() >= self._next_sync:
+            self.sync()
+        return jti in self._jtis
+
+    def sync(self):
+        """Merge in every unexpired row (revocations are never undone, so nothing is lost by merging)."""
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return  # another thread just did it
+            now = time.time()
+            rows = db.session.execute(
+                select(RevokedToken.jti, RevokedToken.expires_at)
+                .where(RevokedToken.expires_at >= datetime.utcfromtimestamp(now))
+            ).all()
+            for jti, expires_at in rows:
+                self._jtis[jti] = _epoch(expires_at)
+            # Expired tokens are rejected by their exp claim anyway
+            for jti in [j for j, exp in self._jtis.items() if exp < now]:
+                del self._jtis[jti]
+            self._next_sync = time.monotonic() + self.sync_interval
+
+
+def _epoch(naive_utc: datetime) -> int:
+    return int((naive_utc - datetime(1970, 1, 1)).total_seconds())
+
+
+def init_revocation(app, jwt):
+    """Attach the revocation list and register it as the JWT blocklist (config: REVOCATION_SYNC_INTERVAL)."""
+    revoked = RevocationList(app.config["REVOCATION_SYNC_INTERVAL"])
+    app.extensions["revoked_tokens"] = revoked
+
+    @jwt.token_in_blocklist_loader
+    def _is_revoked(jwt_header, jwt_payload):
+        return revoked.is_revoked(jwt_payload["jti"])
+
+
+def revoke_token(payload: dict) -> bool:
+    """
+    Revoke a decoded token (get_jwt() / decode_token() output) and commit.
+    Returns False if it was already revoked, e.g. by a concurrent refresh.
+    """
+    jti, exp = payload["jti"], int(payload["exp"])
+    expires_at = datetime.utcfromtimestamp(exp)
+    try:
+        db.session.execute(insert(RevokedToken).values(
+            jti=jti,
+            token_type=payload.get("type", "access"),
+            user_id=int(payload["sub"]) if payload.get("sub") is not None else None,
+            expires_at=expires_at,
+            revoked_at=datetime.utcnow(),
+        ))
+        # Keep the table as small as the set of still-valid revoked tokens
+        db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    current_app.extensions["revoked_tokens"].add(jti, exp)
+    return True
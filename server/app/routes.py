@@ -1,11 +1,21 @@
 from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from .models import Bike, Ride, UserProfile, RideAttendee, User
+from datetime import date, datetime, time as dt_time
+from .models import Bike, Ride, UserProfile, User, parse_ride_time
 from . import db
+from .cache import cached, invalidate
+from .conditional import conditional
+from .uploads import upload_in_use, remove_upload
+from .search import search_subquery, index_bike, unindex_bike, index_rider, rider_search_subquery
+from .rsvp import toggle_rsvp, RSVPConflict
+from .identity import current_email, current_profile, current_user_id, invalidate_identity
+from .geo import locate, distance_sq, within_radius, DEFAULT_RADIUS_MI, MAX_RADIUS_MI
+import math
 import os
 import re
-from sqlalchemy import func
+import json
+import base64
+from sqlalchemy import func, literal
 
 # -----------------------------------------------------------------------------
 # Blueprint
@@ -19,6 +29,12 @@ api_bp = Blueprint("api", __name__)
 def health():
     return jsonify({"ok": True})
 
+@api_bp.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters for the in-process response cache (per worker)."""
+    cache = current_app.extensions.get("response_cache")
+    return jsonify(cache.stats() if cache else {})
+
 # -----------------------------------------------------------------------------
 # Helpers (pure functions; easy to unit test)
 # -----------------------------------------------------------------------------
@@ -52,6 +68,75 @@ def _parse_frame_inches(size_text: str | None):
             return v
     return None
 
+# --- Keyset pagination helpers ----------------------------------------------
+# Cursors are opaque to clients: a urlsafe-base64 JSON list holding the sort
+# key of the last row on the previous page. Seeking past that key (instead of
+# OFFSET) keeps deep pages as cheap as page one.
+DEFAULT_PAGE_LIMIT = 24
+MAX_PAGE_LIMIT = 100
+
+def _parse_limit(raw, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    """Clamp a ?limit= value into [1, maximum]; fall back to default when invalid."""
+    v = _to_int(raw)
+    if v is None:
+        return default
+    return max(1, min(v, maximum))
+
+def _encode_cursor(*values):
+    """Pack sort-key values into an opaque, URL-safe cursor string."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(token: str | None):
+    """
+    Reverse of _encode_cursor. Returns the list of values, or None when the
+    token is missing. Raises ValueError on anything malformed.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("invalid cursor")
+    return values
+
+# --- Geo helpers --------------------------------------------------------------
+def _parse_near():
+    """
+    Parse ?near=<zip>&radius=<miles> (radius defaults to 25, capped at 500).
+    Returns (lat, lon, miles), or None when ?near= is absent.
+    Raises ValueError when the ZIP can't be placed.
+    """
+    code = (request.args.get("near") or "").strip()
+    if not code:
+        return None
+    lat, lon = locate(code)
+    if lat is None:
+        raise ValueError("unknown ZIP")
+    radius = _to_float(request.args.get("radius"))
+    miles = DEFAULT_RADIUS_MI if radius is None or radius <= 0 else min(radius, MAX_RADIUS_MI)
+    return lat, lon, miles
+
+def _near_or_none():
+    """_parse_near() for validators: a bad ZIP is left for the view to reject."""
+    try:
+        return _parse_near()
+    except ValueError:
+        return None
+
+def _within_near(q, model, near):
+    """?near= filter: bounding box on the geo index plus the radius, both in SQL."""
+    if near is None:
+        return q
+    return within_radius(q, model, *near)
+
+def _near_distance(model, near):
+    """Sort key for ?near= results: squared miles from the center (see geo.py)."""
+    return distance_sq(model, near[0], near[1]).label("dist_sq")
+
 # --- Photo helpers: we store up to 3 URLs on the Bike model as photo1/2/3 ----
 def _set_bike_photos(model: Bike, photos_list):
     """Assign up to 3 photo URLs onto model.photo1_url/photo2_url/photo3_url."""
@@ -70,7 +155,9 @@ def _get_bike_photos(model: Bike):
 def _delete_upload_file_if_local(url: str):
     """
     Best-effort cleanup helper. If the URL points to our local upload handler
-    ("/api/uploads/<filename>"), remove the file from UPLOAD_DIR.
+    ("/api/uploads/<filename>") and no listing references it any more, remove
+    the file (and its resized variants) from UPLOAD_DIR.
+    - Uploads are content-addressed, so two listings can share one file.
     - Swallows exceptions so delete operations don’t fail because of filesystem.
     - Validates the path to avoid deleting outside of UPLOAD_DIR.
     """
@@ -83,8 +170,11 @@ def _delete_upload_file_if_local(url: str):
         fname = url.rsplit("/", 1)[-1]
         path = os.path.join(uploads_dir, fname)
         # Safety: ensure resolved path remains inside UPLOAD_DIR
-        if os.path.abspath(path).startswith(os.path.abspath(uploads_dir)) and os.path.exists(path):
-            os.remove(path)
+        if not os.path.abspath(path).startswith(os.path.abspath(uploads_dir)):
+            return
+        if upload_in_use(url):
+            return
+        remove_upload(fname)
     except Exception:
         # Never block delete flow if cleanup fails
         pass
@@ -158,20 +248,22 @@ def create_bike():
     # Save up to 3 optional photos
     photos = data.get("photos") or []
     _set_bike_photos(b, photos)
+    b.lat, b.lon = locate(zip_full)
 
     db.session.add(b)
+    db.session.flush()   # assigns b.id for the search index
+    index_bike(b)
     db.session.commit()
+    invalidate("bikes")
     return jsonify(b.to_dict()), 201
 
-@api_bp.get("/bikes")
-def list_bikes():
+def _public_bikes_filter(q, near=None):
     """
-    Public index of ACTIVE, non-expired listings.
-    - Filters out drafts and expired items.
-    - Optional ?state=XX filter.
-    - Sorted newest first.
+    Apply the public-index WHERE clause to q: active, not expired, plus the
+    optional ?state=, ?min_price= / ?max_price= and ?height= (rider inches;
+    listings without a height range are kept), and the ?near= bounding box
+    when near=(lat, lon, miles) is given.
     """
-    q = Bike.query
     now = datetime.utcnow()
 
     # Only show active and not-yet-expired
@@ -184,8 +276,195 @@ def list_bikes():
     if state:
         q = q.filter(Bike.state == state)
 
-    bikes = q.order_by(Bike.created_at.desc()).all()
-    return jsonify([b.to_dict() for b in bikes])
+    # Optional price range (whole dollars)
+    min_price = _to_int(request.args.get("min_price"))
+    max_price = _to_int(request.args.get("max_price"))
+    if min_price is not None:
+        q = q.filter(Bike.price_usd >= min_price)
+    if max_price is not None:
+        q = q.filter(Bike.price_usd <= max_price)
+
+    # Optional rider height: the listing's recommended range must include it
+    height = _to_int(request.args.get("height"))
+    if height is not None:
+        q = q.filter((Bike.rider_height_min_in == None) | (Bike.rider_height_min_in <= height))
+        q = q.filter((Bike.rider_height_max_in == None) | (Bike.rider_height_max_in >= height))
+    return _within_near(q, Bike, near)
+
+# --- Facets -------------------------------------------------------------------
+# Categorical filters for the marketplace sidebar. Each accepts repeated or
+# comma-separated values (?bike_type=MTB&bike_type=Gravel or ?bike_type=MTB,Gravel).
+FACETS = ("bike_type", "wheel_size", "size", "frame_material", "condition")
+
+def _facet_selection():
+    """{facet: set(values)} for the facets present in the query string."""
+    selection = {}
+    for f in FACETS:
+        values = {v.strip() for raw in request.args.getlist(f) for v in raw.split(",") if v.strip()}
+        if values:
+            selection[f] = values
+    return selection
+
+def _apply_facets(q, selection):
+    for f, values in selection.items():
+        q = q.filter(getattr(Bike, f).in_(values))
+    return q
+
+def _facet_counts(fts, selection, near=None):
+    """
+    Per-facet value counts in ONE grouped query. We group the base result set
+    (everything except the facet selections) by all facet columns at once, then
+    fold the combinations in Python. Each facet's counts honour the *other*
+    facets' selections but not its own, so the sidebar can show how many
+    results picking another value would give. ?near= (box and radius) is part
+    of the base filter.
+    """
+    cols = [getattr(Bike, f) for f in FACETS]
+    q = _public_bikes_filter(
+        db.session.query(*cols, func.count(Bike.id), func.min(Bike.price_usd), func.max(Bike.price_usd)),
+        near,
+    )
+    if fts is not None:
+        q = q.join(fts, fts.c.bike_id == Bike.id)
+    combos = q.group_by(*cols).all()
+
+    counts = {f: {} for f in FACETS}
+    total, price_min, price_max = 0, None, None
+    for row in combos:
+        values = dict(zip(FACETS, row[:len(FACETS)]))
+        n, lo, hi = row[-3:]
+        matches = {f: values[f] in selection[f] for f in selection}
+        for f in FACETS:
+            if values[f] is not None and all(ok for o, ok in matches.items() if o != f):
+                counts[f][values[f]] = counts[f].get(values[f], 0) + n
+        if all(matches.values()):
+            total += n
+            if lo is not None:
+                price_min = lo if price_min is None else min(price_min, lo)
+                price_max = hi if price_max is None else max(price_max, hi)
+
+    return {
+        "total": total,
+        "price": {"min": price_min, "max": price_max},
+        **{
+            f: [{"value": v, "count": c} for v, c in sorted(counts[f].items(), key=lambda kv: (-kv[1], kv[0]))]
+            for f in FACETS
+        },
+    }
+
+def _bikes_list_version():
+    """
+    Conditional-GET validator: newest change + row count under the same filter.
+    ETag only: deleting the newest row moves max(updated_at) backwards, so a
+    Last-Modified built from it would answer If-Modified-Since with a stale 304.
+    """
+    latest, count = _public_bikes_filter(
+        db.session.query(func.max(func.coalesce(Bike.updated_at, Bike.created_at)), func.count(Bike.id)),
+        _near_or_none(),
+    ).one()
+    return (latest, count), None
+
+# @cached sits outside @conditional: a cache hit replays the stored ETag and
+# answers If-None-Match itself, without running the validator query.
+@api_bp.get("/bikes")
+@cached("bikes")
+@conditional(_bikes_list_version)
+def list_bikes():
+    """
+    Public index of ACTIVE, non-expired listings.
+    - Filters out drafts and expired items.
+    - Optional ?state=XX filter.
+    - Optional ?q= full-text search (title, brand, model, description,
+      drivetrain, brakes); results are then ranked by relevance.
+    - Optional facet filters (?bike_type=, ?wheel_size=, ?size=, ?frame_material=,
+      ?condition=) and ranges (?min_price=, ?max_price=, ?height=).
+    - ?facets=1 adds per-facet counts for the filter sidebar.
+    - Optional ?near=<zip>&radius=<miles> (default 25, max 500): only listings
+      within that distance, nearest first, each card with distance_mi.
+    - Sorted newest first (or by relevance / distance), keyset-paginated on
+      (created_at, id) / (rank, id) / (distance, id).
+    - ?limit=N (default 24, max 100) and ?cursor=<next_cursor from previous page>.
+    - Rows are card-sized (Bike.to_card_dict); GET /bikes/<id> has the full record.
+    - Served from the response cache; bike writes and the Stripe webhook invalidate it.
+
+    Returns:
+      { results: [...], next_cursor: "<opaque>" | null, facets?: {...} }
+    """
+    limit = _parse_limit(request.args.get("limit"))
+    fts = search_subquery(request.args.get("q") or "")
+    selection = _facet_selection()
+    try:
+        near = _parse_near()
+    except ValueError:
+        return jsonify({"error": "unknown ZIP for near"}), 400
+    try:
+        cursor = _decode_cursor(request.args.get("cursor"))
+        if cursor is not None:
+            numeric_key = fts is not None or near is not None
+            cursor_key = float(cursor[0]) if numeric_key else datetime.fromisoformat(cursor[0])
+            cursor_id = int(cursor[1])
+    except (ValueError, TypeError, IndexError):
+        return jsonify({"error": "invalid cursor"}), 400
+
+    if near is not None:
+        after = (cursor_key, cursor_id) if cursor is not None else None
+        body = _list_bikes_near(fts, selection, near, limit, after)
+    else:
+        q = _apply_facets(_public_bikes_filter(Bike.query.options(*Bike.card_options())), selection)
+
+        # Sort key: relevance when searching, otherwise recency
+        if fts is not None:
+            q = q.join(fts, fts.c.bike_id == Bike.id)
+            sort_col, seek_past = fts.c.rank, (lambda c, v: c > v)      # lower rank = better
+            order = (fts.c.rank.asc(), Bike.id.desc())
+        else:
+            sort_col, seek_past = Bike.created_at, (lambda c, v: c < v)
+            order = (Bike.created_at.desc(), Bike.id.desc())
+        q = q.add_columns(sort_col)
+
+        # Seek past the last row of the previous page (no OFFSET scan)
+        if cursor is not None:
+            q = q.filter(
+                seek_past(sort_col, cursor_key)
+                | ((sort_col == cursor_key) & (Bike.id < cursor_id))
+            )
+
+        # Fetch one extra row to learn whether another page exists
+        rows = q.order_by(*order).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last, key = rows[-1]
+            next_cursor = _encode_cursor(key if fts is not None else key.isoformat(), last.id)
+        body = {"results": [b.to_card_dict() for b, _ in rows], "next_cursor": next_cursor}
+
+    if request.args.get("facets") in ("1", "true"):
+        body["facets"] = _facet_counts(fts, selection, near)
+    return jsonify(body)
+
+def _list_bikes_near(fts, selection, near, limit, after):
+    """
+    ?near= page: box + radius through ix_bike_active_geo, ordered and
+    limited in SQL on (squared distance, id). after=(dist_sq, id) of the
+    previous page's last row, or None.
+    """
+    dist_sq = _near_distance(Bike, near)
+    q = _apply_facets(_public_bikes_filter(Bike.query.options(*Bike.card_options()), near), selection)
+    if fts is not None:
+        q = q.join(fts, fts.c.bike_id == Bike.id)
+    q = q.add_columns(dist_sq)
+    if after:
+        q = q.filter((dist_sq > after[0]) | ((dist_sq == after[0]) & (Bike.id > after[1])))
+
+    rows = q.order_by(dist_sq, Bike.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    results = []
+    for bike, d2 in rows:
+        card = bike.to_card_dict()
+        card["distance_mi"] = round(math.sqrt(d2), 1)
+        results.append(card)
+    return {"results": results, "next_cursor": _encode_cursor(rows[-1][1], rows[-1][0].id) if more else None}
 
 @api_bp.get("/bikes/mine")
 @jwt_required()
@@ -199,7 +478,15 @@ def list_my_bikes():
     bikes = Bike.query.filter_by(owner_id=uid).order_by(Bike.created_at.desc()).all()
     return jsonify([b.to_dict() for b in bikes])
 
+def _bike_version(bike_id: int):
+    row = db.session.query(Bike.updated_at, Bike.created_at).filter(Bike.id == bike_id).first()
+    if not row:
+        return None  # let the view produce its 404
+    stamp = row.updated_at or row.created_at
+    return (stamp,), stamp
+
 @api_bp.get("/bikes/<int:bike_id>")
+@conditional(_bike_version)
 def get_bike(bike_id: int):
     """
     Public detail view for a single listing (drafts are still fetchable by ID).
@@ -249,6 +536,7 @@ def update_bike(bike_id: int):
     if "zip" in data:
         z = (data.get("zip") or "").strip()
         b.zip = z[:5] if z.isdigit() and len(z) >= 5 else None
+        b.lat, b.lon = locate(b.zip)
     if "description" in data: b.description = (data.get("description") or "").strip() or None
 
     # ---- Optional numeric/extras
@@ -266,11 +554,20 @@ def update_bike(bike_id: int):
     if "weight_lb" in data: b.weight_lb = _to_float(data.get("weight_lb"))
 
     # ---- Photos (replace entire set if supplied)
+    dropped_photos = []
     if "photos" in data:
         photos = data.get("photos") or []
+        before = _get_bike_photos(b)
         _set_bike_photos(b, photos)
+        dropped_photos = [u for u in before if u not in _get_bike_photos(b)]
 
+    index_bike(b)
     db.session.commit()
+    invalidate("bikes")
+
+    # Remove files this edit orphaned (after commit, so the reference check sees it)
+    for u in dropped_photos:
+        _delete_upload_file_if_local(u)
     return jsonify(b.to_dict()), 200
 
 @api_bp.delete("/bikes/<int:bike_id>")
@@ -288,12 +585,15 @@ def delete_bike(bike_id: int):
     if b.owner_id != user_id:
         return jsonify({"error": "Forbidden"}), 403
 
-    # Best-effort cleanup of uploaded files
-    for u in _get_bike_photos(b):
-        _delete_upload_file_if_local(u)
-
+    photos = _get_bike_photos(b)
+    unindex_bike(b.id)
     db.session.delete(b)
     db.session.commit()
+    invalidate("bikes")
+
+    # Best-effort cleanup of uploaded files no other listing shares
+    for u in photos:
+        _delete_upload_file_if_local(u)
     return jsonify({"ok": True}), 200
 
 # -----------------------------------------------------------------------------
@@ -308,6 +608,8 @@ def rider_directory():
       - ?state=NJ
       - ?level=Beginner|Intermediate|Advanced
       - ?q= (search email or zip prefix)
+      - ?near=<zip>&radius=<miles> (default 25): riders within that distance,
+        nearest first, each with distance_mi
 
     Returns:
       { total, results: [{ first_name, email, zip_prefix, state, experience_level }] }
@@ -315,6 +617,10 @@ def rider_directory():
     state = (request.args.get("state") or "").strip().upper()[:2]
     level = (request.args.get("level") or "").strip()
     q = (request.args.get("q") or "").strip()
+    try:
+        near = _parse_near()
+    except ValueError:
+        return jsonify({"error": "unknown ZIP for near"}), 400
 
     # pagination
     try:
@@ -331,32 +637,37 @@ def rider_directory():
         .join(User, User.id == UserProfile.user_id)
     )
 
+    # state is stored uppercased by update_profile, so compare the raw column
+    # (wrapping it in UPPER() would defeat ix_user_profile_state_level)
     if state:
-        query = query.filter(func.upper(UserProfile.state) == state)
+        query = query.filter(UserProfile.state == state)
 
     if level:
         query = query.filter(UserProfile.experience_level == level)
 
-    if q:
-        like = f"%{q.lower()}%"
-        query = query.filter(
-            db.or_(
-                func.lower(User.email).like(like),
-                func.lower(UserProfile.zip_prefix).like(like),
-            )
-        )
+    # Substring match on email / ZIP prefix via the trigram index (search.py)
+    match = rider_search_subquery(q)
+    if match is not None:
+        query = query.join(match, match.c.profile_id == UserProfile.id)
 
-    total = query.count()
+    if near is not None:
+        # Box + radius on ix_user_profile_geo, nearest first, all in SQL
+        query = _within_near(query, UserProfile, near)
+        dist_sq = _near_distance(UserProfile, near)
+        ordered = query.add_columns(dist_sq).order_by(dist_sq, UserProfile.id)
+    else:
+        ordered = query.add_columns(literal(None).label("dist_sq")).order_by(User.created_at.desc(), User.id.desc())
 
-    rows = (
-        query.order_by(User.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
+    # The total rides along on every row (COUNT(*) OVER ()), so the page
+    # and its total come back in one statement instead of page + count().
+    rows = ordered.add_columns(func.count().over().label("total")).limit(limit).offset(offset).all()
+    if rows:
+        total = rows[0].total
+    else:
+        total = query.count() if offset else 0   # paged past the end
 
     results = []
-    for prof, user in rows:
+    for prof, user, d2, _ in rows:
         # You don't currently store first_name; use email prefix for demo.
         first_name = (user.email.split("@")[0] if user.email else "")
         results.append(
@@ -370,14 +681,27 @@ def rider_directory():
                 level=prof.experience_level,  # alias so frontends can use either key
             )
         )
+        if d2 is not None:
+            results[-1]["distance_mi"] = round(math.sqrt(d2), 1)
 
     return jsonify({"total": total, "results": results}), 200
 
 # -----------------------------------------------------------------------------
 # Rides
 # -----------------------------------------------------------------------------
+def _ride_version(ride_id):
+    row = db.session.query(Ride.updated_at, Ride.created_at, Ride.owner_id).filter(Ride.id == ride_id).first()
+    if not row:
+        return None
+    # Owners get the attendee list, so their representation differs from the public one
+    current_user_id = get_jwt_identity()
+    is_owner = current_user_id is not None and row.owner_id == int(current_user_id)
+    stamp = row.updated_at or row.created_at
+    return (stamp, is_owner), stamp
+
 @api_bp.get("/rides/<int:ride_id>")
 @jwt_required(optional=True)
+@conditional(_ride_version)
 def ride_detail(ride_id):
     """
     Public ride detail. If the requester is the ride owner (JWT present and
@@ -396,38 +720,126 @@ def ride_detail(ride_id):
 def rsvp_toggle(ride_id):
     """
     Toggle RSVP for the current user.
-    - If already RSVP’d → remove (200).
-    - If not RSVP’d → add (201).
+    - If already RSVP’d (or waitlisted) → remove (200). A freed seat goes to
+      the first person on the waitlist (promoted_user_id).
+    - If not RSVP’d → add (201, status "added"), or join the waitlist when the
+      ride is at capacity (201, status "waitlisted").
+    - Atomic per request (see rsvp.py): concurrent toggles never 500 on
+      uq_ride_user; a toggle that keeps losing races gets a 409 to retry.
     """
-    ride = Ride.query.get(ride_id)
-    if not ride:
+    if db.session.get(Ride, ride_id) is None:
         return jsonify({"error": "Ride not found"}), 404
 
-    user_id = int(get_jwt_identity())
+    try:
+        result = toggle_rsvp(ride_id, int(get_jwt_identity()))
+    except RSVPConflict:
+        return jsonify({"error": "RSVP changed concurrently, please retry"}), 409
+    invalidate("rides")
+    return jsonify({"ok": True, **result}), 200 if result["status"] == "removed" else 201
 
-    existing = RideAttendee.query.filter_by(ride_id=ride_id, user_id=user_id).first()
-    if existing:
-        db.session.delete(existing)
-        db.session.commit()
-        return jsonify({"ok": True, "status": "removed"}), 200
-    else:
-        db.session.add(RideAttendee(ride_id=ride_id, user_id=user_id))
-        db.session.commit()
-        return jsonify({"ok": True, "status": "added"}), 201
+def _ride_window():
+    """
+    (from, to) dates for the ride list. ?from= defaults to today (UTC), so past
+    rides drop off on their own; ?to= is optional and inclusive.
+    Raises ValueError on a malformed date.
+    """
+    raw_from = (request.args.get("from") or "").strip()
+    raw_to = (request.args.get("to") or "").strip()
+    start = date.fromisoformat(raw_from) if raw_from else datetime.utcnow().date()
+    end = date.fromisoformat(raw_to) if raw_to else None
+    return start, end
+
+def _rides_filter(q, window, near=None):
+    start, end = window
+    q = q.filter(Ride.date >= start)
+    if end is not None:
+        q = q.filter(Ride.date <= end)
+    state = (request.args.get("state") or "").strip().upper()[:2]
+    if state:
+        q = q.filter(Ride.state == state)
+    return _within_near(q, Ride, near)
+
+def _rides_list_version():
+    try:
+        window = _ride_window()
+    except ValueError:
+        return None  # list_rides answers with a 400
+    latest, count = _rides_filter(
+        db.session.query(func.max(func.coalesce(Ride.updated_at, Ride.created_at)), func.count(Ride.id)),
+        window,
+        _near_or_none(),
+    ).one()
+    # the default window moves with the calendar, so it is part of the version;
+    # ETag only, like _bikes_list_version
+    return (latest, count, window[0]), None
 
 @api_bp.get("/rides")
+@cached("rides")
+@conditional(_rides_list_version)
 def list_rides():
     """
-    Public list of rides (optionally filter by state).
-    - Sorted soonest first (date/time ascending).
+    Public list of upcoming rides (optionally filter by state).
+    - Date window: ?from=YYYY-MM-DD (default today) and optional ?to=YYYY-MM-DD.
+    - Optional ?near=<zip>&radius=<miles> (default 25): only rides within that
+      distance, each with distance_mi.
+    - Sorted soonest first, keyset-paginated on (date, start_time, id) via
+      ix_ride_date_start / ix_ride_state_date_start.
+    - ?limit=N (default 24, max 100) and ?cursor=<next_cursor from previous page>.
     - Each ride dict carries attendee_count.
+    - Served from the response cache; RSVP and ride writes invalidate it.
+
+    Returns:
+      { results: [...], next_cursor: "<opaque>" | null }
     """
-    state = (request.args.get("state") or "").strip().upper()[:2]
-    q = Ride.query
-    if state:
-        q = q.filter(Ride.state == state)
-    rides = q.order_by(Ride.date.asc(), Ride.time.asc()).all()
-    return jsonify([r.to_dict() for r in rides])
+    limit = _parse_limit(request.args.get("limit"))
+    try:
+        near = _parse_near()
+    except ValueError:
+        return jsonify({"error": "unknown ZIP for near"}), 400
+    try:
+        window = _ride_window()
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    try:
+        cursor = _decode_cursor(request.args.get("cursor"))
+        if cursor is not None:
+            cursor_date = date.fromisoformat(cursor[0])
+            cursor_time = dt_time.fromisoformat(cursor[1])
+            cursor_id = int(cursor[2])
+    except (ValueError, TypeError, IndexError):
+        return jsonify({"error": "invalid cursor"}), 400
+
+    q = _rides_filter(Ride.query, window, near)
+    if cursor is not None:
+        q = q.filter(
+            (Ride.date > cursor_date)
+            | ((Ride.date == cursor_date) & (
+                (Ride.start_time > cursor_time)
+                | ((Ride.start_time == cursor_time) & (Ride.id > cursor_id))
+            ))
+        )
+    q = q.order_by(Ride.date.asc(), Ride.start_time.asc(), Ride.id.asc())
+
+    if near is None:
+        rides = q.limit(limit + 1).all()
+        distances = {}
+    else:
+        rows = q.add_columns(_near_distance(Ride, near)).limit(limit + 1).all()
+        rides = [r for r, _ in rows]
+        distances = {r.id: round(math.sqrt(d2), 1) for r, d2 in rows}
+
+    next_cursor = None
+    if len(rides) > limit:
+        rides = rides[:limit]
+        last = rides[-1]
+        next_cursor = _encode_cursor(last.date.isoformat(), last.start_time.isoformat(), last.id)
+
+    results = []
+    for r in rides:
+        results.append(r.to_dict())
+        if r.id in distances:
+            results[-1]["distance_mi"] = distances[r.id]
+    return jsonify({"results": results, "next_cursor": next_cursor})
 
 @api_bp.post("/rides")
 @jwt_required()
@@ -435,6 +847,7 @@ def create_ride():
     """
     Create a new ride (requires auth).
     - title and date are required (date is ISO 'YYYY-MM-DD').
+    - optional capacity (positive integer); RSVPs past it are waitlisted.
     - owner_id set from JWT.
     """
     data = request.get_json() or {}
@@ -444,10 +857,25 @@ def create_ride():
         return jsonify({"error": "title and date are required"}), 400
     state = (data.get("state") or "").strip().upper()[:2] or None
 
+    capacity = None
+    if data.get("capacity") not in (None, ""):
+        capacity = _to_int(data.get("capacity"))
+        if capacity is None or capacity < 1:
+            return jsonify({"error": "capacity must be a positive whole number"}), 400
+
+    # Normalize the free-text time to HH:MM when we can read it; start_time is
+    # the sortable copy (midnight = no/unknown time)
+    time_text = (data.get("time") or "").strip()
+    start_time = parse_ride_time(time_text)
+    if start_time is not None:
+        time_text = start_time.strftime("%H:%M")
+
     r = Ride(
         title=title,
         date=datetime.fromisoformat(date).date(),  # store as date object
-        time=(data.get("time") or "").strip() or None,
+        time=time_text[:10] or None,
+        start_time=start_time or dt_time(0, 0),
+        capacity=capacity,
         difficulty=(data.get("difficulty") or "").strip() or None,
         terrain=(data.get("terrain") or "").strip() or None,
         zip_prefix=(data.get("zip_prefix") or "").strip()[:3] or None,
@@ -455,8 +883,10 @@ def create_ride():
         description=(data.get("description") or "").strip() or None,
         owner_id=int(get_jwt_identity())
     )
+    r.lat, r.lon = locate(r.zip_prefix)
     db.session.add(r)
     db.session.commit()
+    invalidate("rides")
     return jsonify(r.to_dict()), 201
 
 # -----------------------------------------------------------------------------
@@ -469,13 +899,18 @@ def get_profile():
     Fetch the current user's profile.
     - If it doesn’t exist yet, create an empty profile automatically.
     """
-    user_id = int(get_jwt_identity())
-    prof = UserProfile.query.filter_by(user_id=user_id).first()
-    if not prof:
-        # Auto-create an empty profile on first access
-        prof = UserProfile(user_id=user_id)
-        db.session.add(prof)
-        db.session.commit()
+    profile = current_profile()
+    if profile is not None:
+        return jsonify(profile)
+
+    # Auto-create an empty profile on first access
+    user_id = current_user_id()
+    prof = UserProfile(user_id=user_id)
+    db.session.add(prof)
+    db.session.flush()
+    index_rider(prof, current_email())
+    db.session.commit()
+    invalidate_identity(user_id, "profile")
     return jsonify(prof.to_dict())
 
 @api_bp.put("/profile")
@@ -502,11 +937,15 @@ def update_profile():
 
     zp = (data.get("zip_prefix") or "").strip()
     prof.zip_prefix = zp[:5] or None
+    prof.lat, prof.lon = locate(prof.zip_prefix)
 
     prof.experience_level = (data.get("experience_level") or "").strip() or None
     prof.bike = (data.get("bike") or "").strip() or None
     prof.phone = (data.get("phone") or "").strip() or None
     prof.contact_email = (data.get("contact_email") or "").strip() or None
 
+    db.session.flush()
+    index_rider(prof, current_email())
     db.session.commit()
+    invalidate_identity(user_id, "profile")
     return jsonify(prof.to_dict()), 200
@@ -0,0 +1,185 @@
+# server/app/rsvp.py
+# Atomic RSVP toggle with ride capacity and a FIFO waitlist.
+#
+# The old toggle did SELECT, then INSERT or DELETE. Two clicks (or two
+# workers) could both see "not RSVP'd", and the loser hit uq_ride_user as a
+# 500. Each toggle now decides with single write statements, so the database
+# arbitrates instead of a stale read:
+#
+#   leave: DELETE ... WHERE ride_id = ? AND user_id = ? RETURNING status
+#          A row came back: the user was on the ride (or its waitlist) and is
+#          now removed. A freed seat goes to the oldest waitlisted RSVP.
+#   join:  UPDATE ride SET attendee_count = attendee_count + 1
+#            WHERE id = ? AND (capacity IS NULL OR attendee_count < capacity)
+#          claims a seat atomically (one row = seated, none = waitlisted), then
+#          INSERT ... ON CONFLICT (ride_id, user_id) DO NOTHING RETURNING id.
+#          Nothing came back: a concurrent toggle inserted first, so roll back
+#          (releasing the seat) and start over; the next pass deletes.
+#
+# Seat accounting lives in ride.attendee_count / ride.waitlist_count, never a
+# COUNT(*). Every toggle first touches the ride row (a no-op counter UPDATE),
+# before it deletes or inserts an attendee row, so on Postgres the ride's row
+# lock serializes concurrent RSVPs for one ride across workers and locks are
+# always taken in the same order: ride, then attendee rows (SQLite's database
+# write lock does the same). A deadlock or serialization failure that slips
+# through anyway is rolled back and retried like a lost insert race.
+#
+# Dialects without RETURNING or ON CONFLICT fall back to a read + rowcount and
+# to a plain INSERT inside a SAVEPOINT, retried on IntegrityError.
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from . import db
+from .models import Ride, RideAttendee
+
+MAX_ATTEMPTS = 3
+
+# SQLSTATEs worth retrying: serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = ("40001", "40P01")
+
+GOING, WAITLISTED = RideAttendee.GOING, RideAttendee.WAITLISTED
+
+
+class RSVPConflict(Exception):
+    """The toggle kept losing races; the caller should ask the client to retry."""
+
+
+def _is_retryable(error: OperationalError) -> bool:
+    """True for a Postgres deadlock / serialization failure (psycopg2 pgcode or psycopg 3 sqlstate)."""
+    orig = error.orig
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) in RETRYABLE_SQLSTATES
+
+
+def _delete_attendee(ride_id: int, user_id: int):
+    """Remove the RSVP. Returns its status ("going"/"waitlisted"), or None if there was none."""
+    where = (RideAttendee.ride_id == ride_id, RideAttendee.user_id == user_id)
+    opts = {"synchronize_session": False}
+    if db.engine.dialect.delete_returning:
+        row = db.session.execute(
+            delete(RideAttendee).where(*where).returning(RideAttendee.status), execution_options=opts
+        ).first()
+        if row is None:
+            return None
+        status = row[0]
+    else:
+        status = db.session.execute(select(RideAttendee.status).where(*where)).scalar()
+        if not db.session.execute(delete(RideAttendee).where(*where), execution_options=opts).rowcount:
+            return None
+    return WAITLISTED if status == WAITLISTED else GOING
+
+
+def _insert_attendee(ride_id: int, user_id: int, status: str) -> bool:
+    """True if this call inserted the row, False if it already existed."""
+    values = {"ride_id": ride_id, "user_id": user_id, "status": status, "created_at": datetime.utcnow()}
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = (
+            upsert(RideAttendee.__table__)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=["ride_id", "user_id"])
+            .returning(RideAttendee.__table__.c.id)
+        )
+        return db.session.execute(stmt).first() is not None
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(RideAttendee.__table__).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _bump_ride(ride_id: int, *conditions, **counters):
+    """
+    UPDATE the ride's counters (e.g. attendee_count=+1) and updated_at, which
+    is part of the ride's representation (ETags, cached lists). Returns the
+    number of rows matched, so extra conditions make it a compare-and-set.
+    """
+    values = {name: func.coalesce(getattr(Ride, name), 0) + delta for name, delta in counters.items()}
+    return db.session.execute(
+        update(Ride).where(Ride.id == ride_id, *conditions).values(updated_at=datetime.utcnow(), **values),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+
+def _promote_next(ride_id: int):
+    """
+    Seat the oldest waitlisted RSVP. Returns its user_id, or None if the
+    waitlist is empty. Rows locked by another transaction are skipped
+    (Postgres; SQLite serializes writers anyway).
+    """
+    row = db.session.execute(
+        select(RideAttendee.id, RideAttendee.user_id)
+        .where(RideAttendee.ride_id == ride_id, RideAttendee.status == WAITLISTED)
+        .order_by(RideAttendee.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if row is None:
+        return None
+    db.session.execute(
+        update(RideAttendee).where(RideAttendee.id == row.id).values(status=GOING),
+        execution_options={"synchronize_session": False},
+    )
+    return row.user_id
+
+
+def _leave(ride_id: int, status: str):
+    if status == WAITLISTED:
+        _bump_ride(ride_id, waitlist_count=-1)
+        return None
+    # The ride row is already locked (toggle_rsvp); hand the seat down the waitlist
+    promoted = _promote_next(ride_id)
+    if promoted is None:
+        _bump_ride(ride_id, attendee_count=-1)
+    else:
+        _bump_ride(ride_id, waitlist_count=-1)
+    return promoted
+
+
+def _join(ride_id: int):
+    seated = _bump_ride(
+        ride_id,
+        (Ride.capacity == None) | (func.coalesce(Ride.attendee_count, 0) < Ride.capacity),
+        attendee_count=1,
+    )
+    if seated:
+        return GOING
+    _bump_ride(ride_id, waitlist_count=1)
+    return WAITLISTED
+
+
+def toggle_rsvp(ride_id: int, user_id: int) -> dict:
+    """
+    Flip user_id's RSVP for ride_id and commit.
+    Returns {"status": "added" | "waitlisted" | "removed", "promoted_user_id"?}.
+    Raises RSVPConflict if concurrent toggles keep winning the race.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            _bump_ride(ride_id)   # lock the ride row before any attendee row
+            removed = _delete_attendee(ride_id, user_id)
+            if removed is not None:
+                result = {"status": "removed"}
+                promoted = _leave(ride_id, removed)
+                if promoted is not None:
+                    result["promoted_user_id"] = promoted
+            else:
+                status = _join(ride_id)
+                if not _insert_attendee(ride_id, user_id, status):
+                    db.session.rollback()   # gives back the seat / waitlist slot
+                    continue
+                result = {"status": "added" if status == GOING else "waitlisted"}
+            db.session.commit()
+            return result
+        except IntegrityError:
+            db.session.rollback()
+        except OperationalError as e:
+            db.session.rollback()
+            if not _is_retryable(e):
+                raise
+    raise RSVPConflict(f"RSVP for ride {ride_id} kept conflicting")
@@ -0,0 +1,102 @@
+# server/app/schema.py
+# Brings an existing database up to date with the models.
+#
+# db.create_all() only creates tables that are missing, so a long-lived dev.db
+# (or the Render Postgres instance) never picks up columns or indexes added to
+# the models later. upgrade_schema() fills the gap:
+#   - ensure_columns(): ALTER TABLE ... ADD COLUMN for new nullable columns
+#   - ensure_indexes(): CREATE INDEX for indexes declared on the models
+#   - drop_retired_indexes(): DROP INDEX for indexes the models no longer
+#     declare (listed in RETIRED_INDEXES), which would otherwise be kept and
+#     updated on every write for nothing
+# create_app() runs it right after create_all(), so deploying the new code is
+# enough to upgrade an existing database.
+from sqlalchemy import inspect
+from . import db
+
+# table -> indexes replaced by newer ones on the models
+RETIRED_INDEXES = {
+    # ride listing now sorts on start_time (ix_ride_date_start / ix_ride_state_date_start)
+    "ride": ("ix_ride_date_time", "ix_ride_state_date_time"),
+}
+
+
+def ensure_columns(engine=None):
+    """
+    Add model columns that are missing from existing tables.
+    Only nullable columns can be added this way (existing rows get NULL);
+    anything else needs a real migration and is reported, not applied.
+    Returns the list of "table.column" names that were added.
+    """
+    engine = engine or db.engine
+    added = []
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        existing_tables = set(insp.get_table_names())
+        quote = conn.dialect.identifier_preparer.quote
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in present:
+                    continue
+                if not col.nullable:
+                    raise RuntimeError(
+                        f"Cannot auto-add NOT NULL column {table.name}.{col.name}; migrate manually"
+                    )
+                ddl = (
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD COLUMN {quote(col.name)} {col.type.compile(dialect=conn.dialect)}"
+                )
+                conn.exec_driver_sql(ddl)
+                added.append(f"{table.name}.{col.name}")
+    return added
+
+
+def ensure_indexes(engine=None):
+    """
+    Create any model-declared index that is missing from the live database.
+    Works on SQLite and Postgres (partial indexes use the dialect-specific WHERE).
+    Returns the list of index names that were created.
+    """
+    engine = engine or db.engine
+    created = []
+    with engine.begin() as conn:
+        existing_tables = set(inspect(conn).get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue  # create_all() will build it (and its indexes) from scratch
+            present = {ix["name"] for ix in inspect(conn).get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in present:
+                    continue
+                index.create(bind=conn, checkfirst=True)
+                created.append(index.name)
+    return created
+
+
+def drop_retired_indexes(engine=None):
+    """
+    Drop the RETIRED_INDEXES that still exist in the live database.
+    Returns the list of index names that were dropped.
+    """
+    engine = engine or db.engine
+    dropped = []
+    with engine.begin() as conn:
+        existing_tables = set(inspect(conn).get_table_names())
+        quote = conn.dialect.identifier_preparer.quote
+        for table, names in RETIRED_INDEXES.items():
+            if table not in existing_tables:
+                continue
+            present = {ix["name"] for ix in inspect(conn).get_indexes(table)}
+            for name in names:
+                if name in present:
+                    conn.exec_driver_sql(f"DROP INDEX {quote(name)}")
+                    dropped.append(name)
+    return dropped
+
+
+def upgrade_schema(engine=None):
+    """Apply every upgrade (columns first, since indexes may use them; retired indexes last)."""
+    return ensure_columns(engine) + ensure_indexes(engine) + drop_retired_indexes(engine)
@@ -0,0 +1,188 @@
+# server/app/search.py
+# Full-text search over bike listings (?q= on GET /api/bikes).
+#
+# Backed by a real inverted index on each supported database:
+#   - SQLite:   an FTS5 virtual table `bike_fts` (rowid = bike.id), ranked by bm25().
+#               Kept in sync by index_bike()/unindex_bike(), which create_bike,
+#               update_bike and delete_bike call inside their transaction.
+#   - Postgres: a STORED generated tsvector column `bike.search_tsv` with a GIN
+#               index, ranked by ts_rank_cd(). The database keeps it in sync, so
+#               the hooks are no-ops there.
+# Both are created together with the bike table (create_all) and, for existing
+# databases, by ensure_search_index() at startup.
+#
+# Rider directory search (?q= on GET /api/riders) is a substring match on email
+# or ZIP prefix, so it uses trigram indexes instead of words:
+#   - SQLite:   an FTS5 table `rider_fts` with the trigram tokenizer
+#               (rowid = user_profile.id), kept in sync by index_rider().
+#   - Postgres: pg_trgm GIN indexes on lower(users.email) and
+#               lower(user_profile.zip_prefix), which serve LIKE '%q%' directly.
+# Trigrams need at least 3 characters; shorter queries fall back to LIKE.
+import re
+from sqlalchemy import DDL, Float, Integer, event, func, literal, or_, select, text, union
+from . import db
+from .models import Bike, User, UserProfile
+
+# Columns that feed the index, and their relative weight in ranking
+SEARCH_COLUMNS = ("title", "brand", "model", "description", "drivetrain_rear", "brakes_model")
+_SQLITE_WEIGHTS = (10.0, 5.0, 5.0, 1.0, 2.0, 2.0)
+
+_SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bike_fts USING fts5("
+    + ", ".join(SEARCH_COLUMNS)
+    + ", tokenize='porter unicode61')"
+)
+_PG_ADD_COLUMN = """
+ALTER TABLE bike ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(brand, '') || ' ' || coalesce(model, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(drivetrain_rear, '') || ' ' || coalesce(brakes_model, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'D')
+) STORED
+"""
+_PG_ADD_INDEX = "CREATE INDEX IF NOT EXISTS ix_bike_search_tsv ON bike USING GIN (search_tsv)"
+
+# Keep the index's lifecycle tied to the bike table (create_all / drop_all)
+event.listen(Bike.__table__, "after_create", DDL(_SQLITE_CREATE).execute_if(dialect="sqlite"))
+event.listen(Bike.__table__, "after_create", DDL(_PG_ADD_COLUMN).execute_if(dialect="postgresql"))
+event.listen(Bike.__table__, "after_create", DDL(_PG_ADD_INDEX).execute_if(dialect="postgresql"))
+event.listen(Bike.__table__, "after_drop", DDL("DROP TABLE IF EXISTS bike_fts").execute_if(dialect="sqlite"))
+
+_RIDER_SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS rider_fts USING fts5(email, zip_prefix, tokenize='trigram')"
+)
+_RIDER_PG_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING GIN (lower(email) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_user_profile_zip_trgm ON user_profile USING GIN (lower(zip_prefix) gin_trgm_ops)",
+)
+MIN_TRIGRAM_QUERY = 3
+
+event.listen(UserProfile.__table__, "after_create", DDL(_RIDER_SQLITE_CREATE).execute_if(dialect="sqlite"))
+event.listen(UserProfile.__table__, "after_drop", DDL("DROP TABLE IF EXISTS rider_fts").execute_if(dialect="sqlite"))
+for _ddl in _RIDER_PG_DDL:
+    event.listen(UserProfile.__table__, "after_create", DDL(_ddl).execute_if(dialect="postgresql"))
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def ensure_search_index():
+    """Create the index on an existing database and backfill it if it is new/empty."""
+    dialect = _dialect()
+    with db.engine.begin() as conn:
+        if dialect == "sqlite":
+            conn.exec_driver_sql(_SQLITE_CREATE)
+            indexed = conn.exec_driver_sql("SELECT count(*) FROM bike_fts").scalar()
+            if not indexed:
+                cols = ", ".join(SEARCH_COLUMNS)
+                conn.exec_driver_sql(f"INSERT INTO bike_fts(rowid, {cols}) SELECT id, {cols} FROM bike")
+            conn.exec_driver_sql(_RIDER_SQLITE_CREATE)
+            if not conn.exec_driver_sql("SELECT count(*) FROM rider_fts").scalar():
+                conn.exec_driver_sql(
+                    "INSERT INTO rider_fts(rowid, email, zip_prefix) "
+                    "SELECT p.id, u.email, p.zip_prefix FROM user_profile p JOIN users u ON u.id = p.user_id"
+                )
+        elif dialect == "postgresql":
+            conn.exec_driver_sql(_PG_ADD_COLUMN)  # generated column backfills itself
+            conn.exec_driver_sql(_PG_ADD_INDEX)
+            for ddl in _RIDER_PG_DDL:
+                conn.exec_driver_sql(ddl)
+
+
+def index_bike(bike: Bike):
+    """(Re)index one listing. Call after flush (needs bike.id), before commit."""
+    if _dialect() != "sqlite":
+        return
+    unindex_bike(bike.id)
+    cols = ", ".join(SEARCH_COLUMNS)
+    binds = ", ".join(f":{c}" for c in SEARCH_COLUMNS)
+    db.session.execute(
+        text(f"INSERT INTO bike_fts(rowid, {cols}) VALUES (:id, {binds})"),
+        {"id": bike.id, **{c: getattr(bike, c) for c in SEARCH_COLUMNS}},
+    )
+
+
+def unindex_bike(bike_id: int):
+    if _dialect() != "sqlite":
+        return
+    db.session.execute(text("DELETE FROM bike_fts WHERE rowid = :id"), {"id": bike_id})
+
+
+def _terms(q: str):
+    """Split user input into plain word tokens (drops FTS operators/quotes)."""
+    return re.findall(r"\w+", q.lower())[:10]
+
+
+def search_subquery(q: str):
+    """
+    Subquery of (bike_id, rank) for listings matching q, best match = lowest
+    rank. Returns None when q has no searchable words.
+    """
+    terms = _terms(q)
+    if not terms:
+        return None
+    dialect = _dialect()
+
+    if dialect == "sqlite":
+        # every word must match; trailing * = prefix match ("shim" -> "shimano")
+        match = " AND ".join(f'"{t}"*' for t in terms)
+        weights = ", ".join(str(w) for w in _SQLITE_WEIGHTS)
+        stmt = text(
+            f"SELECT rowid AS bike_id, bm25(bike_fts, {weights}) AS rank "
+            "FROM bike_fts WHERE bike_fts MATCH :match"
+        ).bindparams(match=match)
+    elif dialect == "postgresql":
+        tsq = " & ".join(f"{t}:*" for t in terms)
+        stmt = text(
+            "SELECT id AS bike_id, -ts_rank_cd(search_tsv, to_tsquery('english', :tsq)) AS rank "
+            "FROM bike WHERE search_tsv @@ to_tsquery('english', :tsq)"
+        ).bindparams(tsq=tsq)
+    else:
+        # Unindexed fallback for other databases: every word in some column
+        conds = [or_(*(getattr(Bike, c).ilike(f"%{t}%") for c in SEARCH_COLUMNS)) for t in terms]
+        return select(Bike.id.label("bike_id"), literal(0.0, Float).label("rank")).where(*conds).subquery("fts")
+
+    return stmt.columns(bike_id=Integer, rank=Float).subquery("fts")
+
+
+def index_rider(profile: UserProfile, email: str):
+    """(Re)index one directory entry. Call after flush (needs profile.id), before commit."""
+    if _dialect() != "sqlite":
+        return
+    db.session.execute(text("DELETE FROM rider_fts WHERE rowid = :id"), {"id": profile.id})
+    db.session.execute(
+        text("INSERT INTO rider_fts(rowid, email, zip_prefix) VALUES (:id, :email, :zip_prefix)"),
+        {"id": profile.id, "email": email, "zip_prefix": profile.zip_prefix},
+    )
+
+
+def rider_search_subquery(q: str):
+    """
+    Subquery of profile_id for directory entries whose email or ZIP prefix
+    contains q (case-insensitive). Returns None when q is blank.
+    """
+    q = q.strip().lower()
+    if not q:
+        return None
+
+    if _dialect() == "sqlite" and len(q) >= MIN_TRIGRAM_QUERY:
+        phrase = '"' + q.replace('"', '""') + '"'
+        return (
+            text("SELECT rowid AS profile_id FROM rider_fts WHERE rider_fts MATCH :match")
+            .bindparams(match=phrase)
+            .columns(profile_id=Integer)
+            .subquery("rider_match")
+        )
+
+    # Postgres (trigram GIN indexes), short queries and other databases.
+    # One branch per table, so each can use its own index.
+    like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    by_email = (
+        select(UserProfile.id.label("profile_id"))
+        .join(User, User.id == UserProfile.user_id)
+        .where(func.lower(User.email).like(like, escape="\\"))
+    )
+    by_zip = select(UserProfile.id.label("profile_id")).where(func.lower(UserProfile.zip_prefix).like(like, escape="\\"))
+    return union(by_email, by_zip).subquery("rider_match")
@@ -0,0 +1,73 @@
+# server/app/sqlite_profile.py
+# Engine profile for running on a SQLite file under gunicorn.
+#
+# With stock settings SQLite uses a rollback journal: a writer locks readers
+# out, every commit fsyncs twice, and concurrent workers see "database is
+# locked". On every new connection this profile sets:
+#   journal_mode = WAL        readers and the single writer no longer block each other
+#   synchronous  = NORMAL     fsync at checkpoints, not every commit (safe with WAL;
+#                             a power cut can lose the last commits, not corrupt)
+#   busy_timeout = N ms       wait for the write lock instead of failing at once
+#   mmap_size    = N bytes    read pages through the OS page cache, no copies
+#   cache_size   = -N KiB     bigger per-connection page cache
+#   temp_store   = MEMORY     sorts / temp b-trees stay off disk
+# and keeps a pool of open connections (each keeps its warm cache and mmap)
+# sized for gunicorn's threads. Foreign-key enforcement is left off, as it
+# always was: the schema's FKs (e.g. payment.bike_id) aren't declared with
+# delete rules, and paid listings must stay deletable.
+#
+# SQLITE_TUNING=0 turns it off. Benchmark: python -m server.bench_sqlite
+from sqlalchemy import event
+
+DEFAULTS = {
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024,
+    "SQLITE_CACHE_SIZE_KB": 64 * 1024,
+    "SQLITE_POOL_SIZE": 8,
+    "SQLITE_MAX_OVERFLOW": 8,
+}
+
+
+def is_file_sqlite(uri: str) -> bool:
+    """True for sqlite:///path URIs (in-memory databases have no WAL or shared file)."""
+    return uri.startswith("sqlite") and ":memory:" not in uri and uri.rstrip("/") not in ("sqlite:", "sqlite")
+
+
+def engine_options(settings: dict) -> dict:
+    """create_engine() / SQLALCHEMY_ENGINE_OPTIONS for the profile."""
+    s = {**DEFAULTS, **settings}
+    return {
+        "pool_size": s["SQLITE_POOL_SIZE"],
+        "max_overflow": s["SQLITE_MAX_OVERFLOW"],
+        "pool_pre_ping": False,          # a local file doesn't drop connections
+        "connect_args": {
+            "timeout": s["SQLITE_BUSY_TIMEOUT_MS"] / 1000,
+            "check_same_thread": False,  # pooled connections move between threads
+        },
+    }
+
+
+def pragmas(settings: dict) -> list:
+    s = {**DEFAULTS, **settings}
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={int(s['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(s['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size=-{int(s['SQLITE_CACHE_SIZE_KB'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def install_pragmas(engine, settings: dict):
+    """Run the profile's PRAGMAs on every connection the engine opens."""
+    statements = pragmas(settings)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for stmt in statements:
+                cursor.execute(stmt)
+        finally:
+            cursor.close()
@@ -0,0 +1,113 @@
+# server/app/stripe_client.py
+# Stripe SDK setup and Checkout Session reuse.
+#
+# The SDK is configured once, at startup: the API key, retries, and a shared
+# requests.Session whose urllib3 pool keeps connections to api.stripe.com alive,
+# so a checkout click doesn't pay for a new TCP + TLS handshake.
+#
+# A Checkout Session is reusable until it expires, so "Pay" doesn't need a new
+# one per click. Sessions are created with an explicit expires_at and
+# remembered per (bike, action):
+#   1. in-process cache hit, still comfortably unexpired and not yet paid -> reuse
+#   2. otherwise, the bike's stored session id (stripe_listing_session /
+#      stripe_last_renew_session, so other workers' sessions count too):
+#      retrieve it and reuse it while it is open
+#   3. otherwise create one and store its id on the bike
+# A per-key lock makes a double-click wait for the first request's session
+# instead of creating a second one.
+import threading
+import time
+import zlib
+import requests
+import stripe
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from sqlalchemy import update
+from .cache import MemoryTTLCache
+from .models import db, Bike, Payment
+
+# Don't hand out a session that would expire while the user is filling it in
+REUSE_MARGIN = 5 * 60
+
+SESSION_COLUMNS = {"LISTING": "stripe_listing_session", "RENEW": "stripe_last_renew_session"}
+
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def init_stripe(app):
+    """
+    Configure the SDK for this process (config: STRIPE_SECRET_KEY,
+    STRIPE_HTTP_POOL_SIZE, STRIPE_HTTP_TIMEOUT, STRIPE_MAX_RETRIES) and set up
+    the checkout-session cache.
+    """
+    if app.config.get("STRIPE_SECRET_KEY"):
+        stripe.api_key = app.config["STRIPE_SECRET_KEY"]
+    stripe.max_network_retries = app.config["STRIPE_MAX_RETRIES"]
+
+    http = requests.Session()
+    pool = app.config["STRIPE_HTTP_POOL_SIZE"]
+    http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+    stripe.default_http_client = stripe.RequestsClient(session=http, timeout=app.config["STRIPE_HTTP_TIMEOUT"])
+
+    app.extensions["checkout_sessions"] = MemoryTTLCache(max_entries=4096)
+
+
+def _cache():
+    return current_app.extensions["checkout_sessions"]
+
+
+def _lock_for(key: str):
+    return _locks[zlib.crc32(key.encode()) % len(_locks)]
+
+
+def _paid(session_id: str) -> bool:
+    return db.session.query(Payment.id).filter_by(stripe_session_id=session_id).first() is not None
+
+
+def _reusable(session_id, url, expires_at, now) -> bool:
+    return bool(url) and expires_at - now > REUSE_MARGIN and not _paid(session_id)
+
+
+def _retrieve_open(session_id, now):
+    """(id, url, expires_at) for a stored session that is still open, else None."""
+    try:
+        s = stripe.checkout.Session.retrieve(session_id)
+    except stripe.error.StripeError:
+        return None
+    expires_at = getattr(s, "expires_at", None) or 0
+    if getattr(s, "status", None) != "open" or not _reusable(s.id, s.url, expires_at, now):
+        return None
+    return s.id, s.url, expires_at
+
+
+def checkout_url_for(bike: Bike, action: str, session_ttl: int, **params) -> str:
+    """
+    The checkout URL for paying `action` ("LISTING" or "RENEW") on `bike`,
+    reusing an unexpired session when there is one. `params` are the
+    stripe.checkout.Session.create() arguments. Raises stripe.error.StripeError.
+    """
+    column = SESSION_COLUMNS[action]
+    key = f"checkout:{bike.id}:{action}"
+    with _lock_for(key):
+        now = int(time.time())
+        cached = _cache().get(key)
+        if cached and _reusable(*cached, now):
+            return cached[1]
+
+        found = None
+        stored = getattr(bike, column)
+        if stored and (not cached or cached[0] != stored):
+            found = _retrieve_open(stored, now)
+
+        if found is None:
+            session = stripe.checkout.Session.create(expires_at=now + session_ttl, **params)
+            found = (session.id, session.url, getattr(session, "expires_at", None) or now + session_ttl)
+            # updated_at is pinned: the session id isn't part of the bike's representation
+            db.session.execute(
+                update(Bike).where(Bike.id == bike.id).values({column: found[0], "updated_at": Bike.updated_at}),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+
+        _cache().set(key, found, max(found[2] - now - REUSE_MARGIN, 1))
+        return found[1]
@@ -1,13 +1,24 @@
 # server/app/uploads.py
-from flask import Blueprint, current_app, request, jsonify, send_from_directory
+from flask import Blueprint, Request, current_app, request, jsonify, send_from_directory
 from flask_jwt_extended import jwt_required
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-import os, uuid  # uuid gives us collision-resistant filenames
+import os, re, shutil, hashlib, tempfile
 from mimetypes import guess_type  # best-guess Content-Type based on filename extension
+from sqlalchemy import or_, update
+from .models import db, Bike
+from .cache import invalidate
+from .images import variants_dir, variant_path, pick_width, schedule_variants, verify_image
+
+_DIGEST_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
 
 # Blueprint that owns all "uploads" routes.
 files_bp = Blueprint("files", __name__)
 
+# Uploads never change once written (names are content hashes), so browsers
+# and proxies may keep them for a year without revalidating.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 # Acceptable image file extensions and a size cap (5 MB)
 ALLOWED_EXTS = {"jpg", "jpeg", "png", "webp"}
 MAX_BYTES = 5 * 1024 * 1024  # 5MB
@@ -21,6 +32,121 @@ def _allowed(filename: str) -> bool:
     ext = (filename.rsplit(".", 1)[-1] or "").lower()
     return ext in ALLOWED_EXTS
 
+# Magic numbers for the formats we accept; the extension is never trusted.
+def _sniff_ext(head: bytes):
+    """Return 'png' / 'jpg' / 'webp' from a file's first bytes, else None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+class IngestFile:
+    """
+    Destination for an uploaded file while the multipart body streams in.
+    Werkzeug's parser write()s each chunk here as it arrives; we hash it,
+    count it (aborting with 413 past max_bytes), keep the first bytes for
+    sniffing, and append it to a temp file inside UPLOAD_DIR (same
+    filesystem, so commit() is an atomic rename rather than a copy).
+    The temp file is deleted on close() unless it was committed.
+    """
+    HEAD_BYTES = 16
+
+    def __init__(self, directory: str, max_bytes: int):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self._f = os.fdopen(fd, "w+b")
+        self._sha = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b""
+        self.committed = False
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()  # parsing stops here; nothing else will clean up
+            raise RequestEntityTooLarge(f"File too large (max {self.max_bytes // (1024 * 1024)}MB)")
+        if len(self.head) < self.HEAD_BYTES:
+            self.head += data[: self.HEAD_BYTES - len(self.head)]
+        self._sha.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+    def commit(self, dest: str):
+        """Move the finished upload to dest (or drop it if dest already has these bytes)."""
+        self._f.close()
+        if os.path.exists(dest):
+            os.remove(self.path)   # content-addressed: identical file already stored
+        else:
+            os.replace(self.path, dest)
+        self.committed = True
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read/seek/readline/... for FileStorage and the parser
+        return getattr(self._f, name)
+
+class UploadRequest(Request):
+    """
+    Request class that streams upload_image's file part straight into an
+    IngestFile instead of Werkzeug's default in-memory/spooled buffer.
+    Other endpoints keep the default behaviour.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != "files.upload_image":
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        f = IngestFile(current_app.config["UPLOAD_DIR"], MAX_BYTES)
+        self.__dict__.setdefault("_ingest_files", []).append(f)
+        return f
+
+    def close(self):
+        super().close()
+        # Covers aborted/rejected uploads (client disconnects, validation errors)
+        for f in self.__dict__.get("_ingest_files", ()):
+            f.close()
+
+def _digest_of(stream, chunk_size=64 * 1024) -> str:
+    """sha256 hex of a file-like object, read in chunks; rewinds afterwards."""
+    h = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        h.update(chunk)
+    stream.seek(0)
+    return h.hexdigest()
+
+def upload_in_use(url: str) -> bool:
+    """True if any listing still points at this upload URL."""
+    return Bike.query.filter(
+        or_(Bike.photo1_url == url, Bike.photo2_url == url, Bike.photo3_url == url)
+    ).first() is not None
+
+def remove_upload(filename: str) -> bool:
+    """
+    Delete an original and its variants from UPLOAD_DIR.
+    Returns False if the original was already gone. Raises OSError on failure.
+    """
+    uploads_dir = current_app.config["UPLOAD_DIR"]
+    path = os.path.join(uploads_dir, filename)
+    digest = filename.rsplit(".", 1)[0]
+    shutil.rmtree(variants_dir(uploads_dir, digest), ignore_errors=True)
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    return True
+
 @files_bp.post("/uploads/image")
 @jwt_required()
 def upload_image():
@@ -41,51 +167,95 @@ def upload_image():
     if not f.filename:
         return jsonify({"error": "No selected file"}), 400
 
-    # Quick extension allowlist check before we do anything else
-    if not _allowed(f.filename):
+    # The body was streamed to disk while parsing (UploadRequest/IngestFile):
+    # size was capped and the bytes hashed on the way in. Identify the format
+    # from its magic bytes rather than the client-supplied extension.
+    stream = f.stream
+    if not isinstance(stream, IngestFile) or stream.size == 0:
+        return jsonify({"error": "Empty upload"}), 400
+    ext = _sniff_ext(stream.head)
+    if not ext:
         return jsonify({"error": "Only jpg, jpeg, png, webp allowed"}), 400
+    # Right magic bytes aren't enough: make sure Pillow can actually parse it
+    stream.flush()
+    if not verify_image(stream.path):
+        return jsonify({"error": "Not a valid image"}), 400
 
-    # Soft size check: move pointer to end to measure, then reset.
-    # (Many servers/clients enforce limits earlier, but this protects on save, too.)
-    f.seek(0, os.SEEK_END)
-    size = f.tell()
-    f.seek(0)
-    if size > MAX_BYTES:
-        return jsonify({"error": "File too large (max 5MB)"}), 400
-
-    # Create a unique, safe filename: <uuid>.<ext>
-    ext = f.filename.rsplit(".", 1)[-1].lower()
-    fname = f"{uuid.uuid4().hex}.{ext}"
+    # Content-addressed filename: <sha256>.<ext>. Identical photos map to the
+    # same file, and the variants directory is keyed by the same digest.
+    digest = stream.hexdigest()
+    fname = f"{digest}.{ext}"
+    path = os.path.join(current_app.config["UPLOAD_DIR"], fname)
 
-    # secure_filename strips dangerous characters; join with configured upload dir
-    path = os.path.join(current_app.config["UPLOAD_DIR"], secure_filename(fname))
+    # Atomic rename into place (or discard if these bytes are already stored)
+    stream.commit(path)
 
-    # Persist the file bytes to disk
-    f.save(path)
+    # Downscaled WebP variants are built off the request path (process pool)
+    schedule_variants(current_app._get_current_object(), path, digest)
 
     # Return a stable API URL (same origin) that your frontend can fetch/display
     url = f"/api/uploads/{fname}"
     return jsonify({"url": url}), 201
 
+@files_bp.app_errorhandler(RequestEntityTooLarge)
+def _too_large(e):
+    """JSON 413 for bodies over MAX_CONTENT_LENGTH or files over MAX_BYTES."""
+    return jsonify({"error": "File too large (max 5MB)"}), 413
+
 @files_bp.get("/uploads/<path:filename>")
 def serve_upload(filename):
     """
     Serve a previously uploaded file from UPLOAD_DIR.
     Uses guess_type to set a reasonable Content-Type (e.g., image/jpeg).
+    ?w=<px> returns the smallest WebP variant at least that wide, falling back
+    to the original while variants are still being generated.
     """
+    uploads_dir = current_app.config["UPLOAD_DIR"]
+    digest = secure_filename(filename.rsplit(".", 1)[0])
+    width = pick_width(request.args.get("w", type=int))
+    if width:
+        vpath = variant_path(uploads_dir, digest, width)
+        if os.path.exists(vpath):
+            return _send_upload(os.path.dirname(vpath), os.path.basename(vpath),
+                                etag=f"{digest}-{width}", mimetype="image/webp")
+
     mime, _ = guess_type(filename)
-    return send_from_directory(
-        current_app.config["UPLOAD_DIR"],
-        filename,
-        mimetype=mime
+    resp = _send_upload(uploads_dir, filename, etag=digest, mimetype=mime)
+    if width:
+        # Variant not built yet: the original is only a stand-in for this URL,
+        # so let the client come back for the real variant shortly.
+        resp.cache_control.immutable = False
+        resp.cache_control.max_age = 60
+    return resp
+
+def _send_upload(directory, name, etag, mimetype):
+    """
+    send_from_directory with HTTP caching tuned for content-addressed files:
+    - strong ETag = content digest (no mtime/size guesswork)
+    - Cache-Control: public, max-age=1y, immutable
+    - conditional=True gives If-None-Match -> 304 and Range -> 206 for free
+    """
+    resp = send_from_directory(
+        directory,
+        name,
+        mimetype=mimetype,
+        etag=etag,
+        max_age=IMMUTABLE_MAX_AGE,
+        conditional=True,
     )
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
 
 @files_bp.delete("/uploads/<path:filename>")
 @jwt_required()
 def delete_upload(filename):
     """
-    Delete a file in the uploads directory (auth required).
+    Delete a file (and its variants) in the uploads directory (auth required).
     Idempotent: returns ok/not_found if the file is already gone.
+    Uploads are content-addressed and may be shared by several listings, so a
+    file that a listing still references is kept (status "in_use"); update_bike
+    and delete_bike clean it up once the last reference is gone.
     Includes a simple path traversal guard.
     """
     uploads_dir = current_app.config["UPLOAD_DIR"]
@@ -99,10 +269,57 @@ def delete_upload(filename):
     if not os.path.exists(path):
         return jsonify({"ok": True, "status": "not_found"}), 200
 
+    if upload_in_use(f"/api/uploads/{filename}"):
+        return jsonify({"ok": True, "status": "in_use"}), 200
+
     # Attempt deletion; report OS errors
     try:
-        os.remove(path)
+        remove_upload(filename)
     except OSError as e:
         return jsonify({"error": f"Could not delete: {e}"}), 500
 
     return jsonify({"ok": True, "status": "deleted"}), 200
+
+
+def migrate_legacy_uploads():
+    """
+    One-off: rename pre-content-addressing uploads (<uuid>.<ext>) to
+    <sha256>.<ext>, dropping byte-identical duplicates, and point listings at
+    the new URLs. Safe to re-run. Returns how many files were migrated.
+    """
+    uploads_dir = current_app.config["UPLOAD_DIR"]
+    migrated = 0
+    for name in sorted(os.listdir(uploads_dir)):
+        src = os.path.join(uploads_dir, name)
+        if not os.path.isfile(src) or _DIGEST_NAME.match(name) or not _allowed(name):
+            continue
+        ext = name.rsplit(".", 1)[-1].lower()
+        ext = "jpg" if ext == "jpeg" else ext
+        with open(src, "rb") as fh:
+            digest = _digest_of(fh)
+        new_name = f"{digest}.{ext}"
+        dest = os.path.join(uploads_dir, new_name)
+        if os.path.exists(dest):
+            os.remove(src)          # duplicate content: keep the existing copy
+        else:
+            os.replace(src, dest)
+
+        old_url, new_url = f"/api/uploads/{name}", f"/api/uploads/{new_name}"
+        for col in (Bike.photo1_url, Bike.photo2_url, Bike.photo3_url):
+            db.session.execute(update(Bike).where(col == old_url).values({col: new_url}))
+        db.session.commit()
+        schedule_variants(current_app._get_current_object(), dest, digest)
+        migrated += 1
+
+    if migrated:
+        invalidate("bikes")
+    return migrated
+
+
+if __name__ == "__main__":
+    # run with: python -m server.app.uploads (from repo root, venv active)
+    from . import create_app
+    app = create_app()
+    app.config["IMAGE_WORKERS"] = 0  # build variants inline; the script exits right after
+    with app.app_context():
+        print(f"Migrated {migrate_legacy_uploads()} upload(s) to content-addressed names")
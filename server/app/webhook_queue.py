@@ -0,0 +1,353 @@
+# server/app/webhook_queue.py
+# Persistent queue between the Stripe webhook and the code that applies it.
+#
+# The webhook used to verify, load the bike, write and commit inside Stripe's
+# request timeout. When SQLite writes queued up in the evening, Stripe timed
+# out and retried, which added more writes. Now the request only verifies the
+# signature and INSERTs the raw event into webhook_job (one small write, deduped
+# on event_id), then returns 200.
+#
+# Worker threads claim queued jobs in batches:
+#   UPDATE webhook_job SET status='running', claim_token=?, attempts=attempts+1
+#    WHERE id IN (SELECT id ... WHERE status='queued' ORDER BY id LIMIT ?)
+# so concurrent workers (threads or processes) never get the same job. A batch
+# is applied in one transaction (payments.stage_stripe_event per event, then
+# DELETE of the jobs), so the StripeEvent ledger, payments, bike changes and
+# the queue stay consistent. If anything in a batch fails, it is rolled back
+# and retried one job at a time. A job that fails goes back to the queue with
+# not_before = now + WEBHOOK_RETRY_BACKOFF * 2^(attempts-1) seconds, so a
+# transient error ("database is locked") doesn't burn every attempt in one
+# drain; after WEBHOOK_MAX_ATTEMPTS it is parked as "failed" and logged as an
+# error until an operator requeues it. Jobs left "running" by a crashed worker
+# are reclaimed after WEBHOOK_VISIBILITY_TIMEOUT seconds.
+#
+# Runs three ways:
+#   - WEBHOOK_WORKERS threads per serving process (0 = apply inline, in the
+#     request; started by start_background_workers() in wsgi.py / run.py)
+#   - POST /api/admin/webhook_queue/drain (X-Admin-Token)
+#   - python -m server.app.webhook_queue
+# GET /api/admin/webhook_queue reports depth, lag and parked jobs;
+# POST /api/admin/webhook_queue/requeue sends parked jobs back to the queue.
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from .models import db, WebhookJob
+from .admin import admin_required
+from .cache import invalidate
+
+webhook_queue_bp = Blueprint("webhook_queue", __name__)
+
+QUEUED, RUNNING, FAILED = "queued", "running", "failed"
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_RETRY_BACKOFF = 10       # seconds before the first retry; doubles per attempt
+MAX_RETRY_BACKOFF = 3600
+
+# Per-process counters since startup (the table holds the shared state)
+_counters = {"batches": 0, "processed": 0, "retried": 0, "failed": 0, "last_batch_ms": None}
+_counters_lock = threading.Lock()
+
+
+def _count(**deltas):
+    with _counters_lock:
+        for name, value in deltas.items():
+            if name == "last_batch_ms":
+                _counters[name] = value
+            else:
+                _counters[name] += value
+
+
+def enqueue_stripe_event(event_id: str, payload) -> bool:
+    """
+    Persist a verified event and commit. Returns False if the event id is
+    already queued (a Stripe retry). With WEBHOOK_WORKERS=0 the queue is
+    drained right away, in this request.
+    """
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode("utf-8")
+    values = {"event_id": event_id, "payload": payload, "status": QUEUED, "attempts": 0, "enqueued_at": datetime.utcnow()}
+
+    dialect = db.engine.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(WebhookJob.__table__).values(**values).on_conflict_do_nothing(index_elements=["event_id"])
+        added = bool(db.session.execute(stmt).rowcount)
+        db.session.commit()
+    else:
+        try:
+            db.session.execute(insert(WebhookJob.__table__).values(**values))
+            db.session.commit()
+            added = True
+        except IntegrityError:
+            db.session.rollback()
+            added = False
+
+    _kick()
+    return added
+
+
+def _kick():
+    """Get queued jobs applied: drain now with WEBHOOK_WORKERS=0, else wake this process's workers."""
+    app = current_app._get_current_object()
+    if app.config.get("WEBHOOK_WORKERS", 0) <= 0:
+        return drain()
+    wakeup = app.extensions.get("webhook_wakeup")
+    if wakeup is not None:
+        wakeup.set()
+    return None
+
+
+def claim_batch(limit: int = DEFAULT_BATCH_SIZE, now: datetime | None = None):
+    """
+    Atomically mark up to `limit` jobs as running for this caller and commit.
+    Returns [(id, event_id, payload, attempts), ...] in queue order.
+    """
+    now = now or datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config.get("WEBHOOK_VISIBILITY_TIMEOUT", 60))
+    claimable = or_(
+        (WebhookJob.status == QUEUED) & or_(WebhookJob.not_before == None, WebhookJob.not_before <= now),
+        (WebhookJob.status == RUNNING) & (WebhookJob.claimed_at < stale),
+    )
+    token = uuid.uuid4().hex
+    ids = (
+        select(WebhookJob.id)
+        .where(claimable)
+        .order_by(WebhookJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)   # Postgres; SQLite serializes writers anyway
+    )
+    db.session.execute(
+        # The predicate is repeated so a job another worker claimed meanwhile is skipped
+        update(WebhookJob)
+        .where(WebhookJob.id.in_(ids.scalar_subquery()), claimable)
+        .values(status=RUNNING, claim_token=token, claimed_at=now, attempts=WebhookJob.attempts + 1),
+        execution_options={"synchronize_session": False},
+    )
+    db.session.commit()
+    return db.session.execute(
+        select(WebhookJob.id, WebhookJob.event_id, WebhookJob.payload, WebhookJob.attempts)
+        .where(WebhookJob.claim_token == token)
+        .order_by(WebhookJob.id)
+    ).all()
+
+
+def _delete_jobs(ids):
+    db.session.execute(delete(WebhookJob).where(WebhookJob.id.in_(ids)), execution_options={"synchronize_session": False})
+
+
+def retry_delay(attempts: int, base: float = DEFAULT_RETRY_BACKOFF) -> float:
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    return min(base * 2 ** max(attempts - 1, 0), MAX_RETRY_BACKOFF)
+
+
+def _record_failure(job, error: str):
+    """Send a job back to the queue after a backoff, or park it once it is out of attempts."""
+    max_attempts = current_app.config.get("WEBHOOK_MAX_ATTEMPTS", 5)
+    parked = job.attempts >= max_attempts
+    delay = retry_delay(job.attempts, current_app.config.get("WEBHOOK_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF))
+    db.session.execute(
+        update(WebhookJob)
+        .where(WebhookJob.id == job.id)
+        .values(
+            status=FAILED if parked else QUEUED,
+            not_before=None if parked else datetime.utcnow() + timedelta(seconds=delay),
+            last_error=error[:2000],
+            claim_token=None,
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    db.session.commit()
+    if parked:
+        current_app.logger.error(
+            "webhook job %s (%s) parked as failed after %d attempts; "
+            "POST /api/admin/webhook_queue/requeue retries it", job.id, job.event_id, job.attempts,
+        )
+
+
+def _apply_one(job):
+    """Fallback path: apply a single job in its own transaction. Returns the outcome or None."""
+    from .payments import stage_stripe_event
+    try:
+        outcome = stage_stripe_event(json.loads(job.payload))
+        _delete_jobs([job.id])
+        db.session.commit()
+        return outcome
+    except IntegrityError:
+        # Another delivery of the same checkout got there first
+        db.session.rollback()
+        _delete_jobs([job.id])
+        db.session.commit()
+        return "duplicate"
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("webhook job %s (%s) failed", job.id, job.event_id)
+        _record_failure(job, f"{type(e).__name__}: {e}")
+        return None
+
+
+def process_batch(jobs) -> dict:
+    """
+    Apply claimed jobs. The whole batch commits in one transaction; if that
+    fails, every job is retried in its own transaction so one bad event
+    doesn't hold up the rest. Returns {"processed", "failed", "outcomes"}.
+    """
+    from .payments import stage_stripe_event
+    started = time.perf_counter()
+    outcomes = {}
+    try:
+        for job in jobs:
+            outcomes[job.event_id] = stage_stripe_event(json.loads(job.payload))
+            db.session.flush()   # later events in the batch see this one's ledger/payment rows
+        _delete_jobs([job.id for job in jobs])
+        db.session.commit()
+        retried = 0
+    except Exception:
+        db.session.rollback()
+        current_app.logger.warning("webhook batch of %d failed; retrying one by one", len(jobs))
+        outcomes = {}
+        for job in jobs:
+            outcome = _apply_one(job)
+            if outcome is not None:
+                outcomes[job.event_id] = outcome
+        retried = len(jobs)
+
+    if "applied" in outcomes.values():
+        invalidate("bikes")
+
+    failed = len(jobs) - len(outcomes)
+    _count(batches=1, processed=len(outcomes), retried=retried, failed=failed,
+           last_batch_ms=round((time.perf_counter() - started) * 1000, 2))
+    return {"processed": len(outcomes), "failed": failed, "outcomes": outcomes}
+
+
+def drain(batch_size: int | None = None) -> dict:
+    """Claim and apply batches until nothing claimable is left. Returns totals."""
+    batch_size = batch_size or current_app.config.get("WEBHOOK_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    totals = {"processed": 0, "failed": 0, "batches": 0}
+    while True:
+        jobs = claim_batch(batch_size)
+        if not jobs:
+            break
+        result = process_batch(jobs)
+        totals["processed"] += result["processed"]
+        totals["failed"] += result["failed"]
+        totals["batches"] += 1
+    return totals
+
+
+def requeue_failed(event_ids=None) -> int:
+    """
+    Send parked jobs (all, or those with the given event ids) back to the
+    queue with a fresh set of attempts and commit. Returns how many.
+    """
+    stmt = update(WebhookJob).where(WebhookJob.status == FAILED)
+    if event_ids:
+        stmt = stmt.where(WebhookJob.event_id.in_(event_ids))
+    count = db.session.execute(
+        stmt.values(status=QUEUED, attempts=0, not_before=None, claim_token=None),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def queue_stats(now: datetime | None = None) -> dict:
+    """
+    depth (queued), running and failed job counts, lag_seconds (age of the
+    oldest unfinished job, 0 when empty), the event ids of parked jobs, plus
+    this process's counters.
+    """
+    now = now or datetime.utcnow()
+    counts = dict(db.session.execute(select(WebhookJob.status, func.count()).group_by(WebhookJob.status)).all())
+    oldest = db.session.execute(
+        select(func.min(WebhookJob.enqueued_at)).where(WebhookJob.status.in_((QUEUED, RUNNING)))
+    ).scalar()
+    failed_ids = db.session.execute(
+        select(WebhookJob.event_id).where(WebhookJob.status == FAILED).order_by(WebhookJob.id).limit(100)
+    ).scalars().all()
+    with _counters_lock:
+        local = dict(_counters)
+    return {
+        "depth": counts.get(QUEUED, 0),
+        "running": counts.get(RUNNING, 0),
+        "failed": counts.get(FAILED, 0),
+        "failed_event_ids": failed_ids,
+        "lag_seconds": round(max((now - oldest).total_seconds(), 0.0), 3) if oldest else 0.0,
+        "workers": current_app.config.get("WEBHOOK_WORKERS", 0),
+        "since_start": local,
+    }
+
+
+def start_webhook_workers(app):
+    """
+    Start WEBHOOK_WORKERS daemon threads. Each drains the queue when woken by
+    an enqueue in this process, or every WEBHOOK_POLL_INTERVAL seconds for
+    jobs enqueued by other processes.
+    """
+    count = app.config.get("WEBHOOK_WORKERS", 0)
+    if count <= 0:
+        return []
+
+    stop, wakeup = threading.Event(), threading.Event()
+    interval = app.config.get("WEBHOOK_POLL_INTERVAL", 1.0)
+
+    def _loop():
+        while not stop.is_set():
+            wakeup.wait(interval)
+            wakeup.clear()
+            if stop.is_set():
+                break
+            with app.app_context():
+                try:
+                    drain()
+                except Exception:
+                    app.logger.exception("webhook worker failed")
+                finally:
+                    db.session.remove()
+
+    threads = [threading.Thread(target=_loop, name=f"webhook-worker-{i}", daemon=True) for i in range(count)]
+    for t in threads:
+        t.start()
+    app.extensions["webhook_workers"] = stop   # stop.set() (+ wakeup.set()) ends the loops
+    app.extensions["webhook_wakeup"] = wakeup
+    return threads
+
+
+@webhook_queue_bp.get("/admin/webhook_queue")
+@admin_required
+def webhook_queue_status():
+    """Queue depth, lag and worker counters."""
+    return jsonify(queue_stats())
+
+
+@webhook_queue_bp.post("/admin/webhook_queue/drain")
+@admin_required
+def webhook_queue_drain():
+    """Apply everything queued now (e.g. with WEBHOOK_WORKERS=0 on a cron box)."""
+    return jsonify({"ok": True, **drain()})
+
+
+@webhook_queue_bp.post("/admin/webhook_queue/requeue")
+@admin_required
+def webhook_queue_requeue():
+    """Retry parked jobs: all of them, or {"event_ids": [...]}."""
+    data = request.get_json(silent=True) or {}
+    requeued = requeue_failed(data.get("event_ids"))
+    return jsonify({"ok": True, "requeued": requeued, "drained": _kick()})
+
+
+if __name__ == "__main__":
+    # run with: python -m server.app.webhook_queue (from repo root, venv active)
+    from . import create_app
+    app = create_app()
+    with app.app_context():
+        print(drain())
+        print(queue_stats())
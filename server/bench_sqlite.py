@@ -0,0 +1,136 @@
+# server/bench_sqlite.py
+# Read/write throughput of a SQLite file with stock settings vs. the
+# production profile (app/sqlite_profile.py), under several processes the way
+# gunicorn runs us.
+#
+# run with: python -m server.bench_sqlite [--procs 4] [--threads 2] [--seconds 5] [--write-ratio 0.2]
+# (from repo root, venv active). Each mode gets a fresh database in a temp dir,
+# seeded with listings; every worker thread then loops for --seconds doing the
+# public listing query (reads) or a draft insert / listing update + commit
+# (writes), and counts "database is locked" failures.
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import OperationalError
+from server.app import db
+from server.app.models import Bike, User
+from server.app.sqlite_profile import engine_options, install_pragmas
+
+SEED_BIKES = 5000
+STATES = ("NJ", "NY", "CO", "CA", "PA", "TX")
+
+
+def _engine(path: str, tuned: bool):
+    url = f"sqlite:///{path}"
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options({}))
+    install_pragmas(engine, {})
+    return engine
+
+
+def _seed(path: str, tuned: bool):
+    engine = _engine(path, tuned)
+    db.metadata.create_all(engine, tables=[User.__table__, Bike.__table__])
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "email": "bench@example.com", "password_hash": "x", "created_at": now}])
+        conn.execute(insert(Bike), [
+            {"title": f"Bike {i}", "price_usd": 100 + i % 900, "state": STATES[i % len(STATES)],
+             "owner_id": 1, "is_active": True, "expires_at": now + timedelta(days=20),
+             "created_at": now - timedelta(minutes=i), "updated_at": now}
+            for i in range(SEED_BIKES)
+        ])
+    engine.dispose()
+
+
+def _read(conn, rng):
+    q = select(Bike.id, Bike.title, Bike.price_usd).where(Bike.is_active == True)
+    if rng.random() < 0.5:
+        q = q.where(Bike.state == rng.choice(STATES))
+    conn.execute(q.order_by(Bike.created_at.desc(), Bike.id.desc()).limit(24)).all()
+
+
+def _write(conn, rng):
+    now = datetime.utcnow()
+    if rng.random() < 0.5:
+        conn.execute(insert(Bike).values(title="Draft", owner_id=1, is_active=False, created_at=now, updated_at=now))
+    else:
+        conn.execute(update(Bike).where(Bike.id == rng.randint(1, SEED_BIKES)).values(price_usd=rng.randint(100, 999), updated_at=now))
+    conn.commit()
+
+
+def _worker(path, tuned, threads, seconds, write_ratio, out):
+    engine = _engine(path, tuned)
+    totals = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def _loop(seed):
+        rng = random.Random(seed)
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        while time.monotonic() < deadline:
+            with engine.connect() as conn:
+                try:
+                    if rng.random() < write_ratio:
+                        _write(conn, rng)
+                        counts["writes"] += 1
+                    else:
+                        _read(conn, rng)
+                        counts["reads"] += 1
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    counts["locked"] += 1
+        with lock:
+            for k, v in counts.items():
+                totals[k] += v
+
+    pool = [threading.Thread(target=_loop, args=(os.getpid() * 100 + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    out.put(totals)
+
+
+def run(tuned: bool, procs: int, threads: int, seconds: float, write_ratio: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="gg_bench_") as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed(path, tuned)
+        out = mp.Queue()
+        workers = [mp.Process(target=_worker, args=(path, tuned, threads, seconds, write_ratio, out)) for _ in range(procs)]
+        for w in workers:
+            w.start()
+        results = [out.get() for _ in workers]
+        for w in workers:
+            w.join()
+    totals = {k: sum(r[k] for r in results) for k in ("reads", "writes", "locked")}
+    totals.update(reads_per_s=round(totals["reads"] / seconds), writes_per_s=round(totals["writes"] / seconds))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{args.procs} processes x {args.threads} threads, {args.seconds:g}s, {args.write_ratio:.0%} writes")
+    print(f"{'mode':<8}{'reads/s':>10}{'writes/s':>10}{'locked':>8}")
+    for name, tuned in (("stock", False), ("tuned", True)):
+        r = run(tuned, args.procs, args.threads, args.seconds, args.write_ratio)
+        print(f"{name:<8}{r['reads_per_s']:>10}{r['writes_per_s']:>10}{r['locked']:>8}")
+
+
+if __name__ == "__main__":
+    main()
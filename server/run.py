@@ -1,8 +1,13 @@
 # entry point to app 
-from app import create_app
+import os
+from app import create_app, start_background_workers
 
 app = create_app()
 
 if __name__ == "__main__":
+    # The debug reloader runs this file twice; only the serving child
+    # (WERKZEUG_RUN_MAIN set) runs the background threads.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers(app)
     # Run on port 8000 to match  frontend setup
     app.run(host="0.0.0.0", port=8000, debug=True)
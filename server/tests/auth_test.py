@@ -16,3 +16,133 @@ def test_signup_and_login_flow(client):
 def test_me_requires_auth(client):
     r = client.get("/api/auth/me")
     assert r.status_code == 401
+
+def test_login_upgrades_old_password_hashes(app, client):
+    from werkzeug.security import generate_password_hash
+    from server.app import db
+    from server.app.models import User
+
+    with app.app_context():
+        db.session.add(User(email="old@ex.com", password_hash=generate_password_hash("abc12345", "pbkdf2:sha256:1000")))
+        db.session.commit()
+
+    assert client.post("/api/auth/login", json={"email": "old@ex.com", "password": "nope"}).status_code == 401
+    with app.app_context():
+        assert User.query.filter_by(email="old@ex.com").one().password_hash.startswith("pbkdf2:sha256:1000$")
+
+    assert client.post("/api/auth/login", json={"email": "old@ex.com", "password": "abc12345"}).status_code == 200
+    with app.app_context():
+        assert User.query.filter_by(email="old@ex.com").one().password_hash.startswith("scrypt:32768:8:1$")
+    assert client.post("/api/auth/login", json={"email": "old@ex.com", "password": "abc12345"}).status_code == 200
+
+def test_auth_attempts_are_rate_limited_per_email_and_ip(app, client):
+    from server.app.passwords import TokenBucketLimiter
+
+    client.post("/api/auth/signup", json={"email": "test@ex.com", "password": "abc12345"})
+    app.extensions["auth_limits"] = {"ip": TokenBucketLimiter(4, 60), "email": TokenBucketLimiter(2, 60)}
+
+    bad = {"email": "test@ex.com", "password": "wrong"}
+    assert client.post("/api/auth/login", json=bad).status_code == 401
+    assert client.post("/api/auth/login", json=bad).status_code == 401
+    r = client.post("/api/auth/login", json=bad)
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1
+    # Another email from the same IP still gets in, until the IP runs out
+    assert client.post("/api/auth/signup", json={"email": "new@ex.com", "password": "abc12345"}).status_code == 201
+    assert client.post("/api/auth/login", json={"email": "x@ex.com", "password": "x"}).status_code == 429
+
+def test_saturated_hashing_pool_sheds_load(app, client):
+    from server.app.passwords import PasswordHasher
+
+    busy = PasswordHasher(workers=1, max_pending=0)
+    busy._slots.acquire()   # the only slot is taken
+    app.extensions["password_hasher"] = busy
+    r = client.post("/api/auth/signup", json={"email": "test@ex.com", "password": "abc12345"})
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+
+def test_user_is_cached_and_profile_edits_are_visible(app, client):
+    from flask_jwt_extended import decode_token
+    from sqlalchemy import event
+    from server.app import db
+
+    client.post("/api/auth/signup", json={"email": "test@ex.com", "password": "abc12345"})
+    token = client.post("/api/auth/login", json={"email": "test@ex.com", "password": "abc12345"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    with app.app_context():
+        assert decode_token(token)["email"] == "test@ex.com"
+
+    seen = []
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        assert client.get("/api/auth/me", headers=headers).get_json()["user"]["email"] == "test@ex.com"
+        client.get("/api/profile", headers=headers)            # creates the profile
+        client.get("/api/profile", headers=headers)            # loads it once
+        first = len(seen)
+        assert client.get("/api/auth/me", headers=headers).status_code == 200
+        assert len(seen) == first                               # user served from the cache
+        assert client.get("/api/profile", headers=headers).get_json()["state"] is None
+        assert len(seen) == first + 1                           # profile re-read: other workers see edits
+
+        client.put("/api/profile", json={"state": "nj"}, headers=headers)
+        assert client.get("/api/profile", headers=headers).get_json()["state"] == "NJ"
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+
+def test_refresh_tokens_rotate_and_logout_revokes(app, client):
+    client.post("/api/auth/signup", json={"email": "test@ex.com", "password": "abc12345"})
+    tokens = client.post("/api/auth/login", json={"email": "test@ex.com", "password": "abc12345"}).get_json()
+    bearer = lambda t: {"Authorization": f"Bearer {t}"}
+
+    assert client.post("/api/auth/refresh", headers=bearer(tokens["access_token"])).status_code == 422  # wrong type
+    rotated = client.post("/api/auth/refresh", headers=bearer(tokens["refresh_token"])).get_json()
+    assert rotated["access_token"] and rotated["refresh_token"] != tokens["refresh_token"]
+    assert client.post("/api/auth/refresh", headers=bearer(tokens["refresh_token"])).status_code == 401  # single use
+    assert client.get("/api/auth/me", headers=bearer(rotated["access_token"])).status_code == 200
+
+    r = client.post("/api/auth/logout", json={"refresh_token": rotated["refresh_token"]}, headers=bearer(rotated["access_token"]))
+    assert r.status_code == 200
+    assert client.get("/api/auth/me", headers=bearer(rotated["access_token"])).status_code == 401
+    assert client.post("/api/auth/refresh", headers=bearer(rotated["refresh_token"])).status_code == 401
+    # Tokens issued before the rotation are unaffected
+    assert client.get("/api/auth/me", headers=bearer(tokens["access_token"])).status_code == 200
+
+def test_revocations_reach_other_workers_on_sync(app, client):
+    from flask_jwt_extended import decode_token
+    from server.app.revocation import RevocationList
+
+    client.post("/api/auth/signup", json={"email": "test@ex.com", "password": "abc12345"})
+    token = client.post("/api/auth/login", json={"email": "test@ex.com", "password": "abc12345"}).get_json()["access_token"]
+    with app.app_context():
+        other = RevocationList(sync_interval=3600)   # another gunicorn worker
+        jti = decode_token(token)["jti"]
+        assert not other.is_revoked(jti)
+
+    client.post("/api/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    with app.app_context():
+        assert not other.is_revoked(jti)           # not synced yet: no DB read per check
+        other._next_sync = 0
+        assert other.is_revoked(jti) and len(other) == 1
+
+def test_revocation_sync_sees_rows_with_lower_ids(app):
+    from datetime import datetime, timedelta
+    from server.app import db
+    from server.app.models import RevokedToken
+    from server.app.revocation import RevocationList
+
+    soon = datetime.utcnow() + timedelta(minutes=5)
+    with app.app_context():
+        db.session.add(RevokedToken(id=10, jti="seen", token_type="access", expires_at=soon))
+        db.session.commit()
+        other = RevocationList(sync_interval=3600)   # another worker
+        assert other.is_revoked("seen")
+
+        # A row whose id sorts before ones already seen: a Postgres sequence id
+        # committed late, or a SQLite rowid reused after the max row was pruned
+        db.session.add(RevokedToken(id=5, jti="late", token_type="access", expires_at=soon))
+        db.session.commit()
+        other._next_sync = 0
+        assert other.is_revoked("late") and other.is_revoked("seen")
@@ -14,6 +14,17 @@ def _create_bike(client, headers, **over):
     payload.update(over)
     return client.post("/api/bikes", json=payload, headers=headers)
 
+def _publish(app, bike_id):
+    """Flip a draft to active directly in the DB (stands in for the Stripe webhook)."""
+    from server.app import db
+    from server.app.cache import invalidate
+    from server.app.models import Bike
+    with app.app_context():
+        b = db.session.get(Bike, bike_id)
+        b.is_active = True
+        db.session.commit()
+        invalidate("bikes")
+
 def test_create_bike_requires_auth(client):
     r = client.post("/api/bikes", json={"title": "X"})
     assert r.status_code == 401
@@ -61,6 +72,88 @@ def test_index_filters_by_state_and_visibility(client, owner_headers):
     assert r3.status_code == 200
     # Can't assert visibility w/o direct control; ensure endpoint works.
 
+def test_index_keyset_pagination(app, client, owner_headers):
+    ids = []
+    for i in range(5):
+        bike_id = _create_bike(client, owner_headers, title=f"Bike {i}").get_json()["id"]
+        _publish(app, bike_id)
+        ids.append(bike_id)
+
+    seen = []
+    cursor = None
+    for _ in range(3):
+        url = "/api/bikes?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        r = client.get(url)
+        assert r.status_code == 200
+        data = r.get_json()
+        assert len(data["results"]) <= 2
+        seen.extend(b["id"] for b in data["results"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    # Newest first, every listing exactly once, and the last page has no cursor
+    assert seen == sorted(ids, reverse=True)
+    assert cursor is None
+
+def test_index_returns_card_fields_only(app, client, owner_headers):
+    from sqlalchemy import event
+    from server.app import db
+    bike_id = _create_bike(client, owner_headers, description="Long text " * 50).get_json()["id"]
+    _publish(app, bike_id)
+
+    seen = []
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        card = client.get("/api/bikes").get_json()["results"][0]
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    assert card["id"] == bike_id and card["title"] == "Juliana Roubion S"
+    assert card["owner_email"] == "owner@example.com"   # "listed by" footer
+    assert "description" not in card
+    # The owner comes from the same statement, and only its email
+    listing = [sql for sql in seen if "FROM bike" in sql and "users" in sql]
+    assert len(listing) == 1 and "password_hash" not in listing[0]
+
+    # Detail view still carries the full record
+    full = client.get(f"/api/bikes/{bike_id}").get_json()
+    assert full["description"].startswith("Long text")
+    assert full["owner_email"] == "owner@example.com"
+
+def test_index_facet_filters_and_counts(app, client, owner_headers):
+    specs = [
+        dict(bike_type="MTB", wheel_size="29", condition="Good", price_usd=2000),
+        dict(bike_type="MTB", wheel_size="27.5", condition="Good", price_usd=1500),
+        dict(bike_type="Gravel", wheel_size="700c", condition="Excellent", price_usd=1200),
+        dict(bike_type="Road", wheel_size="700c", condition="Good", price_usd=800,
+             rider_height_min_in=66, rider_height_max_in=70),
+    ]
+    for spec in specs:
+        _publish(app, _create_bike(client, owner_headers, **spec).get_json()["id"])
+
+    data = client.get("/api/bikes?bike_type=MTB,Gravel&condition=Good&facets=1").get_json()
+    assert len(data["results"]) == 2
+    facets = data["facets"]
+    assert facets["total"] == 2
+    # bike_type counts ignore the bike_type selection but honour condition=Good
+    assert {f["value"]: f["count"] for f in facets["bike_type"]} == {"MTB": 2, "Road": 1}
+    # condition counts honour bike_type in (MTB, Gravel) but not condition itself
+    assert {f["value"]: f["count"] for f in facets["condition"]} == {"Good": 2, "Excellent": 1}
+    assert facets["price"] == {"min": 1500, "max": 2000}
+
+    # Ranges: price and rider height (bikes without a height range stay in)
+    assert len(client.get("/api/bikes?min_price=1000&max_price=1600").get_json()["results"]) == 2
+    tall = client.get("/api/bikes?height=72&bike_type=Road").get_json()["results"]
+    assert tall == []
+
+def test_index_rejects_bad_cursor(client):
+    r = client.get("/api/bikes?cursor=not-a-cursor")
+    assert r.status_code == 400
+
 # @freeze_time("2025-11-10 12:00:00")
 # def test_expiry_logic_list(client, owner_headers):
     # Create active bike that expires in 1 day
@@ -0,0 +1,54 @@
+# server/tests/cache_test.py
+import time
+import pytest
+from server.app.cache import CacheBackend, MemoryTTLCache
+
+
+def test_memory_cache_lru_and_ttl():
+    c = MemoryTTLCache(max_entries=2)
+    c.set("a", 1, ttl=60)
+    c.set("b", 2, ttl=60)
+    assert c.get("a") == 1          # touch "a" so "b" is least recently used
+    c.set("c", 3, ttl=60)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+
+    c.set("short", "x", ttl=0.01)
+    time.sleep(0.02)
+    assert c.get("short") is None
+
+
+def test_rides_list_is_cached_and_invalidated(client, auth_headers):
+    stats = lambda: client.get("/api/cache/stats").get_json()
+
+    assert client.get("/api/rides").get_json()["results"] == []
+    assert client.get("/api/rides").get_json()["results"] == []
+    assert stats()["hits"] == 1 and stats()["misses"] == 1
+
+    # Creating a ride bumps the "rides" namespace, so the next read is fresh
+    r = client.post("/api/rides", json={"title": "Dawn patrol", "date": "2030-05-01"}, headers=auth_headers)
+    assert r.status_code == 201
+    rides = client.get("/api/rides").get_json()["results"]
+    assert [x["title"] for x in rides] == ["Dawn patrol"]
+    assert rides[0]["attendee_count"] == 0
+
+    # RSVP invalidates too, so attendee_count is never stale
+    client.post(f"/api/rides/{rides[0]['id']}/rsvp", headers=auth_headers)
+    assert client.get("/api/rides").get_json()["results"][0]["attendee_count"] == 1
+
+
+def test_state_filters_are_cached_separately(client):
+    client.get("/api/bikes?state=NJ")
+    client.get("/api/bikes?state=CO")
+    client.get("/api/bikes?state=NJ")
+    s = client.get("/api/cache/stats").get_json()
+    assert s["misses"] == 2 and s["hits"] == 1
+
+
+def test_incomplete_backend_fails_at_instantiation():
+    class NoDelete(CacheBackend):
+        def get(self, key): return None
+        def set(self, key, value, ttl): pass
+        def incr(self, key): return 1
+
+    with pytest.raises(TypeError):
+        NoDelete()
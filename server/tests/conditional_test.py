@@ -0,0 +1,71 @@
+# server/tests/conditional_test.py
+# ETag / If-None-Match and Last-Modified / If-Modified-Since on the read endpoints.
+
+
+def test_rides_list_revalidates_with_etag(client, auth_headers):
+    r1 = client.get("/api/rides")
+    etag = r1.headers["ETag"]
+    assert r1.status_code == 200 and etag.startswith('W/"')
+
+    r2 = client.get("/api/rides", headers={"If-None-Match": etag})
+    assert r2.status_code == 304 and r2.data == b""
+
+    # A write changes the validator, so the same ETag now gets a full body
+    client.post("/api/rides", json={"title": "Night ride", "date": "2030-06-01"}, headers=auth_headers)
+    r3 = client.get("/api/rides", headers={"If-None-Match": etag})
+    assert r3.status_code == 200 and r3.headers["ETag"] != etag
+
+    # Different filters are different representations
+    assert client.get("/api/rides?state=CO").headers["ETag"] != r3.headers["ETag"]
+
+
+def test_bike_detail_etag_and_last_modified(client, owner_headers):
+    bike_id = client.post("/api/bikes", json={"title": "Liv Pique"}, headers=owner_headers).get_json()["id"]
+
+    r1 = client.get(f"/api/bikes/{bike_id}")
+    assert r1.status_code == 200 and r1.headers.get("Last-Modified")
+    assert client.get(f"/api/bikes/{bike_id}", headers={"If-None-Match": r1.headers["ETag"]}).status_code == 304
+    assert client.get(
+        f"/api/bikes/{bike_id}", headers={"If-Modified-Since": r1.headers["Last-Modified"]}
+    ).status_code == 304
+
+    client.put(f"/api/bikes/{bike_id}", json={"price_usd": 900}, headers=owner_headers)
+    r2 = client.get(f"/api/bikes/{bike_id}", headers={"If-None-Match": r1.headers["ETag"]})
+    assert r2.status_code == 200 and r2.get_json()["price_usd"] == 900
+
+    # Unknown ids still 404 (no validator)
+    assert client.get("/api/bikes/999999").status_code == 404
+
+
+def test_ride_detail_etag_differs_for_owner(client, auth_headers):
+    ride_id = client.post(
+        "/api/rides", json={"title": "Hill repeats", "date": "2030-06-02"}, headers=auth_headers
+    ).get_json()["id"]
+    public = client.get(f"/api/rides/{ride_id}")
+    owner = client.get(f"/api/rides/{ride_id}", headers=auth_headers)
+    assert public.headers["ETag"] != owner.headers["ETag"]
+    assert "attendees" in owner.get_json() and "attendees" not in public.get_json()
+
+
+def test_cached_list_revalidates_without_the_validator_query(app, client, auth_headers):
+    from sqlalchemy import event
+    from server.app import db
+
+    client.post("/api/rides", json={"title": "Night ride", "date": "2030-06-01"}, headers=auth_headers)
+    r1 = client.get("/api/rides")                      # miss: stored with its ETag
+    assert r1.status_code == 200 and "Last-Modified" not in r1.headers   # aggregates can move backwards
+
+    seen = []
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        r2 = client.get("/api/rides", headers={"If-None-Match": r1.headers["ETag"]})
+        r3 = client.get("/api/rides")
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    assert r2.status_code == 304 and r2.headers["ETag"] == r1.headers["ETag"]
+    assert r3.status_code == 200 and r3.headers["ETag"] == r1.headers["ETag"] and r3.data == r1.data
+    assert seen == []                                  # both served from the cache
@@ -61,6 +61,7 @@ def app(tmp_root, monkeypatch):
     os.environ.setdefault("API_BASE_URL", "http://127.0.0.1:8000")
     os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_dummy")
     os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_dummy")
+    os.environ.setdefault("WEBHOOK_WORKERS", "0")  # webhooks apply inline unless a test starts workers
 
     flask_app = create_app()  # build the real app
 
@@ -97,6 +98,18 @@ def app(tmp_root, monkeypatch):
             raising=False,
         )
 
+        def _fake_session_retrieve(session_id, **kwargs):
+            # Sessions stored on a bike from an earlier run are never reusable
+            session = _FakeSession(id=session_id)
+            session.status = "expired"
+            return session
+
+        monkeypatch.setattr(
+            "stripe.checkout.Session.retrieve",
+            staticmethod(_fake_session_retrieve),
+            raising=False,
+        )
+
         def _fake_construct_event(payload, sig_header, secret):
             """
             Replace Stripe's signature verification with a simple JSON decode,
@@ -179,6 +192,34 @@ def auth_headers(auth_header):
     return auth_header
 
 
+# =============================================================================
+# Stripe webhook helpers
+# - Build checkout.session.completed events and POST them to the webhook
+#   (signature verification is stubbed in the app fixture)
+# =============================================================================
+@pytest.fixture()
+def checkout_event():
+    """Factory: checkout_event(event_id, session_id, bike_id, action="LISTING") -> event dict."""
+    def _make(event_id, session_id, bike_id, action="LISTING"):
+        return {
+            "id": event_id,
+            "type": "checkout.session.completed",
+            "data": {"object": {
+                "id": session_id,
+                "amount_total": 300 if action == "RENEW" else 1000,
+                "metadata": {"action": action, "bike_id": str(bike_id)},
+            }},
+        }
+    return _make
+
+@pytest.fixture()
+def deliver_webhook(client):
+    """deliver_webhook(event) POSTs the event to /api/stripe/webhook and returns the response."""
+    def _deliver(event):
+        return client.post("/api/stripe/webhook", data=json.dumps(event), headers={"Stripe-Signature": "t=1,v1=x"})
+    return _deliver
+
+
 # =============================================================================
 # Tiny PNG bytes/file for upload tests (1x1 pixel transparent PNG)
 # =============================================================================
@@ -0,0 +1,64 @@
+# server/tests/expiry_test.py
+from datetime import datetime, timedelta
+from server.app import db
+from server.app.expiry import sweep_expired_listings
+from server.app.models import Bike
+
+
+def _bike(expires_in_days):
+    b = Bike(title="Sweep me", is_active=True,
+             expires_at=datetime.utcnow() + timedelta(days=expires_in_days))
+    db.session.add(b)
+    db.session.commit()
+    return b.id
+
+
+def test_sweeper_deactivates_expired_in_batches(app):
+    with app.app_context():
+        old1, old2, fresh = _bike(-2), _bike(-1), _bike(5)
+
+        stats = sweep_expired_listings(batch_size=1)
+        assert stats["deactivated"] == 2 and stats["batches"] == 2
+        assert stats["duration_ms"] >= 0
+
+        db.session.expire_all()
+        assert not db.session.get(Bike, old1).is_active
+        assert not db.session.get(Bike, old2).is_active
+        assert db.session.get(Bike, fresh).is_active
+
+        # Idempotent: nothing left to do
+        assert sweep_expired_listings()["deactivated"] == 0
+
+
+def test_sweep_endpoint_is_admin_only(app, client):
+    assert client.post("/api/admin/sweep_expired").status_code == 403
+    app.config["ADMIN_TOKEN"] = "t0ken"
+    r = client.post("/api/admin/sweep_expired", headers={"X-Admin-Token": "t0ken"})
+    assert r.status_code == 200 and r.get_json()["deactivated"] == 0
+
+
+def test_swept_listing_stays_distinct_from_a_draft(app, client, owner_headers):
+    draft_id = client.post("/api/bikes", json={"title": "Draft"}, headers=owner_headers).get_json()["id"]
+    expired_id = client.post("/api/bikes", json={"title": "Paid"}, headers=owner_headers).get_json()["id"]
+    with app.app_context():
+        bike = db.session.get(Bike, expired_id)
+        bike.is_active, bike.expires_at = True, datetime.utcnow() - timedelta(days=1)
+        db.session.commit()
+        sweep_expired_listings()
+
+    detail = client.get(f"/api/bikes/{expired_id}", headers=owner_headers).get_json()
+    assert detail["is_active"] is False and detail["expires_at"] is not None
+    assert client.get(f"/api/bikes/{draft_id}", headers=owner_headers).get_json()["expires_at"] is None
+
+    # Already paid once: the $10 posting fee is refused, the $3 renewal isn't
+    r = client.post("/api/payments/checkout/listing", json={"bike_id": expired_id}, headers=owner_headers)
+    assert r.status_code == 400 and "renew" in r.get_json()["error"]
+    r = client.post("/api/payments/checkout/renew", json={"bike_id": expired_id}, headers=owner_headers)
+    assert r.status_code == 200
+    r = client.post("/api/payments/checkout/listing", json={"bike_id": draft_id}, headers=owner_headers)
+    assert r.status_code == 200
+
+
+def test_create_app_starts_no_sweeper_thread(app):
+    # Only the serving entry points call start_background_workers()
+    assert "expiry_sweeper" not in app.extensions
@@ -0,0 +1,134 @@
+# server/tests/geo_test.py
+from datetime import date, timedelta
+from types import SimpleNamespace
+from sqlalchemy import event, literal, select
+from server.app import db
+from server.app.cache import invalidate
+from server.app.geo import zip_table, distance_sq, bounding_box, backfill_coordinates
+from server.app.models import Bike, Ride
+
+
+def _listed(app, client, headers, **fields):
+    fields.setdefault("title", "Liv Embolden")
+    bike_id = client.post("/api/bikes", json=fields, headers=headers).get_json()["id"]
+    with app.app_context():
+        db.session.get(Bike, bike_id).is_active = True
+        db.session.commit()
+        invalidate("bikes")
+    return bike_id
+
+
+def _ride(client, headers, **fields):
+    payload = {"title": "Group ride", "date": (date.today() + timedelta(days=7)).isoformat(), "time": "08:30", "state": "CO", "zip_prefix": "803"}
+    payload.update(fields)
+    return client.post("/api/rides", json=payload, headers=headers).get_json()["id"]
+
+
+def test_zip_table_lookup():
+    table = zip_table()
+    assert len(table) > 40000
+    lat, lon = table.lookup("07030")                   # Hoboken, NJ
+    assert abs(lat - 40.745) < 0.01 and abs(lon + 74.03) < 0.01
+    lat, lon = table.lookup("803")                     # Boulder area prefix -> centroid
+    assert 39.5 < lat < 40.5 and -106 < lon < -104.5
+    assert table.lookup("12") is None                  # too short to place
+    assert table.lookup("abcde") is None
+
+
+def test_distance_and_bounding_box(app):
+    table = zip_table()
+    hoboken, princeton, boulder = table.lookup("07030"), table.lookup("08544"), table.lookup("80302")
+
+    def _dist_sq(point):
+        row = SimpleNamespace(lat=literal(point[0]), lon=literal(point[1]))
+        with app.app_context():
+            return db.session.scalar(select(distance_sq(row, *hoboken)))
+
+    assert _dist_sq(hoboken) == 0
+    assert 40 ** 2 < _dist_sq(princeton) < 50 ** 2
+    assert _dist_sq(princeton) < _dist_sq(boulder)
+    lat_min, lat_max, lon_min, lon_max = bounding_box(*hoboken, 50)
+    assert lat_min < princeton[0] < lat_max and lon_min < princeton[1] < lon_max
+
+
+def test_bikes_near_zip_filters_and_ranks_by_distance(app, client, owner_headers):
+    _listed(app, client, owner_headers, title="Boulder", state="CO", zip="80302")
+    mid = _listed(app, client, owner_headers, title="Princeton", zip="08544")
+    near = _listed(app, client, owner_headers, title="Hoboken", zip="07030")
+
+    r = client.get("/api/bikes?near=07030&radius=10")
+    assert [b["id"] for b in r.get_json()["results"]] == [near]
+
+    r = client.get("/api/bikes?near=07030&radius=60")
+    results = r.get_json()["results"]
+    assert [b["id"] for b in results] == [near, mid]
+    assert results[0]["distance_mi"] == 0 and 40 < results[1]["distance_mi"] < 50
+
+    # Keyset pages over (distance, id)
+    page1 = client.get("/api/bikes?near=07030&radius=60&limit=1").get_json()
+    page2 = client.get(f"/api/bikes?near=07030&radius=60&limit=1&cursor={page1['next_cursor']}").get_json()
+    assert [b["id"] for b in page1["results"] + page2["results"]] == [near, mid]
+    assert page2["next_cursor"] is None
+
+    facets = client.get("/api/bikes?near=07030&radius=60&facets=1").get_json()["facets"]
+    assert facets["total"] == 2
+
+    assert client.get("/api/bikes?near=00000").status_code == 400
+
+
+def test_bike_zip_edit_moves_listing(app, client, owner_headers):
+    bike_id = _listed(app, client, owner_headers, zip="80302")
+    assert client.get("/api/bikes?near=07030").get_json()["results"] == []
+    client.put(f"/api/bikes/{bike_id}", json={"zip": "07030"}, headers=owner_headers)
+    assert [b["id"] for b in client.get("/api/bikes?near=07030").get_json()["results"]] == [bike_id]
+
+
+def test_rides_and_riders_near_zip(client, auth_headers):
+    _ride(client, auth_headers, title="Boulder loop")
+    _ride(client, auth_headers, title="Palisades", state="NJ", zip_prefix="070")
+
+    rides = client.get("/api/rides?near=07030&radius=30").get_json()["results"]
+    assert [r["title"] for r in rides] == ["Palisades"]
+    assert "distance_mi" in rides[0]
+
+    client.put("/api/profile", json={"state": "NJ", "zip_prefix": "07030"}, headers=auth_headers)
+    riders = client.get("/api/riders?near=07302&radius=5", headers=auth_headers).get_json()
+    assert riders["total"] == 1 and riders["results"][0]["distance_mi"] < 5
+    riders = client.get("/api/riders?near=80302&radius=5", headers=auth_headers).get_json()
+    assert riders["total"] == 0
+
+
+def test_near_query_uses_geo_index(app, client):
+    seen = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if "bike.lat BETWEEN" in statement:
+            seen.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        client.get("/api/bikes?near=07030&radius=25")
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+
+    assert seen
+    # Nearest-first paging happens in SQL, not over every candidate in Python
+    assert any("ORDER BY dist_sq, bike.id" in sql and "LIMIT" in sql for sql, _ in seen)
+    with app.app_context(), db.engine.connect() as conn:
+        for sql, params in seen:
+            plan = " | ".join(r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params))
+            assert "ix_bike_active_geo" in plan
+
+
+def test_backfill_fills_missing_coordinates(app, client, owner_headers, auth_headers):
+    bike_id = _listed(app, client, owner_headers, zip="07030")
+    ride_id = _ride(client, auth_headers)
+    with app.app_context():
+        db.session.query(Bike).update({"lat": None, "lon": None})
+        db.session.query(Ride).update({"lat": None, "lon": None})
+        db.session.commit()
+        assert backfill_coordinates(db.session) == 2
+        assert db.session.get(Bike, bike_id).lat is not None
+        assert db.session.get(Ride, ride_id).lat is not None
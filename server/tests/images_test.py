@@ -0,0 +1,152 @@
+# server/tests/images_test.py
+import io
+import os
+from PIL import Image
+from server.app.images import pick_width, schedule_variants, variant_path
+
+
+def _png(w=2000, h=1000, color=(200, 30, 90)):
+    buf = io.BytesIO()
+    Image.new("RGB", (w, h), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _upload(client, headers, data, name="photo.png"):
+    return client.post("/api/uploads/image", headers=headers,
+                       data={"file": (io.BytesIO(data), name, "image/png")},
+                       content_type="multipart/form-data")
+
+
+def test_pick_width():
+    assert pick_width(None) is None
+    assert pick_width(100) == 320
+    assert pick_width(700) == 768
+    assert pick_width(5000) == 1600
+
+
+def test_upload_builds_webp_variants(app, client, auth_headers):
+    app.config["IMAGE_WORKERS"] = 0  # build inline so the test is deterministic
+    r = _upload(client, auth_headers, _png())
+    assert r.status_code == 201
+    url = r.get_json()["url"]
+
+    small = client.get(url + "?w=300")
+    assert small.mimetype == "image/webp"
+    assert Image.open(io.BytesIO(small.data)).size == (320, 160)
+
+    # No ?w= -> the original
+    orig = client.get(url)
+    assert orig.mimetype == "image/png"
+    assert Image.open(io.BytesIO(orig.data)).size == (2000, 1000)
+
+
+def test_variants_in_process_pool(app, tmp_root):
+    src = os.path.join(tmp_root, "src.png")
+    with open(src, "wb") as f:
+        f.write(_png(900, 900))
+    app.config["IMAGE_WORKERS"] = 1
+    try:
+        written = schedule_variants(app, src, "abc123").result(timeout=60)
+    finally:
+        app.extensions.pop("image_pool").shutdown()
+    assert written == [320, 768, 1600]
+    # Never upscaled: the 1600 slot holds a 900px image
+    with Image.open(variant_path(app.config["UPLOAD_DIR"], "abc123", 1600)) as im:
+        assert im.size == (900, 900)
+
+
+def test_identical_uploads_share_a_file_until_unreferenced(app, client, auth_headers):
+    app.config["IMAGE_WORKERS"] = 0
+    data = _png(400, 300)
+    url1 = _upload(client, auth_headers, data).get_json()["url"]
+    url2 = _upload(client, auth_headers, data, name="copy.png").get_json()["url"]
+    assert url1 == url2
+
+    bike = client.post("/api/bikes", json={"title": "Pics", "photos": [url1]}, headers=auth_headers).get_json()
+    fname = url1.rsplit("/", 1)[-1]
+    r = client.delete(f"/api/uploads/{fname}", headers=auth_headers)
+    assert r.get_json()["status"] == "in_use"
+    assert client.get(url1).status_code == 200
+
+    # Deleting the last listing that uses it removes the file
+    client.delete(f"/api/bikes/{bike['id']}", headers=auth_headers)
+    assert not os.path.exists(os.path.join(app.config["UPLOAD_DIR"], fname))
+
+
+def test_uploads_are_immutable_with_strong_etag_and_ranges(app, client, auth_headers):
+    app.config["IMAGE_WORKERS"] = 0
+    url = _upload(client, auth_headers, _png(640, 480)).get_json()["url"]
+    digest = url.rsplit("/", 1)[-1].split(".")[0]
+
+    r = client.get(url)
+    cc = r.headers["Cache-Control"]
+    assert "immutable" in cc and "max-age=31536000" in cc and "public" in cc
+    assert r.headers["ETag"] == f'"{digest}"'
+    assert client.get(url, headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+    part = client.get(url, headers={"Range": "bytes=0-7"})
+    assert part.status_code == 206 and part.data == b"\x89PNG\r\n\x1a\n"
+
+    v = client.get(url + "?w=320")
+    assert v.headers["ETag"] == f'"{digest}-320"' and "immutable" in v.headers["Cache-Control"]
+
+
+def test_migrate_legacy_uploads(app, client, auth_headers):
+    from server.app.uploads import migrate_legacy_uploads
+    app.config["IMAGE_WORKERS"] = 0
+    data = _png(50, 50)
+    for legacy in ("a" * 32 + ".png", "b" * 32 + ".png"):  # same bytes, two old names
+        with open(os.path.join(app.config["UPLOAD_DIR"], legacy), "wb") as f:
+            f.write(data)
+    bike = client.post("/api/bikes", json={"title": "Old", "photos": ["/api/uploads/" + "b" * 32 + ".png"]},
+                       headers=auth_headers).get_json()
+
+    with app.app_context():
+        assert migrate_legacy_uploads() == 2
+    photos = client.get(f"/api/bikes/{bike['id']}").get_json()["photos"]
+    assert len(photos) == 1 and photos[0] != bike["photos"][0]
+    assert client.get(photos[0]).status_code == 200
+    files = [n for n in os.listdir(app.config["UPLOAD_DIR"]) if n.endswith(".png")]
+    assert len(files) == 1
+
+
+def _leftover_parts(app):
+    return [n for n in os.listdir(app.config["UPLOAD_DIR"]) if n.endswith(".part")]
+
+
+def test_upload_sniffs_magic_bytes_not_extension(app, client, auth_headers):
+    app.config["IMAGE_WORKERS"] = 0
+    # PNG bytes with a .jpg name are stored as .png
+    r = _upload(client, auth_headers, _png(40, 40), name="mislabelled.jpg")
+    assert r.status_code == 201 and r.get_json()["url"].endswith(".png")
+
+    # Non-image bytes with an image name are rejected and leave nothing behind
+    r2 = _upload(client, auth_headers, b"#!/bin/sh\necho hi\n", name="evil.png")
+    assert r2.status_code == 400
+    assert _leftover_parts(app) == []
+
+    # Valid magic bytes on a body Pillow can't parse are rejected too
+    r3 = _upload(client, auth_headers, b"\x89PNG\r\n\x1a\n" + b"0" * 64, name="fake.png")
+    assert r3.status_code == 400 and r3.get_json()["error"] == "Not a valid image"
+    assert _leftover_parts(app) == []
+
+
+def test_inline_variant_failure_is_logged(app, caplog):
+    app.config["IMAGE_WORKERS"] = 0
+    src = os.path.join(app.config["UPLOAD_DIR"], "broken.png")
+    with open(src, "wb") as fh:
+        fh.write(b"\x89PNG\r\n\x1a\n" + b"0" * 64)
+    assert schedule_variants(app, src, "broken") is None
+    assert "variant generation for broken failed" in caplog.text
+
+
+def test_oversized_uploads_rejected_early(app, client, auth_headers):
+    from server.app.uploads import MAX_BYTES
+    # Over MAX_CONTENT_LENGTH: refused from the header, body never parsed
+    r = _upload(client, auth_headers, b"\x89PNG\r\n\x1a\n" + b"0" * (MAX_BYTES + 100 * 1024))
+    assert r.status_code == 413 and "too large" in r.get_json()["error"]
+
+    # Under the body limit but over the per-file cap: aborted mid-stream
+    r2 = _upload(client, auth_headers, b"\x89PNG\r\n\x1a\n" + b"0" * (MAX_BYTES + 10))
+    assert r2.status_code == 413
+    assert _leftover_parts(app) == []
@@ -0,0 +1,117 @@
+# server/tests/index_test.py
+# Runs the hot read endpoints, captures the SQL they emit, and asks SQLite for
+# the plan of each statement. If someone changes a query shape (or drops an
+# index) so that it falls back to a full table scan, these tests fail.
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text
+from server.app import db
+from server.app.schema import upgrade_schema
+
+
+@contextmanager
+def _captured_selects(app):
+    """Collect (sql, params) for every SELECT issued while the block runs."""
+    seen = []
+
+    def _listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            seen.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _listener)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", _listener)
+
+
+def _plans(app, statements, table):
+    """EXPLAIN QUERY PLAN each captured statement touching `table`."""
+    out = []
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for sql, params in statements:
+                if f"FROM {table}" not in sql:
+                    continue
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+                out.append(" | ".join(r[-1] for r in rows))
+    return out
+
+
+def test_indexes_exist(app):
+    with app.app_context():
+        names = {r[0] for r in db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index'")
+        )}
+    for expected in (
+        "ix_bike_active_created",
+        "ix_bike_active_state_created",
+        "ix_bike_owner_created",
+        "ix_bike_active_expires",
+        "ix_bike_active_geo",
+        "ix_ride_date_start",
+        "ix_ride_state_date_start",
+        "ix_ride_geo",
+        "ix_user_profile_state_level",
+        "ix_user_profile_geo",
+        "ix_users_created_at",
+    ):
+        assert expected in names
+
+
+def test_bike_listing_plans_use_indexes(app, client, owner_headers):
+    with _captured_selects(app) as seen:
+        client.get("/api/bikes")
+    assert any("ix_bike_active_created" in p for p in _plans(app, seen, "bike"))
+
+    with _captured_selects(app) as seen:
+        client.get("/api/bikes?state=CO")
+    assert any("ix_bike_active_state_created" in p for p in _plans(app, seen, "bike"))
+
+    with _captured_selects(app) as seen:
+        client.get("/api/bikes/mine", headers=owner_headers)
+    assert any("ix_bike_owner_created" in p for p in _plans(app, seen, "bike"))
+
+
+def test_ride_and_directory_plans_use_indexes(app, client, auth_headers):
+    with _captured_selects(app) as seen:
+        client.get("/api/rides?state=CO")
+    assert any("ix_ride_state_date_start" in p for p in _plans(app, seen, "ride"))
+
+    with _captured_selects(app) as seen:
+        client.get("/api/riders?state=NJ&level=Beginner", headers=auth_headers)
+    assert any("ix_user_profile_state_level" in p for p in _plans(app, seen, "user_profile"))
+
+
+def test_upgrade_schema_adds_columns_and_indexes(app, tmp_root):
+    # A "legacy" ride table from before updated_at and the ride indexes existed
+    engine = create_engine(f"sqlite:///{tmp_root}/legacy.db")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE ride (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, "
+            "date DATE NOT NULL, time VARCHAR(10), difficulty VARCHAR(50), terrain VARCHAR(100), "
+            "zip_prefix VARCHAR(3), state VARCHAR(2), description TEXT, owner_id INTEGER, created_at DATETIME)"
+        )
+        conn.exec_driver_sql("CREATE INDEX ix_ride_date_time ON ride (date, time, id)")   # since replaced
+    with app.app_context():
+        changed = upgrade_schema(engine)
+    assert "ride.updated_at" in changed and "ix_ride_state_date_start" in changed
+    assert "ix_ride_date_time" in changed
+    assert "updated_at" in {c["name"] for c in inspect(engine).get_columns("ride")}
+    assert "ix_ride_date_time" not in {ix["name"] for ix in inspect(engine).get_indexes("ride")}
+
+    # Second run is a no-op
+    with app.app_context():
+        assert upgrade_schema(engine) == []
+
+
+def test_sqlite_connections_use_production_pragmas(app):
+    with app.app_context(), db.engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1          # NORMAL
+        assert pragma("foreign_keys") == 0         # off, as before the profile
+        assert pragma("busy_timeout") == app.config["SQLITE_BUSY_TIMEOUT_MS"]
+        assert pragma("cache_size") == -app.config["SQLITE_CACHE_SIZE_KB"]
+        assert db.engine.pool.size() == app.config["SQLITE_POOL_SIZE"]
@@ -0,0 +1,69 @@
+# server/tests/notifications_test.py
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+
+def _expiring_bike(app, owner_email, days=3.5):
+    from server.app import db
+    from server.app.models import Bike, User
+    with app.app_context():
+        owner = User.query.filter_by(email=owner_email).first()
+        b = Bike(title="Expiring", owner_id=owner.id, is_active=True,
+                 expires_at=datetime.utcnow() + timedelta(days=days))
+        db.session.add(b)
+        db.session.commit()
+        return b.id
+
+
+def _outbox(app):
+    path = app.config["MAIL_OUTBOX_PATH"]
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_renewal_endpoint_requires_admin_token(client):
+    assert client.post("/api/admin/send_renewal_emails").status_code == 403
+
+
+def test_renewal_reminders_batch_once(app, client, owner_headers, tmp_root):
+    app.config.update(ADMIN_TOKEN="t0ken", MAIL_TRANSPORT="file",
+                      MAIL_OUTBOX_PATH=os.path.join(tmp_root, "outbox.jsonl"))
+    for _ in range(5):
+        _expiring_bike(app, "owner@example.com")
+    _expiring_bike(app, "owner@example.com", days=10)  # outside the window
+
+    from server.app import db
+    with app.app_context():
+        engine = db.engine
+    selects = []
+    listener = lambda conn, cur, stmt, *a: selects.append(stmt) if stmt.lstrip().startswith("SELECT") else None
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        r = client.post("/api/admin/send_renewal_emails", headers={"X-Admin-Token": "t0ken"})
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert r.status_code == 200 and r.get_json()["notified"] == 5
+    assert len(selects) == 1  # one joined query, no per-bike owner lookups
+    mails = _outbox(app)
+    assert len(mails) == 5 and {m["to"] for m in mails} == {"owner@example.com"}
+
+    # Rerun: sent markers prevent duplicates
+    r2 = client.post("/api/admin/send_renewal_emails", headers={"X-Admin-Token": "t0ken"})
+    assert r2.get_json()["notified"] == 0
+    assert len(_outbox(app)) == 5
+
+
+def test_transport_without_send_fails_at_instantiation():
+    import pytest
+    from server.app.notifications import MailTransport
+
+    class Silent(MailTransport):
+        pass
+
+    with pytest.raises(TypeError):
+        Silent()
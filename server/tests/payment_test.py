@@ -1,5 +1,4 @@
 # server/tests/test_payments.py
-import json
 
 def test_start_listing_checkout_makes_session(client, owner_headers, monkeypatch):
     # Create draft bike
@@ -10,6 +9,7 @@ def test_start_listing_checkout_makes_session(client, owner_headers, monkeypatch
     # Mock stripe.checkout.Session.create
     called = {}
     class FakeSession:
+        id = "cs_fake_listing"
         url = "https://checkout.stripe.fake/session"
     def fake_create(**kwargs):
         called["kwargs"] = kwargs
@@ -24,3 +24,108 @@ def test_start_listing_checkout_makes_session(client, owner_headers, monkeypatch
     assert "kwargs" in called
     assert called["kwargs"]["mode"] == "payment"
 
+
+def test_checkout_reuses_open_session_per_bike_and_action(app, client, owner_headers, monkeypatch):
+    import time
+    from server.app import db
+    from server.app.models import Bike, Payment
+
+    created = []
+    class FakeSession:
+        def __init__(self, n, expires_at):
+            self.id, self.url, self.expires_at = f"cs_{n}", f"https://checkout.stripe.fake/{n}", expires_at
+    def fake_create(**kwargs):
+        created.append(kwargs)
+        return FakeSession(len(created), kwargs["expires_at"])
+    monkeypatch.setattr("app.payments.stripe.checkout.Session.create", fake_create)
+
+    bike_id = client.post("/api/bikes", json={"title": "Draft"}, headers=owner_headers).get_json()["id"]
+    with app.app_context():
+        etag_before = db.session.get(Bike, bike_id).updated_at
+
+    def pay(kind):
+        r = client.post(f"/api/payments/checkout/{kind}", json={"bike_id": bike_id}, headers=owner_headers)
+        assert r.status_code == 200, r.get_json()
+        return r.get_json()["checkout_url"]
+
+    # Double click: one session
+    assert pay("listing") == pay("listing") == "https://checkout.stripe.fake/1"
+    assert len(created) == 1 and created[0]["expires_at"] >= int(time.time()) + 1700
+    # Renewal is a different action, so a different session
+    assert pay("renew") == pay("renew") == "https://checkout.stripe.fake/2"
+    with app.app_context():
+        bike = db.session.get(Bike, bike_id)
+        assert (bike.stripe_listing_session, bike.stripe_last_renew_session) == ("cs_1", "cs_2")
+        assert bike.updated_at == etag_before
+
+        # Once the renewal is paid its session is spent
+        db.session.add(Payment(kind="renewal", bike_id=bike_id, owner_id=bike.owner_id,
+                               stripe_session_id="cs_2", amount_cents=300))
+        db.session.commit()
+    assert pay("renew") == "https://checkout.stripe.fake/3"
+
+    # Another worker (empty in-process cache) picks up the stored, still open session
+    from server.app.cache import MemoryTTLCache
+    app.extensions["checkout_sessions"] = MemoryTTLCache()
+    def fake_retrieve(session_id, **kwargs):
+        session = FakeSession(session_id[3:], int(time.time()) + 1500)
+        session.status = "open"
+        return session
+    monkeypatch.setattr("app.payments.stripe.checkout.Session.retrieve", fake_retrieve)
+    assert pay("renew") == "https://checkout.stripe.fake/3"
+    assert len(created) == 3
+
+
+def test_webhook_is_idempotent_and_records_payments(app, client, owner_headers, checkout_event, deliver_webhook):
+    from datetime import timedelta
+    from server.app import db
+    from server.app.models import Bike, Payment, StripeEvent, WebhookJob
+
+    bike_id = client.post("/api/bikes", json={"title": "Draft"}, headers=owner_headers).get_json()["id"]
+
+    listing = checkout_event("evt_1", "cs_list", bike_id, "LISTING")
+    r = deliver_webhook(listing)
+    assert r.status_code == 200 and r.get_json()["queued"] is True
+    deliver_webhook(listing)   # Stripe retry
+
+    renew = checkout_event("evt_2", "cs_renew", bike_id, "RENEW")
+    with app.app_context():
+        first_expiry = db.session.get(Bike, bike_id).expires_at
+    deliver_webhook(renew)
+    deliver_webhook(renew)
+    # Same session under a new event id (e.g. a replay from the dashboard)
+    deliver_webhook({**renew, "id": "evt_3"})
+
+    with app.app_context():
+        bike = db.session.get(Bike, bike_id)
+        assert bike.is_active
+        assert bike.expires_at - first_expiry == timedelta(days=20)   # extended once
+        payments = Payment.query.order_by(Payment.id).all()
+        assert [(p.kind, p.stripe_session_id, p.amount_cents) for p in payments] == [
+            ("listing", "cs_list", 1000), ("renewal", "cs_renew", 300),
+        ]
+        assert {e.id: e.outcome for e in StripeEvent.query} == {
+            "evt_1": "applied", "evt_2": "applied", "evt_3": "duplicate",
+        }
+        assert WebhookJob.query.count() == 0   # applied jobs leave the queue
+
+def test_webhook_ignores_other_events_once(app, deliver_webhook):
+    from server.app.models import StripeEvent
+
+    r = deliver_webhook({"id": "evt_x", "type": "payment_intent.created", "data": {"object": {}}})
+    assert r.status_code == 200
+    deliver_webhook({"id": "evt_x", "type": "payment_intent.created"})
+    with app.app_context():
+        assert StripeEvent.query.count() == 1
+        assert StripeEvent.query.get("evt_x").outcome == "ignored"
+
+def test_owner_can_delete_a_paid_listing(app, client, owner_headers, checkout_event, deliver_webhook):
+    from server.app.models import Payment
+
+    bike_id = client.post("/api/bikes", json={"title": "Draft"}, headers=owner_headers).get_json()["id"]
+    deliver_webhook(checkout_event("evt_del", "cs_del", bike_id, "LISTING"))
+
+    r = client.delete(f"/api/bikes/{bike_id}", headers=owner_headers)
+    assert r.status_code == 200, r.get_json()
+    with app.app_context():
+        assert Payment.query.filter_by(stripe_session_id="cs_del").count() == 1   # the payment record stays
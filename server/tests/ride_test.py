@@ -1,8 +1,13 @@
 # server/tests/test_rides.py
+from datetime import date, timedelta
+
+def _in_days(n):
+    return (date.today() + timedelta(days=n)).isoformat()
+
 def _create_ride(client, headers, **over):
     payload = {
         "title": "Saturday Tempo Ride",
-        "date": "2025-11-20",
+        "date": _in_days(30),
         "time": "08:30",
         "difficulty": "Intermediate",
         "terrain": "Singletrack",
@@ -25,7 +30,7 @@ def test_create_list_and_rsvp(client, auth_headers):
     # List
     r2 = client.get("/api/rides?state=CO")
     assert r2.status_code == 200
-    assert isinstance(r2.get_json(), list)
+    assert [r["id"] for r in r2.get_json()["results"]] == [ride_id]
 
     # RSVP toggle
     #r3 = client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers)
@@ -33,3 +38,214 @@ def test_create_list_and_rsvp(client, auth_headers):
     # Toggle again (un-RSVP)
     #r4 = client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers)
     #assert r4.status_code == 200
+
+def test_attendee_count_is_kept_without_loading_attendees(app, client, auth_headers, other_headers):
+    from sqlalchemy import event
+    from server.app import db
+
+    ride_id = _create_ride(client, auth_headers).get_json()["id"]
+    assert client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers).status_code == 201
+    assert client.post(f"/api/rides/{ride_id}/rsvp", headers=other_headers).status_code == 201
+    assert client.post(f"/api/rides/{ride_id}/rsvp", headers=other_headers).status_code == 200
+
+    seen = []
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        rides = client.get("/api/rides").get_json()["results"]
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    assert rides[0]["attendee_count"] == 1
+    assert not any("FROM ride_attendee" in s or "JOIN ride_attendee" in s for s in seen)
+
+    # Only the owner's detail view hydrates the attendee list
+    detail = client.get(f"/api/rides/{ride_id}", headers=auth_headers).get_json()
+    assert [a["email"] for a in detail["attendees"]] == ["t@e.st"]
+    assert "attendees" not in client.get(f"/api/rides/{ride_id}").get_json()
+
+def test_sync_attendee_counts_backfills_missing(app, client, auth_headers):
+    from server.app import db
+    from server.app.models import Ride
+
+    ride_id = _create_ride(client, auth_headers).get_json()["id"]
+    client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers)
+    with app.app_context():
+        db.session.query(Ride).update({"attendee_count": None})
+        db.session.commit()
+        assert Ride.sync_attendee_counts() == 1
+        assert db.session.get(Ride, ride_id).attendee_count == 1
+
+def test_rides_window_and_keyset_pages(app, client, auth_headers):
+    from server.app import db
+    from server.app.models import Ride
+
+    # A past ride (inserted directly; the API only ever gets "now" as input)
+    past_id = _create_ride(client, auth_headers, title="Last season").get_json()["id"]
+    with app.app_context():
+        db.session.get(Ride, past_id).date = date.today() - timedelta(days=3)
+        db.session.commit()
+    late = _create_ride(client, auth_headers, date=_in_days(2), time="6:15 pm").get_json()
+    early = _create_ride(client, auth_headers, date=_in_days(2), time="7am").get_json()
+    untimed = _create_ride(client, auth_headers, date=_in_days(2), time="").get_json()
+    later = _create_ride(client, auth_headers, date=_in_days(9)).get_json()
+    assert late["time"] == "18:15" and early["time"] == "07:00"
+
+    # Upcoming only by default, ordered by (date, start_time, id); no time sorts first
+    expected = [untimed["id"], early["id"], late["id"], later["id"]]
+    r = client.get("/api/rides").get_json()
+    assert [x["id"] for x in r["results"]] == expected and r["next_cursor"] is None
+
+    seen, cursor = [], None
+    while True:
+        page = client.get("/api/rides?limit=3" + (f"&cursor={cursor}" if cursor else "")).get_json()
+        seen += [x["id"] for x in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == expected
+
+    window = client.get(f"/api/rides?from={_in_days(-7)}&to={_in_days(2)}").get_json()["results"]
+    assert [x["id"] for x in window] == [past_id] + expected[:3]
+
+    assert client.get("/api/rides?from=someday").status_code == 400
+    assert client.get("/api/rides?cursor=bogus").status_code == 400
+
+def test_sync_start_times_parses_legacy_text(app, client, auth_headers):
+    from datetime import time
+    from server.app import db
+    from server.app.models import Ride
+
+    ride_id = _create_ride(client, auth_headers).get_json()["id"]
+    with app.app_context():
+        db.session.query(Ride).update({"time": "5:45pm", "start_time": None})
+        db.session.commit()
+        assert Ride.sync_start_times() == 1
+        assert db.session.get(Ride, ride_id).start_time == time(17, 45)
+
+def test_concurrent_rsvp_toggles_stay_consistent(app, client, auth_headers):
+    import threading
+    from server.app import db
+    from server.app.models import Ride, RideAttendee
+
+    ride_id = _create_ride(client, auth_headers).get_json()["id"]
+
+    # Six riders; each has two threads toggling it at once, so both the
+    # "same user twice" race and cross-user counter updates are exercised
+    headers = []
+    for i in range(6):
+        c = app.test_client()
+        c.post("/api/auth/signup", json={"email": f"r{i}@e.st", "password": "pw123456"})
+        token = c.post("/api/auth/login", json={"email": f"r{i}@e.st", "password": "pw123456"}).get_json()["access_token"]
+        headers.append({"Authorization": f"Bearer {token}"})
+
+    toggles_per_thread = 5
+    codes = {i: [] for i in range(len(headers))}
+    start = threading.Barrier(len(headers) * 2)
+
+    def _hammer(i):
+        c = app.test_client()
+        start.wait()
+        for _ in range(toggles_per_thread):
+            codes[i].append(c.post(f"/api/rides/{ride_id}/rsvp", headers=headers[i]).status_code)
+
+    threads = [threading.Thread(target=_hammer, args=(i,)) for i in range(len(headers)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        attending = {a.user_id for a in RideAttendee.query.filter_by(ride_id=ride_id)}
+        count = db.session.get(Ride, ride_id).attendee_count
+
+    for i, got in codes.items():
+        assert len(got) == 2 * toggles_per_thread
+        assert set(got) <= {200, 201, 409}
+        # adds minus removes is the final state for that rider (0 or 1)
+        assert got.count(201) - got.count(200) in (0, 1)
+    assert count == len(attending) == sum(got.count(201) - got.count(200) for got in codes.values())
+
+def _rider_headers(app, n, prefix="w"):
+    out = []
+    for i in range(n):
+        c = app.test_client()
+        c.post("/api/auth/signup", json={"email": f"{prefix}{i}@e.st", "password": "pw123456"})
+        token = c.post("/api/auth/login", json={"email": f"{prefix}{i}@e.st", "password": "pw123456"}).get_json()["access_token"]
+        out.append({"Authorization": f"Bearer {token}"})
+    return out
+
+def test_capacity_waitlist_and_fifo_promotion(app, client, auth_headers):
+    ride = _create_ride(client, auth_headers, capacity=2).get_json()
+    assert ride["capacity"] == 2 and ride["seats_left"] == 2
+    riders = _rider_headers(app, 4)
+
+    statuses = [client.post(f"/api/rides/{ride['id']}/rsvp", headers=h).get_json()["status"] for h in riders]
+    assert statuses == ["added", "added", "waitlisted", "waitlisted"]
+    r = client.get(f"/api/rides/{ride['id']}").get_json()
+    assert (r["attendee_count"], r["waitlist_count"], r["seats_left"]) == (2, 2, 0)
+
+    # A seated rider leaves: the oldest waitlisted RSVP (w2) takes the seat
+    left = client.post(f"/api/rides/{ride['id']}/rsvp", headers=riders[0]).get_json()
+    assert left["status"] == "removed" and "promoted_user_id" in left
+    owner_view = client.get(f"/api/rides/{ride['id']}", headers=auth_headers).get_json()
+    assert [a["email"] for a in owner_view["attendees"]] == ["w1@e.st", "w2@e.st"]
+    assert [a["email"] for a in owner_view["waitlist"]] == ["w3@e.st"]
+
+    # Leaving the waitlist frees no seat
+    client.post(f"/api/rides/{ride['id']}/rsvp", headers=riders[3])
+    r = client.get(f"/api/rides/{ride['id']}").get_json()
+    assert (r["attendee_count"], r["waitlist_count"]) == (2, 0)
+
+    assert _create_ride(client, auth_headers, capacity=0).status_code == 400
+
+def test_concurrent_joins_never_overbook(app, client, auth_headers):
+    import threading
+    from server.app import db
+    from server.app.models import Ride, RideAttendee
+
+    ride_id = _create_ride(client, auth_headers, capacity=3).get_json()["id"]
+    riders = _rider_headers(app, 10, prefix="c")
+    start = threading.Barrier(len(riders))
+    codes = []
+
+    def _join(h):
+        c = app.test_client()
+        start.wait()
+        codes.append(c.post(f"/api/rides/{ride_id}/rsvp", headers=h).status_code)
+
+    threads = [threading.Thread(target=_join, args=(h,)) for h in riders]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        rows = RideAttendee.query.filter_by(ride_id=ride_id).order_by(RideAttendee.id).all()
+        ride = db.session.get(Ride, ride_id)
+        going = [a for a in rows if a.status == RideAttendee.GOING]
+        waiting = [a for a in rows if a.status == RideAttendee.WAITLISTED]
+        assert codes == [201] * 10
+        assert (ride.attendee_count, ride.waitlist_count) == (3, 7)
+        assert len(going) == 3 and len(waiting) == 7
+
+def test_rsvp_retries_a_deadlock(app, client, auth_headers, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from server.app import rsvp
+
+    ride_id = _create_ride(client, auth_headers).get_json()["id"]
+    deadlock = type("DeadlockDetected", (Exception,), {"pgcode": "40P01"})
+    real_delete, calls = rsvp._delete_attendee, []
+
+    def _delete_once_deadlocked(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OperationalError("DELETE", {}, deadlock())
+        return real_delete(*args)
+
+    monkeypatch.setattr(rsvp, "_delete_attendee", _delete_once_deadlocked)
+    r = client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers)
+    assert r.status_code == 201 and r.get_json()["status"] == "added"
+    assert len(calls) == 2
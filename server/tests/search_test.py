@@ -0,0 +1,112 @@
+# server/tests/search_test.py
+from sqlalchemy import text
+from server.app import db
+from server.app.cache import invalidate
+from server.app.models import Bike
+
+
+def _listed(app, client, headers, **fields):
+    bike_id = client.post("/api/bikes", json=fields, headers=headers).get_json()["id"]
+    with app.app_context():
+        db.session.get(Bike, bike_id).is_active = True
+        db.session.commit()
+        invalidate("bikes")
+    return bike_id
+
+
+def _search(client, q, **extra):
+    args = "&".join(f"{k}={v}" for k, v in extra.items())
+    return client.get(f"/api/bikes?q={q}" + (f"&{args}" if args else "")).get_json()
+
+
+def test_search_matches_components_and_ranks_by_relevance(app, client, owner_headers):
+    in_desc = _listed(app, client, owner_headers, title="Trail bike", description="Upgraded to Shimano brakes last year")
+    in_title = _listed(app, client, owner_headers, title="Shimano XT build", brand="Yeti")
+    in_parts = _listed(app, client, owner_headers, title="Gravel", drivetrain_rear="SRAM Rival", brakes_model="Shimano GRX")
+    _listed(app, client, owner_headers, title="Unrelated", description="Nothing to see")
+
+    ids = [b["id"] for b in _search(client, "shimano")["results"]]
+    assert set(ids) == {in_desc, in_title, in_parts}
+    assert ids[0] == in_title          # title hits outrank description hits
+    assert ids[-1] == in_desc
+
+    # Prefix match and multi-word AND
+    assert [b["id"] for b in _search(client, "shim%20grx")["results"]] == [in_parts]
+    # FTS syntax in user input is neutralised, not a 500
+    assert _search(client, '"OR(*')["results"] == []
+
+
+def test_search_index_follows_updates_and_deletes(app, client, owner_headers):
+    bike_id = _listed(app, client, owner_headers, title="Santa Cruz Hightower")
+    assert [b["id"] for b in _search(client, "hightower")["results"]] == [bike_id]
+
+    client.put(f"/api/bikes/{bike_id}", json={"title": "Santa Cruz Megatower"}, headers=owner_headers)
+    assert _search(client, "hightower")["results"] == []
+    assert [b["id"] for b in _search(client, "megatower")["results"]] == [bike_id]
+
+    client.delete(f"/api/bikes/{bike_id}", headers=owner_headers)
+    assert _search(client, "megatower")["results"] == []
+    with app.app_context():
+        assert db.session.execute(text("SELECT count(*) FROM bike_fts")).scalar() == 0
+
+
+def test_search_results_paginate(app, client, owner_headers):
+    ids = {_listed(app, client, owner_headers, title=f"Ibis Ripmo {i}") for i in range(5)}
+    seen, cursor = [], None
+    while True:
+        page = _search(client, "ripmo", limit=2, **({"cursor": cursor} if cursor else {}))
+        seen += [b["id"] for b in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids) and len(seen) == 5
+
+
+def _rider(client, email, **profile):
+    client.post("/api/auth/signup", json={"email": email, "password": "pw123456"})
+    token = client.post("/api/auth/login", json={"email": email, "password": "pw123456"}).get_json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.put("/api/profile", json=profile, headers=headers)
+    return headers
+
+
+def test_rider_directory_search_uses_trigram_index(app, client):
+    from sqlalchemy import event
+
+    viewer = _rider(client, "viewer@e.st", zip_prefix="80302")
+    _rider(client, "alice_w@trails.org", zip_prefix="07030")
+    _rider(client, "bob@trails.org", zip_prefix="07302")
+    _rider(client, "carol@road.net", zip_prefix="803")
+
+    def emails(q, **extra):
+        args = "".join(f"&{k}={v}" for k, v in extra.items())
+        body = client.get(f"/api/riders?q={q}{args}", headers=viewer).get_json()
+        return body["total"], sorted(r["email"] for r in body["results"])
+
+    assert emails("TRAILS") == (2, ["alice_w@trails.org", "bob@trails.org"])
+    assert emails("ice_") == (1, ["alice_w@trails.org"])          # "_" is literal, not a wildcard
+    assert emails("0730") == (1, ["bob@trails.org"])              # ZIP prefix substring
+    assert emails("80") == (2, ["carol@road.net", "viewer@e.st"]) # too short for trigrams: LIKE
+    assert emails("trails", limit=1)[0] == 2                      # total covers every page
+    assert emails("trails", limit=1, offset=5) == (2, [])
+
+    # Edits are reindexed
+    client.put("/api/profile", json={"zip_prefix": "07030"}, headers=viewer)
+    assert emails("07030") == (2, ["alice_w@trails.org", "viewer@e.st"])
+
+    # One statement for page + total, answered from rider_fts
+    seen = []
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if "user_profile" in statement:
+            seen.append((statement, parameters))
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        client.get("/api/riders?q=trails", headers=viewer)
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    assert len(seen) == 1 and "count(*) OVER ()" in seen[0][0]
+    with app.app_context(), db.engine.connect() as conn:
+        plan = " | ".join(r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + seen[0][0], seen[0][1]))
+    assert "rider_fts VIRTUAL TABLE INDEX" in plan and "SCAN user_profile" not in plan
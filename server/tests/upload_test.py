@@ -25,7 +25,7 @@ def test_create_list_and_rsvp(client, auth_headers):
     # List
     r2 = client.get("/api/rides?state=CO")
     assert r2.status_code == 200
-    assert isinstance(r2.get_json(), list)
+    assert isinstance(r2.get_json()["results"], list)
 
     # RSVP toggle
     #r3 = client.post(f"/api/rides/{ride_id}/rsvp", headers=auth_headers)
@@ -0,0 +1,114 @@
+# server/tests/webhook_queue_test.py
+import json
+import time
+from datetime import datetime, timedelta
+from server.app import db
+from server.app.models import Bike, Payment, StripeEvent, WebhookJob
+from server.app.webhook_queue import claim_batch, drain, enqueue_stripe_event, start_webhook_workers
+
+
+def _draft(client, headers, title="Draft"):
+    return client.post("/api/bikes", json={"title": title}, headers=headers).get_json()["id"]
+
+
+def test_worker_threads_apply_queued_webhooks(app, client, owner_headers, checkout_event, deliver_webhook):
+    bike_id = _draft(client, owner_headers)
+    app.config.update(WEBHOOK_WORKERS=2, WEBHOOK_POLL_INTERVAL=0.05)
+    start_webhook_workers(app)
+    try:
+        r = deliver_webhook(checkout_event("evt_w1", "cs_w1", bike_id))
+        assert r.status_code == 200 and r.get_json() == {"ok": True, "queued": True}
+
+        deadline = time.monotonic() + 5
+        with app.app_context():
+            while time.monotonic() < deadline and WebhookJob.query.count():
+                db.session.remove()
+                time.sleep(0.05)
+            assert WebhookJob.query.count() == 0
+            assert db.session.get(Bike, bike_id).is_active
+            assert db.session.get(StripeEvent, "evt_w1").outcome == "applied"
+    finally:
+        app.extensions["webhook_workers"].set()
+        app.extensions["webhook_wakeup"].set()
+
+
+def test_batch_applies_events_and_parks_a_bad_one(app, client, owner_headers, checkout_event):
+    bikes = [_draft(client, owner_headers, f"Bike {i}") for i in range(3)]
+    app.config.update(WEBHOOK_WORKERS=1, WEBHOOK_MAX_ATTEMPTS=1, ADMIN_TOKEN="t0ken")   # no threads: stays queued
+    with app.app_context():
+        for i, bike_id in enumerate(bikes):
+            assert enqueue_stripe_event(f"evt_b{i}", json.dumps(checkout_event(f"evt_b{i}", f"cs_b{i}", bike_id)))
+        assert not enqueue_stripe_event("evt_b0", "{}")          # Stripe retry while queued
+        enqueue_stripe_event("evt_bad", "not json")
+
+    stats = client.get("/api/admin/webhook_queue", headers={"X-Admin-Token": "t0ken"}).get_json()
+    assert stats["depth"] == 4 and stats["lag_seconds"] >= 0
+
+    with app.app_context():
+        assert drain() == {"processed": 3, "failed": 1, "batches": 1}
+        assert all(db.session.get(Bike, b).is_active for b in bikes)
+        assert Payment.query.count() == 3
+        bad = WebhookJob.query.one()
+        assert bad.event_id == "evt_bad" and bad.status == "failed" and "JSONDecodeError" in bad.last_error
+
+    stats = client.get("/api/admin/webhook_queue", headers={"X-Admin-Token": "t0ken"}).get_json()
+    assert (stats["depth"], stats["failed"], stats["lag_seconds"]) == (0, 1, 0.0)
+    assert client.get("/api/admin/webhook_queue").status_code == 403
+
+
+def test_stale_claims_are_reclaimed(app, client, owner_headers, checkout_event):
+    bike_id = _draft(client, owner_headers)
+    app.config["WEBHOOK_WORKERS"] = 1
+    with app.app_context():
+        enqueue_stripe_event("evt_s", json.dumps(checkout_event("evt_s", "cs_s", bike_id)))
+        assert len(claim_batch(10)) == 1
+        assert claim_batch(10) == []                    # held by the first claim
+        later = datetime.utcnow() + timedelta(seconds=app.config["WEBHOOK_VISIBILITY_TIMEOUT"] + 1)
+        (job,) = claim_batch(10, now=later)             # that worker died; take it over
+        assert job.event_id == "evt_s" and job.attempts == 2
+
+
+def test_create_app_starts_no_worker_threads(app, monkeypatch):
+    from server.app import create_app
+    monkeypatch.setenv("WEBHOOK_WORKERS", "2")
+    # Only the serving entry points call start_background_workers()
+    assert "webhook_workers" not in create_app().extensions
+
+
+def test_failed_job_backs_off_and_parked_jobs_can_be_requeued(app, client, owner_headers, checkout_event, monkeypatch):
+    from sqlalchemy import update
+    from sqlalchemy.exc import OperationalError
+    import server.app.payments as payments
+
+    bike_id = _draft(client, owner_headers)
+    app.config.update(WEBHOOK_WORKERS=1, WEBHOOK_MAX_ATTEMPTS=2, ADMIN_TOKEN="t0ken")
+    real_stage, locked = payments.stage_stripe_event, [True]
+    def flaky_stage(event):
+        if locked[0]:
+            raise OperationalError("UPDATE bike", {}, Exception("database is locked"))
+        return real_stage(event)
+    monkeypatch.setattr(payments, "stage_stripe_event", flaky_stage)
+
+    with app.app_context():
+        enqueue_stripe_event("evt_r", json.dumps(checkout_event("evt_r", "cs_r", bike_id)))
+        assert drain() == {"processed": 0, "failed": 1, "batches": 1}
+        job = WebhookJob.query.one()
+        assert (job.status, job.attempts) == ("queued", 1) and job.not_before > datetime.utcnow()
+        assert drain()["batches"] == 0                  # backing off, not retried in the same drain
+
+        db.session.execute(update(WebhookJob).values(not_before=datetime.utcnow()))   # backoff elapsed
+        db.session.commit()
+        drain()
+        db.session.expire_all()
+        assert WebhookJob.query.one().status == "failed"   # out of attempts: parked
+
+    stats = client.get("/api/admin/webhook_queue", headers={"X-Admin-Token": "t0ken"}).get_json()
+    assert stats["failed"] == 1 and stats["failed_event_ids"] == ["evt_r"]
+
+    locked[0] = False
+    r = client.post("/api/admin/webhook_queue/requeue", json={"event_ids": ["evt_r"]}, headers={"X-Admin-Token": "t0ken"})
+    assert r.status_code == 200 and r.get_json()["requeued"] == 1
+    with app.app_context():
+        assert drain()["processed"] == 1
+        assert WebhookJob.query.count() == 0
+        assert db.session.get(Bike, bike_id).is_active
@@ -1,3 +1,4 @@
-from app import create_app
+from app import create_app, start_background_workers
 
 app = create_app()
+start_background_workers(app)